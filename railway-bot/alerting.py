@@ -0,0 +1,168 @@
+"""
+Server-side alert evaluation
+Thresholds with hysteresis, EWMA z-score anomalies and sustained-duration conditions, O(1) per sample
+"""
+import math
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from datetime import datetime, timezone
+
+# kind: 'fire' or 'resolve'; name: condition name ('ram', 'cpu_anomaly', ...)
+AlertEvent = namedtuple('AlertEvent', 'kind name metric value threshold timestamp detail')
+
+
+def timestamp_seconds(timestamp):
+    """Normalized 'YYYY-MM-DDTHH:MM:SS' (UTC) -> epoch seconds"""
+    return datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp()
+
+
+class Condition(ABC):
+    """Raw per-sample test plus sustained-duration state machine.
+
+    A condition fires once its raw test has held for `sustain` seconds of sample
+    time and resolves once the clear test has held as long; a single spike never
+    pages and a value hovering at the threshold doesn't flap. A gap longer than
+    `max_gap` between samples restarts the pending period.
+    """
+
+    def __init__(self, name, metric, sustain, max_gap=600):
+        self.name = name
+        self.metric = metric
+        self.sustain = sustain
+        self.max_gap = max_gap
+        self.firing = False
+        self._pending_since = None
+        self._last = None
+
+    @abstractmethod
+    def test(self, value):
+        """(raw condition now, clear condition now, level compared against, detail)"""
+
+    def update(self, seconds, value, timestamp):
+        """Feed one sample, AlertEvent on state change else None"""
+        active, clear, level, detail = self.test(value)
+        if self._last is not None and seconds - self._last > self.max_gap:
+            self._pending_since = None
+        self._last = seconds
+
+        # Waiting for the opposite state to hold long enough
+        changing = clear if self.firing else active
+        if not changing:
+            self._pending_since = None
+            return None
+        if self._pending_since is None:
+            self._pending_since = seconds
+        if seconds - self._pending_since < self.sustain:
+            return None
+        self.firing = not self.firing
+        self._pending_since = None
+        return AlertEvent('fire' if self.firing else 'resolve', self.name, self.metric,
+                          value, level, timestamp, detail)
+
+
+class ThresholdCondition(Condition):
+    """value > threshold fires, value < threshold - hysteresis clears"""
+
+    def __init__(self, name, metric, threshold, hysteresis, sustain):
+        super().__init__(name, metric, sustain)
+        self.threshold = threshold
+        self.clear_below = threshold - hysteresis
+
+    def test(self, value):
+        return value > self.threshold, value < self.clear_below, self.threshold, None
+
+
+class AnomalyCondition(Condition):
+    """Upward deviation from an exponentially weighted mean / variance.
+
+    z = (value - mean) / std with std floored at `min_std` (flat series don't
+    turn noise into anomalies). Fires above `z_limit`, clears below half of
+    it; no verdict before `warmup` samples. Anomalous samples move only the
+    mean, not the variance: a spike barely shifts the baseline, a lasting
+    level shift still fires and then slowly becomes the new normal.
+    """
+
+    def __init__(self, name, metric, alpha, z_limit, min_std, warmup, sustain):
+        super().__init__(name, metric, sustain)
+        self.alpha = alpha
+        self.z_limit = z_limit
+        self.min_std = min_std
+        self.warmup = warmup
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+
+    def test(self, value):
+        std = max(math.sqrt(self.var), self.min_std)
+        z = (value - self.mean) / std
+        ready = self.count >= self.warmup
+        level = self.mean + self.z_limit * std
+        detail = {'mean': round(self.mean, 2), 'z': round(z, 1)}
+
+        anomalous = ready and z > self.z_limit
+
+        # EWMA mean / variance update after scoring the sample against the past
+        self.count += 1
+        if self.count == 1:
+            self.mean = float(value)
+        else:
+            diff = value - self.mean
+            increment = self.alpha * diff
+            self.mean += increment
+            if not anomalous:
+                self.var = (1 - self.alpha) * (self.var + diff * increment)
+        return anomalous, not ready or z < self.z_limit / 2, level, detail
+
+
+class AlertEvaluator:
+    """All conditions of one router; samples older than the last one seen are skipped"""
+
+    def __init__(self, conditions):
+        self.conditions = conditions
+        self._last_seconds = None
+
+    def observe(self, timestamp, values):
+        """Evaluate one stored sample ({metric: value}), list of AlertEvents"""
+        seconds = timestamp_seconds(timestamp)
+        if self._last_seconds is not None and seconds <= self._last_seconds:
+            # Backfilled into the past: already decided on newer data
+            return []
+        self._last_seconds = seconds
+        events = []
+        for condition in self.conditions:
+            value = values.get(condition.metric)
+            if value is None:
+                continue
+            event = condition.update(seconds, value, timestamp)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def active(self):
+        return [condition.name for condition in self.conditions if condition.firing]
+
+
+def sample_values(data):
+    """Router JSON sample -> {metric: number} for the conditions"""
+    openclash = data.get('openclash', {}).get('status')
+    return {
+        'ram_percent': data.get('ram', {}).get('percent'),
+        'cpu_load1': data.get('cpu', {}).get('load1'),
+        'openclash_memory': data.get('openclash', {}).get('memory'),
+        'openclash_down': None if openclash in (None, 'unknown') else int(openclash == 'stopped'),
+    }
+
+
+def router_evaluator(ram_threshold, cpu_threshold, settings):
+    """Default condition set for a router; `settings` is a dict of ALERT_* values"""
+    sustain = settings['sustain']
+    anomaly = dict(alpha=settings['ewma_alpha'], z_limit=settings['zscore'],
+                   warmup=settings['warmup'], sustain=sustain)
+    return AlertEvaluator([
+        ThresholdCondition('ram', 'ram_percent', ram_threshold, settings['ram_hysteresis'], sustain),
+        ThresholdCondition('cpu', 'cpu_load1', cpu_threshold, settings['cpu_hysteresis'], sustain),
+        ThresholdCondition('openclash', 'openclash_down', 0.5, 0, sustain),
+        AnomalyCondition('ram_anomaly', 'ram_percent', min_std=1.0, **anomaly),
+        AnomalyCondition('cpu_anomaly', 'cpu_load1', min_std=0.2, **anomaly),
+        AnomalyCondition('openclash_memory_anomaly', 'openclash_memory', min_std=5.0, **anomaly),
+    ])
@@ -2,15 +2,29 @@
 OpenWRTrouter Bot - Main Application
 Railway Flask App with Telegram Bot Integration
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify
 import logging
-import sys
+import time
+import heapq
 from datetime import datetime, timezone, timedelta
-import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 # Import configuration
 import config
+import telemetry
+from log_setup import AsyncLogging, LogSampler, parse_sample_rates
+from telegram_client import TelegramClient, TelegramError
+from notifications import NotificationScheduler
+from callback_router import CallbackRouter
+from render_cache import RenderCache
+from devices import DeviceRegistry, load_device_config
+from routers import load_routers, normalize_timestamp
+from alerting import router_evaluator, sample_values, timestamp_seconds
+from state import BotState
+from scheduler import Scheduler
+from charts import ChartCache, render_line_chart, time_ticks
+from github_client import BuildTracker, GitHubClient
 
 # Moscow timezone (UTC+3)
 MOSCOW_TZ = timezone(timedelta(hours=3))
@@ -28,97 +42,242 @@ def format_moscow_time(dt, fmt='%d.%m.%Y %H:%M'):
     moscow_dt = to_moscow_time(dt)
     return moscow_dt.strftime(fmt)
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    stream=sys.stdout
+# Per-route log sampling (LOG_SAMPLE_RATES), decided once per request in before_request
+log_sampler = LogSampler(parse_sample_rates(config.LOG_SAMPLE_RATES))
+
+def request_log_kept():
+    return g.get('log_kept', True) if has_request_context() else True
+
+# Setup logging: request threads only enqueue records, a listener thread
+# formats, redacts and writes them
+async_logging = AsyncLogging(
+    level=getattr(logging, config.LOG_LEVEL, logging.INFO),
+    sample_decision=request_log_kept if log_sampler.rates else None,
+    secrets=(config.TELEGRAM_BOT_TOKEN, config.WEBHOOK_SECRET, config.GITHUB_TOKEN,
+             config.TELEGRAM_CHAT_ID),
+    queue_size=config.LOG_QUEUE_SIZE
 )
+async_logging.start()
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
 
-# Telegram Bot API URL
-TELEGRAM_API = f"https://api.telegram.org/bot{config.TELEGRAM_BOT_TOKEN}"
+# Telemetry exported on /metrics (OpenMetrics): request / Telegram latency, queue depths, router gauges
+telemetry_registry = telemetry.Registry()
+http_request_duration = telemetry_registry.histogram(
+    'bot_http_request_duration_seconds', 'Request handling time by route', ('route', 'method', 'status'))
+telegram_call_duration = telemetry_registry.histogram(
+    'bot_telegram_call_duration_seconds', 'Telegram Bot API call time', ('method',))
+telegram_call_failures = telemetry_registry.counter(
+    'bot_telegram_call_failures', 'Failed Telegram Bot API calls', ('method', 'reason'))
 
-def send_telegram_message(text, parse_mode='HTML', reply_markup=None):
-    """Send message to Telegram chat"""
-    try:
-        payload = {
-            'chat_id': config.TELEGRAM_CHAT_ID,
-            'text': text,
-            'parse_mode': parse_mode
-        }
-        if reply_markup:
-            payload['reply_markup'] = reply_markup
-        
-        response = requests.post(f"{TELEGRAM_API}/sendMessage", json=payload, timeout=10)
-        if response.status_code == 200:
-            logger.info(f"Telegram message sent successfully")
-            return True
-        else:
-            logger.error(f"Failed to send Telegram message: HTTP {response.status_code}, {response.text}")
-            return False
-    except Exception as e:
-        logger.error(f"Error sending Telegram message: {e}", exc_info=True)
-        return False
+def observe_telegram_call(method, seconds, error):
+    telegram_call_duration.observe(seconds, method=method)
+    if error is not None:
+        reason = str(error.status_code) if isinstance(error, TelegramError) else type(error).__name__
+        telegram_call_failures.inc(method=method, reason=reason)
+
+# Telegram Bot API client (pooled keep-alive session + background send queue)
+telegram = TelegramClient(
+    config.TELEGRAM_BOT_TOKEN,
+    api_url=config.TELEGRAM_API_URL,
+    pool_size=config.TELEGRAM_POOL_SIZE,
+    workers=config.TELEGRAM_SEND_WORKERS,
+    timeout=config.TELEGRAM_TIMEOUT,
+    observer=observe_telegram_call
+)
+
+# Alert notifications: bursts per device/alert type are merged into one digest,
+# 429 retry_after is honored and undelivered messages survive restarts
+notifier = NotificationScheduler(
+    telegram,
+    config.TELEGRAM_CHAT_ID,
+    window=config.NOTIFY_COALESCE_SECONDS,
+    rate=config.NOTIFY_RATE_PER_SEC,
+    burst=config.NOTIFY_BURST,
+    queue_path=config.NOTIFY_QUEUE_FILE,
+    max_attempts=config.NOTIFY_MAX_ATTEMPTS
+)
+
+def send_telegram_message(text, parse_mode='HTML', reply_markup=None, chat_id=None):
+    """Queue message to Telegram chat (sent in background)"""
+    payload = {
+        'chat_id': chat_id or config.TELEGRAM_CHAT_ID,
+        'text': text,
+        'parse_mode': parse_mode
+    }
+    if reply_markup:
+        payload['reply_markup'] = reply_markup
+    
+    return telegram.submit('sendMessage', payload)
 
 def edit_telegram_message(chat_id, message_id, text, parse_mode='HTML', reply_markup=None):
-    """Edit existing Telegram message"""
-    try:
-        payload = {
-            'chat_id': chat_id,
-            'message_id': message_id,
-            'text': text,
-            'parse_mode': parse_mode
-        }
-        if reply_markup:
-            payload['reply_markup'] = reply_markup
-        
-        response = requests.post(f"{TELEGRAM_API}/editMessageText", json=payload, timeout=10)
-        if response.status_code == 200:
-            logger.info(f"Message edited successfully: {message_id}")
-            return True
-        else:
-            logger.error(f"Failed to edit message: HTTP {response.status_code}, {response.text}")
-            return False
-    except Exception as e:
-        logger.error(f"Error editing Telegram message: {e}", exc_info=True)
-        return False
-
-# In-memory storage for metrics (last 24 hours)
-metrics_history = {
-    'timestamps': [],
-    'ram_percent': [],
-    'cpu_load1': [],
-    'clients': [],
-    'openclash_memory': [],
-    'alerts': []
-}
+    """Queue edit of existing Telegram message (sent in background)"""
+    payload = {
+        'chat_id': chat_id,
+        'message_id': message_id,
+        'text': text,
+        'parse_mode': parse_mode
+    }
+    if reply_markup:
+        payload['reply_markup'] = reply_markup
+    
+    # Message content changes: cached view state no longer applies
+    render_cache.forget(chat_id, message_id)
+    return telegram.submit('editMessageText', payload)
+
+def answer_callback_query(callback_id, text=None, show_alert=False):
+    """Queue answer to callback query (removes loading state on button)"""
+    payload = {'callback_query_id': callback_id}
+    if text:
+        payload['text'] = text
+        payload['show_alert'] = show_alert
+    
+    return telegram.submit('answerCallbackQuery', payload)
+
+# Routers: each has its own webhook token, chat, thresholds and in-memory metrics (last 24 hours)
+routers = load_routers(
+    config.ROUTERS_FILE,
+    config.ROUTERS_JSON,
+    default={
+        'id': config.ROUTER_ID,
+        'name': config.ROUTER_NAME,
+        'token': config.WEBHOOK_SECRET,
+        'chat_id': config.TELEGRAM_CHAT_ID,
+        'ram_threshold': config.RAM_THRESHOLD,
+        'cpu_threshold': config.CPU_THRESHOLD
+    },
+    max_records=config.METRICS_MAX_RECORDS
+)
+
+# Alerts are evaluated here on the incoming sample stream (hysteresis, sustained duration, EWMA anomalies)
+for router in routers:
+    router.alerts = router_evaluator(router.ram_threshold, router.cpu_threshold, config.ALERT_SETTINGS)
+
+# Chats allowed to use the bot menu
+allowed_chat_ids = routers.chat_ids() | {str(config.TELEGRAM_CHAT_ID)}
+async_logging.redactor.add_secrets(allowed_chat_ids)
+
+def chat_routers(chat_id):
+    """Routers whose data this chat may see: its own, all of them for the admin chat"""
+    if str(chat_id) == str(config.TELEGRAM_CHAT_ID):
+        return list(routers)
+    return routers.for_chat(chat_id)
+
+def scoped_view(view, scope):
+    """Render cache view name for a router scope: chats seeing different routers don't share renders"""
+    return f"{view}:{','.join(router.id for router in scope)}"
+
+def authenticate_router(token=None):
+    """Router for webhook token (Authorization: Bearer ... by default), or None"""
+    if token is None:
+        auth_header = request.headers.get('Authorization', '')
+        token = auth_header[len('Bearer '):] if auth_header.startswith('Bearer ') else ''
+    return routers.authenticate(token)
+
+# Rendered dashboard / stats / IoT menu texts
+render_cache = RenderCache()
 
 # In-memory storage for IoT devices
-iot_devices_history = {}
-for room_id, device_config in config.YANDEX_STATIONS.items():
-    iot_devices_history[room_id] = {
-        'name': device_config['name'],
-        'hostname': device_config['hostname'],
-        'mac': device_config['mac'],
-        'ip': device_config['ip'],
-        'icon': device_config['icon'],
-        'status': 'unknown',  # unknown, connected, disconnected
-        'last_seen': None,
-        'uptime_start': None,
-        'signal': None,
-        'events': [],  # последние 100 событий
-        'stats_24h': {
-            'disconnects': 0,
-            'connects': 0,
-            'avg_uptime': '0m',
-            'total_uptime_seconds': 0
-        },
-        'muted_until': None  # timestamp для функции "тихо 1ч"
-    }
+device_registry = DeviceRegistry(max_events=config.IOT_MAX_EVENTS_PER_DEVICE)
+device_registry.load(load_device_config(config.IOT_DEVICES_FILE, config.IOT_DEVICES_JSON,
+                                        default=config.YANDEX_STATIONS))
+iot_devices_history = device_registry.devices
+
+# Shared state for threaded serving: handlers mutate routers / devices under state.lock,
+# data generation counters (render cache versions) are bumped on every change
+state = BotState(routers, device_registry, render_cache, config.GEOSITE_CATEGORIES)
+app.extensions['bot_state'] = state
+
+# Metric chart PNGs and their Telegram file_ids; rendering runs on its own
+# thread, never under state.lock
+chart_cache = ChartCache()
+chart_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='charts')
+
+# Geosite builds started from Telegram (build_<commit>): workflow_dispatch + run tracking,
+# progress is shown by editing the messages that asked for the build
+github = GitHubClient(config.GITHUB_TOKEN, config.GITHUB_REPO, api_url=config.GITHUB_API_URL)
+
+def show_build_progress(build):
+    for chat_id, message_id in list(build.watchers):
+        edit_telegram_message(chat_id, message_id, build_progress_text(build), reply_markup=build_keyboard(build))
+
+build_tracker = BuildTracker(github, config.GITHUB_WORKFLOW, config.GITHUB_REF, show_build_progress,
+                             poll_min=config.GITHUB_POLL_MIN, poll_max=config.GITHUB_POLL_MAX,
+                             build_timeout=config.GITHUB_BUILD_TIMEOUT)
+
+# Per-device deadlines (critical offline, mute expiry, 24h counter roll-over) on one timer thread
+scheduler = Scheduler()
+
+def collect_router_gauge(value):
+    """Scrape-time gauge callback: {(router_id,): value(router)} for routers with data"""
+    def collect():
+        with state.lock:
+            return {(router.id,): value(router) for router in routers if len(router.metrics)}
+    return collect
+
+for field, documentation in (
+    ('ram_percent', 'Router RAM usage, percent (last sample)'),
+    ('cpu_load1', 'Router 1-minute load average (last sample)'),
+    ('clients', 'Router WiFi clients (last sample)'),
+    ('openclash_memory', 'OpenClash memory, MB (last sample)')
+):
+    telemetry_registry.gauge(f'bot_router_{field}', documentation, ('router',),
+                             callback=collect_router_gauge(lambda router, field=field: router.metrics.latest(field)))
+telemetry_registry.gauge('bot_router_samples_stored', 'Metric samples kept in memory', ('router',),
+                         callback=collect_router_gauge(lambda router: len(router.metrics)))
+telemetry_registry.gauge('bot_router_alerts_stored', 'Alerts kept in memory', ('router',),
+                         callback=collect_router_gauge(lambda router: len(router.metrics.history['alerts'])))
+
+def collect_iot_devices():
+    with state.lock:
+        return {(room,): int(device['status'] == 'connected') for room, device in iot_devices_history.items()}
+
+telemetry_registry.gauge('bot_iot_device_up', 'IoT device connected (1) or not (0)', ('room',),
+                         callback=collect_iot_devices)
+telemetry_registry.gauge('bot_telegram_queue_depth', 'Telegram calls queued or in flight',
+                         callback=telegram.pending)
+telemetry_registry.gauge('bot_notification_queue_depth', 'Pending coalesced notifications',
+                         callback=notifier.depth)
+telemetry_registry.counter('bot_notifications', 'Notifications by outcome', ('result',),
+                           callback=lambda: {('sent',): notifier.sent, ('coalesced',): notifier.coalesced,
+                                             ('dropped',): notifier.dropped})
+telemetry_registry.gauge('bot_scheduler_timers', 'Armed background timers', callback=scheduler.armed)
+telemetry_registry.counter('bot_render_cache', 'Render cache lookups and skipped edits', ('result',),
+                           callback=lambda: {(key,): value for key, value in render_cache.stats().items()
+                                             if key != 'tracked_messages'})
+telemetry_registry.gauge('bot_github_builds_active', 'Builds being dispatched or tracked',
+                         callback=build_tracker.active)
+telemetry_registry.counter('bot_github_requests', 'GitHub API requests (not_modified: 304, free of rate limit)',
+                           ('result',), callback=lambda: {(key,): value for key, value in github.stats().items()})
+telemetry_registry.counter('bot_charts', 'Metric charts rendered, uploaded and resent by file_id', ('result',),
+                           callback=lambda: {(key,): value for key, value in chart_cache.stats().items()
+                                             if key != 'entries'})
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if log_sampler.rates:
+        g.log_kept = log_sampler.keep(request.url_rule.rule if request.url_rule is not None else None)
+
+@app.after_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_request_duration.observe(time.perf_counter() - started,
+                                      route=route, method=request.method, status=response.status_code)
+    return response
+
+def serialize_device(device, events=10):
+    """JSON-friendly device state with the last few events"""
+    now = time.time()
+    summary = {key: value for key, value in device.items() if key not in ('events', 'stats_24h')}
+    summary['stats_24h'] = {name: counter.total(now) for name, counter in device['stats_24h'].items()}
+    summary['events_stored'] = len(device['events'])
+    summary['events'] = device['events'].latest(events)
+    return summary
 
 @app.route('/')
 def index():
@@ -130,8 +289,10 @@ def index():
         'endpoints': {
             'health': '/health',
             'status': '/status',
+            'metrics': '/metrics',
             'geosite_webhook': '/webhook/geosite-update',
             'monitoring_webhook': '/webhook/monitoring',
+            'monitoring_batch_webhook': '/webhook/monitoring/batch',
             'alert_webhook': '/webhook/alert'
         }
     })
@@ -143,39 +304,61 @@ def health():
         'status': 'healthy',
         'version': '1.1.0-iot-monitoring',
         'timestamp': datetime.utcnow().isoformat(),
-        'metrics_count': len(metrics_history['timestamps'])
+        'metrics_count': sum(len(router.metrics) for router in routers)
     })
 
 @app.route('/status')
 def status():
     """Status endpoint"""
-    return jsonify({
-        'bot_configured': bool(config.TELEGRAM_BOT_TOKEN),
-        'github_configured': bool(config.GITHUB_TOKEN),
-        'webhook_configured': bool(config.WEBHOOK_SECRET),
-        'metrics_stored': len(metrics_history['timestamps']),
-        'iot_devices': iot_devices_history,
-        'config': {
-            'geosite_categories': config.GEOSITE_CATEGORIES,
-            'ram_threshold': config.RAM_THRESHOLD,
-            'cpu_threshold': config.CPU_THRESHOLD
-        }
-    })
+    with state.lock:
+        return jsonify({
+            'bot_configured': bool(config.TELEGRAM_BOT_TOKEN),
+            'github_configured': bool(config.GITHUB_TOKEN),
+            'webhook_configured': bool(config.WEBHOOK_SECRET),
+            'metrics_stored': sum(len(router.metrics) for router in routers),
+            'routers': {
+                router.id: {
+                    'name': router.name,
+                    'metrics_stored': len(router.metrics),
+                    'alerts': len(router.metrics.history['alerts']),
+                    'ram_threshold': router.ram_threshold,
+                    'cpu_threshold': router.cpu_threshold,
+                    'alerts_active': router.alerts.active()
+                }
+                for router in routers
+            },
+            'iot_devices': {room: serialize_device(device) for room, device in iot_devices_history.items()},
+            'render_cache': render_cache.stats(),
+            'chart_cache': chart_cache.stats(),
+            'github': dict(github.stats(), rate_remaining=github.rate_remaining,
+                           builds_active=build_tracker.active()),
+            'config': {
+                'geosite_categories': state.geosite_categories,
+                'ram_threshold': config.RAM_THRESHOLD,
+                'cpu_threshold': config.CPU_THRESHOLD
+            }
+        })
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus / OpenMetrics scrape endpoint (streamed, values read at scrape time)"""
+    if config.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {config.METRICS_TOKEN}':
+        return jsonify({'error': 'unauthorized'}), 401
+    return Response(telemetry_registry.render(), mimetype=telemetry.CONTENT_TYPE)
 
 @app.route('/webhook/geosite-update', methods=['POST'])
 def geosite_update_webhook():
     """Handle geosite update notifications from router"""
     
-    # Verify webhook secret
-    auth_header = request.headers.get('Authorization')
-    expected = f"Bearer {config.WEBHOOK_SECRET}"
-    
-    if auth_header != expected:
+    # Verify webhook secret (identifies the router)
+    router = authenticate_router()
+    if router is None:
         logger.warning(f"Unauthorized webhook attempt from {request.remote_addr}")
         return jsonify({'error': 'unauthorized'}), 401
     
     data = request.json
-    logger.info(f"Geosite update webhook received: {data}")
+    logger.info("Geosite update webhook received [%s]", router.id)
+    logger.debug("Geosite update payload: %s", data)
     
     # Send beautiful notification
     commit = data.get('commit', 'unknown')[:8]
@@ -201,98 +384,126 @@ def geosite_update_webhook():
         ]
     }
     
-    send_telegram_message(notification_text, reply_markup=keyboard)
+    send_telegram_message(notification_text, reply_markup=keyboard, chat_id=router.chat_id)
     
     return jsonify({'status': 'received', 'message': 'Update notification processed'})
 
 @app.route('/webhook/monitoring', methods=['POST'])
 def monitoring_webhook():
-    """Handle monitoring data from router (every 5 minutes)"""
-    
-    # Verify webhook secret
-    auth_header = request.headers.get('Authorization')
-    expected = f"Bearer {config.WEBHOOK_SECRET}"
+    """Handle monitoring data from router (single sample)"""
     
-    if auth_header != expected:
+    # Verify webhook secret (identifies the router)
+    router = authenticate_router()
+    if router is None:
         logger.warning(f"Unauthorized monitoring webhook from {request.remote_addr}")
         return jsonify({'error': 'unauthorized'}), 401
     
     data = request.json
-    timestamp = data.get('timestamp', datetime.utcnow().isoformat())
-    
-    # Store metrics in memory (keep last 288 records = 24 hours)
-    metrics_history['timestamps'].append(timestamp)
-    metrics_history['ram_percent'].append(data.get('ram', {}).get('percent', 0))
-    metrics_history['cpu_load1'].append(data.get('cpu', {}).get('load1', 0))
-    metrics_history['clients'].append(data.get('clients', 0))
-    metrics_history['openclash_memory'].append(
-        data.get('openclash', {}).get('memory', 0)
-    )
+    timestamp = normalize_timestamp(data.get('timestamp')) or datetime.utcnow().isoformat(timespec='seconds')
     
-    # Keep only last 288 records (24 hours * 12 per hour)
-    max_records = 288
-    for key in metrics_history:
-        if len(metrics_history[key]) > max_records:
-            metrics_history[key] = metrics_history[key][-max_records:]
+    # Store metrics in router's namespace (keep last METRICS_MAX_RECORDS = 24 hours)
+    events = []
+    with state.lock:
+        if router.metrics.add_sample(timestamp, data) == 'stored':
+            state.bump('metrics')
+            events = router.alerts.observe(timestamp, sample_values(data))
+        records = len(router.metrics)
+    handle_alert_events(router, events)
     
-    logger.info(f"Monitoring data stored: RAM={data.get('ram', {}).get('percent')}%, "
-                f"CPU={data.get('cpu', {}).get('load1')}, "
-                f"Clients={data.get('clients')}")
+    logger.info("Monitoring data stored [%s]: RAM=%s%%, CPU=%s, Clients=%s", router.id,
+                data.get('ram', {}).get('percent'), data.get('cpu', {}).get('load1'), data.get('clients'))
     
-    return jsonify({'status': 'stored', 'records': len(metrics_history['timestamps'])})
+    return jsonify({'status': 'stored', 'router': router.id, 'records': records})
 
-@app.route('/webhook/alert', methods=['POST'])
-def alert_webhook():
-    """Handle critical alerts from router"""
-    
-    # Verify webhook secret
-    auth_header = request.headers.get('Authorization')
-    expected = f"Bearer {config.WEBHOOK_SECRET}"
-    
-    if auth_header != expected:
-        logger.warning(f"Unauthorized alert webhook from {request.remote_addr}")
+def parse_monitoring_batch():
+    """Samples from request body: JSON array, {"samples": [...]} or NDJSON (one sample per line)"""
+    body = request.get_data(as_text=True).strip()
+    try:
+        parsed = json.loads(body)
+    except ValueError:
+        parsed = None  # NDJSON with several lines (or garbage) isn't one JSON document
+    if isinstance(parsed, list):
+        return parsed
+    if isinstance(parsed, dict):
+        # One NDJSON line parses as a single sample object
+        return parsed.get('samples') if 'samples' in parsed else [parsed]
+    samples = []
+    for line in body.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            samples.append(json.loads(line))
+        except ValueError:
+            # Partial last line of an interrupted buffer write - skip it
+            logger.warning("Skipping malformed NDJSON line in monitoring batch")
+    return samples
+
+@app.route('/webhook/monitoring/batch', methods=['POST'])
+def monitoring_batch_webhook():
+    """Handle buffered monitoring samples from router (JSON array or NDJSON).
+
+    Dedupe is by sample timestamp, so the router can safely re-send a batch
+    whose response was lost: already stored samples are counted as duplicates.
+    Backfill older than the retained window is counted as expired.
+    """
+    router = authenticate_router()
+    if router is None:
+        logger.warning(f"Unauthorized monitoring batch webhook from {request.remote_addr}")
         return jsonify({'error': 'unauthorized'}), 401
     
-    data = request.json
-    alert_type = data.get('type', 'unknown')
-    value = data.get('value', 0)
-    threshold = data.get('threshold', 0)
+    samples = parse_monitoring_batch()
+    if not isinstance(samples, list):
+        return jsonify({'error': 'expected JSON array or NDJSON'}), 400
+    if len(samples) > config.METRICS_BATCH_MAX_SAMPLES:
+        return jsonify({'error': 'too many samples', 'max': config.METRICS_BATCH_MAX_SAMPLES}), 413
     
-    # Store alert in history
-    alert_record = {
-        'timestamp': data.get('timestamp', datetime.utcnow().isoformat()),
-        'type': alert_type,
-        'value': value,
-        'threshold': threshold,
-        'severity': 'critical' if value > threshold * 1.1 else 'warning'
-    }
-    metrics_history['alerts'].append(alert_record)
-    
-    # Keep only last 100 alerts
-    if len(metrics_history['alerts']) > 100:
-        metrics_history['alerts'] = metrics_history['alerts'][-100:]
-    
-    logger.warning(f"ALERT: {alert_type} = {value} (threshold: {threshold})")
-    
-    # Send beautiful alert notification
-    severity_icon = '🔴' if alert_record['severity'] == 'critical' else '🟡'
-    type_icons = {
-        'ram': '💾',
-        'cpu': '🔥',
-        'openclash': '🌐'
-    }
-    icon = type_icons.get(alert_type.lower(), '⚠️')
+    stored = duplicates = expired = rejected = 0
+    events = []
+    with state.lock:
+        # Oldest first: alert conditions see the samples in time order
+        timestamped = [(normalize_timestamp(sample.get('timestamp')) if isinstance(sample, dict) else None, sample)
+                       for sample in samples]
+        for timestamp, sample in sorted(timestamped, key=lambda item: item[0] or ''):
+            if timestamp is None:
+                # Without a timestamp a sample can be neither placed nor deduplicated
+                rejected += 1
+            else:
+                status = router.metrics.add_sample(timestamp, sample)
+                if status == 'stored':
+                    stored += 1
+                    events.extend(router.alerts.observe(timestamp, sample_values(sample)))
+                elif status == 'expired':
+                    expired += 1
+                else:
+                    duplicates += 1
+        if stored:
+            state.bump('metrics')
+        records = len(router.metrics)
+    handle_alert_events(router, events)
     
-    alert_text = (
-        f"{severity_icon} <b>КРИТИЧЕСКИЙ АЛЕРТ!</b>\n\n"
-        f"{icon} <b>{alert_type.upper()}</b>\n\n"
-        f"📊 <b>Текущее:</b> {value}\n"
-        f"⚠️ <b>Порог:</b> {threshold}\n"
-        f"📈 <b>Превышение:</b> {((value/threshold - 1) * 100):.1f}%\n\n"
-        f"🕐 {alert_record['timestamp'][:16]}"
-    )
+    logger.info("Monitoring batch [%s]: %d stored, %d duplicates, %d expired, %d rejected",
+                router.id, stored, duplicates, expired, rejected)
     
-    keyboard = {
+    return jsonify({
+        'status': 'stored',
+        'router': router.id,
+        'received': len(samples),
+        'stored': stored,
+        'duplicates': duplicates,
+        'expired': expired,
+        'rejected': rejected,
+        'records': records
+    })
+
+ALERT_TYPE_ICONS = {
+    'ram': '💾',
+    'cpu': '🔥',
+    'openclash': '🌐'
+}
+
+def alert_keyboard():
+    return {
         "inline_keyboard": [
             [
                 {"text": "📊 Dashboard", "callback_data": "dashboard"},
@@ -303,35 +514,140 @@ def alert_webhook():
             ]
         ]
     }
+
+def record_alert(router, alert_record, notify=True):
+    """Store alert in router history and queue its (coalesced) Telegram notification"""
+    with state.lock:
+        router.metrics.add_alert(alert_record)
+        state.bump('metrics')
+    
+    alert_type = alert_record['type']
+    logger.warning("ALERT [%s]: %s = %s (threshold: %s)", router.id, alert_type,
+                   alert_record['value'], alert_record['threshold'])
+    if not notify:
+        return
+    
+    severity_icon = '🔴' if alert_record['severity'] == 'critical' else '🟡'
+    icon = ALERT_TYPE_ICONS.get(alert_type.lower().split('_')[0], '⚠️')
+    value, threshold = alert_record['value'], alert_record['threshold']
+    detail = alert_record.get('detail') or {}
+    if alert_type == 'openclash':
+        body = "❗ OpenClash остановлен\n\n"
+    elif 'z' in detail:
+        body = (
+            f"📊 <b>Текущее:</b> {value}\n"
+            f"📉 <b>Норма (EWMA):</b> {detail['mean']}\n"
+            f"📈 <b>Отклонение:</b> {detail['z']}σ\n\n"
+        )
+    else:
+        body = (
+            f"📊 <b>Текущее:</b> {value}\n"
+            f"⚠️ <b>Порог:</b> {threshold}\n"
+            + (f"📈 <b>Превышение:</b> {((value/threshold - 1) * 100):.1f}%\n\n" if threshold else "\n")
+        )
+    
+    alert_text = (
+        f"{severity_icon} <b>КРИТИЧЕСКИЙ АЛЕРТ!</b>\n\n"
+        + (f"🤖 <b>Роутер:</b> {router.name}\n" if len(routers) > 1 else "")
+        + f"{icon} <b>{alert_type.upper()}</b>\n\n"
+        + body
+        + f"🕐 {alert_record['timestamp'][:16]}"
+    )
+    
+    notifier.notify(f"alert:{router.id}:{alert_type.lower()}", alert_text,
+                    reply_markup=alert_keyboard(), chat_id=router.chat_id)
+
+def handle_alert_events(router, events):
+    """Alert / recovery notifications for AlertEvaluator state changes.
+
+    Events from backfilled samples older than ALERT_MAX_AGE_SECONDS are only
+    recorded: an outage that is already over shouldn't page.
+    """
+    now = datetime.utcnow()
+    for event in events:
+        fresh = (now - datetime.fromisoformat(event.timestamp)).total_seconds() <= config.ALERT_MAX_AGE_SECONDS
+        if event.kind == 'fire':
+            if event.name == 'openclash':
+                severity = 'critical'
+            elif event.detail:
+                severity = 'warning'
+            else:
+                severity = 'critical' if event.value > event.threshold * 1.1 else 'warning'
+            record_alert(router, {
+                'timestamp': event.timestamp,
+                'type': event.name,
+                'value': event.value,
+                'threshold': round(event.threshold, 2),
+                'severity': severity,
+                'detail': event.detail,
+                'source': 'server'
+            }, notify=fresh)
+            continue
+        
+        logger.info("Alert resolved [%s]: %s = %s", router.id, event.name, event.value)
+        if fresh:
+            icon = ALERT_TYPE_ICONS.get(event.name.split('_')[0], '⚠️')
+            notifier.notify(
+                f"alert:{router.id}:{event.name}",
+                "✅ <b>Алерт снят</b>\n\n"
+                + (f"🤖 <b>Роутер:</b> {router.name}\n" if len(routers) > 1 else "")
+                + f"{icon} <b>{event.name.upper()}</b> в норме\n"
+                f"📊 <b>Текущее:</b> {event.value}\n\n"
+                f"🕐 {event.timestamp[:16]}",
+                chat_id=router.chat_id
+            )
+
+@app.route('/webhook/alert', methods=['POST'])
+def alert_webhook():
+    """Handle alerts pushed by the router (older monitor_router.sh versions)"""
     
-    send_telegram_message(alert_text, reply_markup=keyboard)
+    # Verify webhook secret (identifies the router)
+    router = authenticate_router()
+    if router is None:
+        logger.warning(f"Unauthorized alert webhook from {request.remote_addr}")
+        return jsonify({'error': 'unauthorized'}), 401
+    
+    data = request.json
+    value = data.get('value', 0)
+    threshold = data.get('threshold', 0)
+    
+    alert_record = {
+        'timestamp': data.get('timestamp', datetime.utcnow().isoformat()),
+        'type': data.get('type', 'unknown'),
+        'value': value,
+        'threshold': threshold,
+        'severity': 'critical' if value > threshold * 1.1 else 'warning'
+    }
+    record_alert(router, alert_record)
     
     return jsonify({'status': 'alert_received', 'severity': alert_record['severity']})
 
 @app.route('/metrics/latest')
 def get_latest_metrics():
-    """Get latest metrics (API endpoint)"""
-    if not metrics_history['timestamps']:
-        return jsonify({'error': 'no data'}), 404
-    
-    return jsonify({
-        'timestamp': metrics_history['timestamps'][-1] if metrics_history['timestamps'] else None,
-        'ram_percent': metrics_history['ram_percent'][-1] if metrics_history['ram_percent'] else 0,
-        'cpu_load1': metrics_history['cpu_load1'][-1] if metrics_history['cpu_load1'] else 0,
-        'clients': metrics_history['clients'][-1] if metrics_history['clients'] else 0,
-        'openclash_memory': metrics_history['openclash_memory'][-1] if metrics_history['openclash_memory'] else 0,
-        'recent_alerts': metrics_history['alerts'][-5:] if metrics_history['alerts'] else []
-    })
+    """Get latest metrics (API endpoint), ?router=<id> selects router"""
+    router = routers.get(request.args.get('router', config.ROUTER_ID)) or next(iter(routers))
+    store = router.metrics
+    with state.lock:
+        if not store.history['timestamps']:
+            return jsonify({'error': 'no data'}), 404
+        
+        return jsonify({
+            'router': router.id,
+            'timestamp': store.latest('timestamps', None),
+            'ram_percent': store.latest('ram_percent'),
+            'cpu_load1': store.latest('cpu_load1'),
+            'clients': store.latest('clients'),
+            'openclash_memory': store.latest('openclash_memory'),
+            'recent_alerts': store.history['alerts'][-5:]
+        })
 
 @app.route('/webhook/build-complete', methods=['POST'])
 def build_complete_webhook():
     """Handle build completion notifications from GitHub Actions"""
     
-    # Verify webhook secret
-    auth_header = request.headers.get('Authorization')
-    expected = f"Bearer {config.WEBHOOK_SECRET}"
-    
-    if auth_header != expected:
+    # Verify webhook secret (identifies the router)
+    router = authenticate_router()
+    if router is None:
         logger.warning(f"Unauthorized build webhook from {request.remote_addr}")
         return jsonify({'error': 'unauthorized'}), 401
     
@@ -343,6 +659,14 @@ def build_complete_webhook():
     
     logger.info(f"Build complete webhook: {status} - {version}")
     
+    # Categories are derived from the OpenClash config at build time
+    categories = data.get('categories')
+    if status == 'success' and categories:
+        if isinstance(categories, str):
+            categories = categories.split()
+        with state.lock:
+            state.geosite_categories = list(categories)
+    
     # Send Telegram notification
     if status == 'success':
         notification_text = (
@@ -359,7 +683,7 @@ def build_complete_webhook():
             f"❗ <b>Ошибка:</b> {error}"
         )
     
-    send_telegram_message(notification_text)
+    send_telegram_message(notification_text, chat_id=router.chat_id)
     
     return jsonify({'status': 'notification_sent'})
 
@@ -367,11 +691,9 @@ def build_complete_webhook():
 def router_event_webhook():
     """Handle router events (geosite updates, etc.)"""
     
-    # Verify webhook secret
-    auth_header = request.headers.get('Authorization')
-    expected = f"Bearer {config.WEBHOOK_SECRET}"
-    
-    if auth_header != expected:
+    # Verify webhook secret (identifies the router)
+    router = authenticate_router()
+    if router is None:
         logger.warning(f"Unauthorized router event from {request.remote_addr}")
         return jsonify({'error': 'unauthorized'}), 401
     
@@ -380,9 +702,10 @@ def router_event_webhook():
     status = data.get('status', 'unknown')
     message = data.get('message', '')
     version = data.get('version', 'unknown')
-    router = data.get('router', 'OpenWrt')
+    # Hostname reported by the router, falls back to the name of the authenticated namespace
+    router_name = data.get('router') or router.name
     
-    logger.info(f"Router event: {event} - {status} - {message}")
+    logger.info(f"Router event [{router.id}]: {event} - {status} - {message}")
     
     # Send Telegram notification
     if event == 'geosite_update':
@@ -391,7 +714,7 @@ def router_event_webhook():
                 f"🔄 <b>Geosite обновлён!</b>\n\n"
                 f"📦 <b>Версия:</b> {version}\n"
                 f"💾 <b>Размер:</b> 91 KB\n"
-                f"🤖 <b>Роутер:</b> {router}\n\n"
+                f"🤖 <b>Роутер:</b> {router_name}\n\n"
                 f"✅ OpenClash перезапущен"
             )
         else:
@@ -399,30 +722,35 @@ def router_event_webhook():
                 f"❌ <b>Ошибка обновления Geosite</b>\n\n"
                 f"<b>Причина:</b> {message}\n"
                 f"📦 <b>Версия:</b> {version}\n"
-                f"🤖 <b>Роутер:</b> {router}\n\n"
+                f"🤖 <b>Роутер:</b> {router_name}\n\n"
                 f"Проверьте логи на роутере"
             )
         
-        send_telegram_message(notification_text)
+        send_telegram_message(notification_text, chat_id=router.chat_id)
     
-    return jsonify({'status': 'processed'})
+    return jsonify({'status': 'processed', 'router': router.id})
 
 @app.route('/webhook/yandex-station', methods=['POST'])
 def yandex_station_webhook():
     """Handle Yandex Station connection events from router"""
-    from datetime import datetime, timedelta
     
     # Verify webhook secret
-    auth_header = request.headers.get('X-Webhook-Secret')
-    
-    if auth_header != config.WEBHOOK_SECRET:
+    router = authenticate_router(request.headers.get('X-Webhook-Secret', ''))
+    if router is None:
         logger.warning(f"Unauthorized yandex-station webhook from {request.remote_addr}")
         return jsonify({'error': 'unauthorized'}), 401
     
     data = request.json
+    
+    # Device state is shared between request threads
+    with state.lock:
+        return process_yandex_event(router, data)
+
+def process_yandex_event(router, data):
+    """Update device state from one Yandex Station event (caller holds state.lock)"""
     event_type = data.get('event', 'unknown')  # disconnect, connected, dhcp
     room = data.get('room', 'unknown')
-    device_name = data.get('device_name', 'Unknown')
+    device_name = data.get('device_name', '')
     mac = data.get('mac', '')
     ip = data.get('ip', '')
     timestamp_str = data.get('timestamp', '')
@@ -430,18 +758,27 @@ def yandex_station_webhook():
     uptime = data.get('uptime', '0m')
     reason = data.get('reason', '')
     
-    logger.info(f"Yandex Station event: {event_type} - {device_name} ({room})")
+    logger.info("Yandex Station event: %s - %s (%s)", event_type, device_name, room)
     
-    # Check if device exists in our config
-    if room not in iot_devices_history:
-        logger.warning(f"Unknown room: {room}")
-        return jsonify({'status': 'unknown_device'}), 400
+    # Find device by room, MAC, hostname or IP; unknown MACs are auto-registered
+    hostname = data.get('hostname', '')
+    resolved_room = device_registry.resolve(room=room, mac=mac, hostname=hostname, ip=ip)
+    if resolved_room is None:
+        if not (config.IOT_AUTO_REGISTER and mac):
+            logger.warning(f"Unknown room: {room}")
+            return jsonify({'status': 'unknown_device'}), 400
+        resolved_room = device_registry.auto_register(mac, device_name, hostname, ip)
+    room = resolved_room
     
     device = iot_devices_history[room]
+    device_name = device_name or device['name']
     timestamp = datetime.fromisoformat(timestamp_str) if timestamp_str else datetime.now()
     
+    ts = timestamp.timestamp()
+    
     # Create event record
     event_record = {
+        'ts': ts,
         'timestamp': timestamp.isoformat(),
         'type': event_type,
         'signal': signal,
@@ -449,34 +786,31 @@ def yandex_station_webhook():
         'reason': reason
     }
     
-    # Add event to history (keep last 100)
-    device['events'].insert(0, event_record)
-    if len(device['events']) > config.IOT_MAX_EVENTS_PER_DEVICE:
-        device['events'] = device['events'][:config.IOT_MAX_EVENTS_PER_DEVICE]
+    # Add event to history (bounded by IOT_MAX_EVENTS_PER_DEVICE)
+    device['events'].append(ts, event_record)
+    
+    state.bump('iot')
     
     # Update device status
     device['last_seen'] = timestamp.isoformat()
     device['signal'] = signal
-    device['ip'] = ip
+    device_registry.update_ip(room, ip)
     
     # Handle different event types
     if event_type == 'disconnect':
         device['status'] = 'disconnected'
         device['disconnect_time'] = timestamp.isoformat()  # Save disconnect time
-        device['stats_24h']['disconnects'] += 1
+        device['stats_24h']['disconnects'].add(ts)
+        arm_stats_roll(room)
+        arm_offline_deadline(router, room, device['disconnect_time'], ts)
         
         # Check if device is muted
-        if device['muted_until']:
-            mute_until = datetime.fromisoformat(device['muted_until'])
-            if datetime.now() < mute_until:
-                logger.info(f"Device {device_name} is muted until {device['muted_until']}")
-                return jsonify({'status': 'muted'})
+        if is_muted(device):
+            logger.info(f"Device {device_name} is muted until {device['muted_until']}")
+            return jsonify({'status': 'muted'})
         
         # Count disconnects in last hour
-        one_hour_ago = datetime.now() - timedelta(hours=1)
-        recent_disconnects = sum(1 for e in device['events'] 
-                                if e['type'] == 'disconnect' 
-                                and datetime.fromisoformat(e['timestamp']) > one_hour_ago)
+        recent_disconnects = device['events'].count_since(time.time() - 3600, 'disconnect')
         
         # Send notification ONLY for frequent disconnects (critical issue)
         if recent_disconnects >= config.IOT_DISCONNECT_THRESHOLD:
@@ -504,7 +838,7 @@ def yandex_station_webhook():
                     ]
                 ]
             }
-            send_telegram_message(notification_text, reply_markup=keyboard)
+            notifier.notify(f"iot:{room}", notification_text, reply_markup=keyboard, chat_id=router.chat_id)
         # Normal disconnect - DON'T send notification immediately
         # Will check on next connect if offline was > 3 minutes
     
@@ -524,7 +858,10 @@ def yandex_station_webhook():
         device['status'] = 'connected'
         device['uptime_start'] = timestamp.isoformat()
         device['disconnect_time'] = None  # Clear disconnect time
-        device['stats_24h']['connects'] += 1
+        device['offline_alerted'] = False
+        device['stats_24h']['connects'].add(ts)
+        arm_stats_roll(room)
+        scheduler.cancel(f"offline:{room}")
         
         # Send notification ONLY if device was offline > 3 minutes
         if was_offline_long and offline_duration:
@@ -545,10 +882,72 @@ def yandex_station_webhook():
                     ]
                 ]
             }
-            send_telegram_message(notification_text, reply_markup=keyboard)
+            notifier.notify(f"iot:{room}", notification_text, reply_markup=keyboard, chat_id=router.chat_id)
     
     return jsonify({'status': 'processed', 'device': device_name})
 
+def is_muted(device):
+    """Notifications of device muted ("тихо 1ч"); the mute timer clears expired mutes"""
+    return bool(device['muted_until']) and datetime.now() < datetime.fromisoformat(device['muted_until'])
+
+def arm_offline_deadline(router, room, disconnect_time, disconnect_ts):
+    """Critical alert if the device is still offline IOT_CRITICAL_OFFLINE_MIN after disconnect"""
+    scheduler.schedule(f"offline:{room}", disconnect_ts + config.IOT_CRITICAL_OFFLINE_MIN * 60,
+                       lambda: offline_deadline(router, room, disconnect_time))
+
+def offline_deadline(router, room, disconnect_time):
+    with state.lock:
+        device = iot_devices_history.get(room)
+        # A newer disconnect re-armed the timer, a connect cancelled it: only act on this one
+        if device is None or device['status'] != 'disconnected' or device.get('disconnect_time') != disconnect_time:
+            return
+        device['offline_alerted'] = True
+        state.bump('iot')
+        if is_muted(device):
+            return
+        offline_minutes = int((datetime.now() - datetime.fromisoformat(disconnect_time)).total_seconds() / 60)
+        notification_text = (
+            f"🔴 <b>{device['name']} офлайн</b>\n\n"
+            f"🏠 Комната: {device['label']}\n"
+            f"⏱ Офлайн уже: {offline_minutes} мин (порог {config.IOT_CRITICAL_OFFLINE_MIN} мин)\n"
+            f"📡 Последний сигнал: {device['signal']}\n"
+            f"⏰ Отключилась: {format_moscow_time(datetime.fromisoformat(disconnect_time))}"
+        )
+    keyboard = {
+        "inline_keyboard": [
+            [
+                {"text": "📊 История", "callback_data": f"iot_history_{room}"},
+                {"text": "✅ Принято", "callback_data": "alert_ack"}
+            ]
+        ]
+    }
+    notifier.notify(f"iot:{room}", notification_text, reply_markup=keyboard, chat_id=router.chat_id)
+
+def arm_stats_roll(room):
+    """Timer at the next expiry of a 24h counter bucket of the device (caller holds state.lock)"""
+    key = f"roll:{room}"
+    if scheduler.pending(key):
+        # Armed for an older bucket, which expires first
+        return
+    expiries = [expiry for expiry in (counter.next_expiry() for counter in iot_devices_history[room]['stats_24h'].values())
+                if expiry is not None]
+    if expiries:
+        scheduler.schedule(key, min(expiries), lambda: roll_stats(room))
+
+def roll_stats(room):
+    with state.lock:
+        for counter in iot_devices_history[room]['stats_24h'].values():
+            counter.roll()
+        state.bump('iot')
+        arm_stats_roll(room)
+
+def expire_mute(room, muted_until):
+    with state.lock:
+        device = iot_devices_history.get(room)
+        if device is not None and device['muted_until'] == muted_until:
+            device['muted_until'] = None
+            state.bump('iot')
+
 def get_main_menu():
     """Get main menu inline keyboard"""
     return {
@@ -570,33 +969,57 @@ def get_main_menu():
         ]
     }
 
-def get_back_button():
-    """Get back to menu button"""
+def get_chart_buttons():
+    """Chart buttons for dashboard / stats, with back to menu"""
     return {
         "inline_keyboard": [
+            [
+                {"text": "📉 RAM 24ч", "callback_data": "chart_ram_24h"},
+                {"text": "📉 RAM 7д", "callback_data": "chart_ram_7d"}
+            ],
+            [
+                {"text": "🔥 CPU 24ч", "callback_data": "chart_cpu_24h"},
+                {"text": "🔥 CPU 7д", "callback_data": "chart_cpu_7d"}
+            ],
             [{"text": "◀️ Назад в меню", "callback_data": "menu"}]
         ]
     }
 
-def get_iot_menu():
-    """Get IoT devices menu"""
+def get_back_button():
+    """Get back to menu button"""
     return {
         "inline_keyboard": [
-            [
-                {"text": "📱 Спальня", "callback_data": "iot_device_bedroom"},
-                {"text": "📱 Гостиная", "callback_data": "iot_device_living_room"}
-            ],
-            [
-                {"text": "🔊 Кухня", "callback_data": "iot_device_kitchen"},
-                {"text": "📊 История", "callback_data": "iot_history"}
-            ],
-            [
-                {"text": "⚙️ Настройки", "callback_data": "iot_settings"},
-                {"text": "◀️ Главное меню", "callback_data": "menu"}
-            ]
+            [{"text": "◀️ Назад в меню", "callback_data": "menu"}]
         ]
     }
 
+def get_iot_menu(page=0):
+    """Get IoT devices menu (one page of devices, 2 per row)"""
+    rooms, page, pages = device_registry.page(page, config.IOT_MENU_PAGE_SIZE)
+    keyboard = []
+    for i in range(0, len(rooms), 2):
+        keyboard.append([
+            {"text": f"{iot_devices_history[room]['icon']} {iot_devices_history[room]['label']}",
+             "callback_data": f"iot_device_{room}"}
+            for room in rooms[i:i + 2]
+        ])
+    
+    if pages > 1:
+        nav = []
+        if page > 0:
+            nav.append({"text": "◀️", "callback_data": f"iot_menu_page_{page - 1}"})
+        nav.append({"text": f"{page + 1}/{pages}", "callback_data": f"iot_menu_page_{page}"})
+        if page < pages - 1:
+            nav.append({"text": "▶️", "callback_data": f"iot_menu_page_{page + 1}"})
+        keyboard.append(nav)
+    
+    keyboard.append([
+        {"text": "📊 История", "callback_data": "iot_history"},
+        {"text": "⚙️ Настройки", "callback_data": "iot_settings"}
+    ])
+    keyboard.append([{"text": "◀️ Главное меню", "callback_data": "menu"}])
+    return {"inline_keyboard": keyboard}
+
 def get_iot_device_buttons(room):
     """Get buttons for specific IoT device"""
     return {
@@ -620,12 +1043,543 @@ def get_iot_back_button():
         ]
     }
 
+# Welcome / main menu text
+WELCOME_TEXT = (
+    "🤖 <b>Geosite Manager</b>\n\n"
+    "Управление OpenWrt роутером\n\n"
+    "🔹 <b>Мониторинг:</b> RAM, CPU, WiFi\n"
+    "🔹 <b>Geosite:</b> Автообновления\n"
+    "🔹 <b>Алерты:</b> Критические события\n\n"
+    "Выберите действие:"
+)
+
+# Callback query handlers (inline buttons)
+callbacks = CallbackRouter()
+
+def format_uptime(uptime_start):
+    """Format time since uptime_start as 'Nд Nч' / 'Nч Nм'"""
+    try:
+        delta = datetime.now() - datetime.fromisoformat(uptime_start)
+    except (TypeError, ValueError):
+        return "unknown"
+    hours = delta.seconds // 3600
+    minutes = (delta.seconds % 3600) // 60
+    if delta.days > 0:
+        return f"{delta.days}д {hours}ч"
+    return f"{hours}ч {minutes}м"
+
+@callbacks.route('menu')
+@callbacks.route('refresh')
+def handle_menu(ctx):
+    edit_telegram_message(ctx.chat_id, ctx.message_id, WELCOME_TEXT, reply_markup=get_main_menu())
+
+@callbacks.route('status')
+def handle_status(ctx):
+    scope = chat_routers(ctx.chat_id)
+    default_router = routers.get(config.ROUTER_ID)
+    if default_router not in scope:
+        default_router = scope[0]
+    status_text = (
+        "⚙️ <b>Статус системы</b>\n\n"
+        f"✅ <b>Railway:</b> Online\n"
+        f"✅ <b>Webhooks:</b> Активны\n"
+        f"📊 <b>Метрик:</b> {sum(len(router.metrics) for router in scope)}\n"
+        f"🚨 <b>Алертов:</b> {sum(len(router.metrics.history['alerts']) for router in scope)}\n\n"
+        f"🔧 <b>Конфигурация:</b>\n"
+        f"├ RAM limit: {default_router.ram_threshold}%\n"
+        f"├ CPU limit: {default_router.cpu_threshold}\n"
+        f"└ Категорий: {len(state.geosite_categories)}\n\n"
+    )
+    if len(scope) > 1:
+        status_text += f"🌐 <b>Роутеров:</b> {len(scope)}\n"
+    else:
+        status_text += f"🌐 <b>Router:</b> 192.168.31.1\n"
+    status_text += f"📡 <b>Updates:</b> Каждую минуту (пакетами)"
+    edit_telegram_message(ctx.chat_id, ctx.message_id, status_text, reply_markup=get_back_button())
+
+def show_cached_view(ctx, view, version, builder):
+    """Edit message with cached view; no outbound call if it already shows this version"""
+    if render_cache.is_shown(ctx.chat_id, ctx.message_id, view, version):
+        return
+    text, reply_markup = render_cache.render(view, version, builder)
+    future = edit_telegram_message(ctx.chat_id, ctx.message_id, text, reply_markup=reply_markup)
+    render_cache.mark_shown(ctx.chat_id, ctx.message_id, view, version)
+    # Failed edit: message still shows the old content
+    future.add_done_callback(
+        lambda f: f.exception() is not None and render_cache.forget(ctx.chat_id, ctx.message_id)
+    )
+
+@callbacks.route('dashboard')
+def handle_dashboard(ctx):
+    scope = chat_routers(ctx.chat_id)
+    show_cached_view(ctx, scoped_view('dashboard', scope), state.generation('metrics'),
+                     lambda: render_dashboard(scope))
+
+def cpu_status(cpu, threshold):
+    return '🟢 Normal' if cpu < threshold * 2 / 3 else '🟡 High' if cpu < threshold else '🔴 Critical'
+
+def render_dashboard(scope):
+    reporting = [router for router in scope if router.metrics.history['timestamps']]
+    if not reporting:
+        dashboard_text = (
+            "📊 <b>Dashboard</b>\n\n"
+            "⏳ Метрики еще не собраны.\n"
+            "Ожидайте первого обновления\n"
+            "(метрики приходят пачкой раз в 5 минут)"
+        )
+    elif len(scope) == 1:
+        store = reporting[0].metrics
+        ram = store.latest('ram_percent')
+        cpu = store.latest('cpu_load1')
+        clients = store.latest('clients')
+        clash_mem = store.latest('openclash_memory')
+        
+        # RAM bar
+        ram_bars = '█' * (int(ram) // 10) + '░' * (10 - int(ram) // 10)
+        ram_status = '🟢' if ram < 70 else '🟡' if ram < reporting[0].ram_threshold else '🔴'
+        
+        dashboard_text = (
+            "📊 <b>Router Dashboard</b>\n\n"
+            f"💾 <b>RAM:</b> {ram}% {ram_status}\n"
+            f"{ram_bars}\n\n"
+            f"🔥 <b>CPU Load:</b> {cpu}\n"
+            f"{cpu_status(cpu, reporting[0].cpu_threshold)}\n\n"
+            f"📡 <b>WiFi:</b> {clients} клиентов\n"
+            f"🌐 <b>OpenClash:</b> {clash_mem}m\n\n"
+            f"📈 Собрано метрик: {len(store)}"
+        )
+    else:
+        # Aggregated view: one compact block per router
+        dashboard_text = f"📊 <b>Routers Dashboard</b> ({len(reporting)}/{len(scope)})\n\n"
+        total_clients = 0
+        for router in reporting:
+            store = router.metrics
+            ram = store.latest('ram_percent')
+            cpu = store.latest('cpu_load1')
+            total_clients += store.latest('clients')
+            ram_status = '🟢' if ram < 70 else '🟡' if ram < router.ram_threshold else '🔴'
+            dashboard_text += (
+                f"🤖 <b>{router.name}</b>\n"
+                f"├ 💾 RAM: {ram}% {ram_status}\n"
+                f"├ 🔥 CPU: {cpu} {cpu_status(cpu, router.cpu_threshold).split()[0]}\n"
+                f"└ 📡 WiFi: {store.latest('clients')} | 🌐 {store.latest('openclash_memory')}m\n\n"
+            )
+        dashboard_text += (
+            f"📡 <b>Всего клиентов:</b> {total_clients}\n"
+            f"📈 Собрано метрик: {sum(len(router.metrics) for router in scope)}"
+        )
+    return dashboard_text, get_chart_buttons() if reporting else get_back_button()
+
+@callbacks.route('alerts')
+def handle_alerts(ctx):
+    # Last 5 alerts across the chat's routers
+    scope = chat_routers(ctx.chat_id)
+    recent_alerts = heapq.nlargest(
+        5,
+        ((alert, router) for router in scope for alert in router.metrics.history['alerts'][-5:]),
+        key=lambda item: item[0]['timestamp']
+    )
+    if not recent_alerts:
+        alerts_text = (
+            "🚨 <b>Алерты</b>\n\n"
+            "✅ Алертов нет\n\n"
+            "Всё работает нормально!"
+        )
+    else:
+        alerts_text = "🚨 <b>Последние алерты</b>\n\n"
+        for alert, router in reversed(recent_alerts):
+            icon = '🔴' if alert.get('severity') == 'critical' else '🟡'
+            alerts_text += (
+                f"{icon} <b>{alert['type'].upper()}</b>"
+                + (f" · {router.name}" if len(scope) > 1 else "") + "\n"
+                f"├ Значение: {alert['value']}\n"
+                f"├ Порог: {alert['threshold']}\n"
+                f"└ {alert['timestamp'][:16]}\n\n"
+            )
+    edit_telegram_message(ctx.chat_id, ctx.message_id, alerts_text, reply_markup=get_back_button())
+
+@callbacks.route('stats')
+def handle_stats(ctx):
+    scope = chat_routers(ctx.chat_id)
+    show_cached_view(ctx, scoped_view('stats', scope), state.generation('metrics'),
+                     lambda: render_stats(scope))
+
+def render_stats(scope):
+    reporting = [router for router in scope if router.metrics.history['timestamps']]
+    if reporting:
+        stats_text = "📈 <b>Статистика за 24ч</b>\n\n"
+        for router in reporting:
+            history = router.metrics.history
+            # Calculate statistics
+            avg_ram = sum(history['ram_percent']) / len(history['ram_percent'])
+            max_ram = max(history['ram_percent'])
+            avg_cpu = sum(history['cpu_load1']) / len(history['cpu_load1'])
+            max_cpu = max(history['cpu_load1'])
+            
+            if len(scope) > 1:
+                stats_text += f"🤖 <b>{router.name}</b>\n"
+            stats_text += (
+                f"💾 <b>RAM:</b>\n"
+                f"├ Средняя: {avg_ram:.1f}%\n"
+                f"└ Максимум: {max_ram:.1f}%\n\n"
+                f"🔥 <b>CPU:</b>\n"
+                f"├ Средняя: {avg_cpu:.2f}\n"
+                f"└ Максимум: {max_cpu:.2f}\n\n"
+            )
+        stats_text += (
+            f"📊 <b>Данных:</b>\n"
+            f"├ Метрик: {sum(len(router.metrics) for router in scope)}\n"
+            f"└ Алертов: {sum(len(router.metrics.history['alerts']) for router in scope)}"
+        )
+    else:
+        stats_text = (
+            "📈 <b>Статистика</b>\n\n"
+            "⏳ Недостаточно данных\n"
+            "Подождите накопления метрик"
+        )
+    return stats_text, get_chart_buttons() if reporting else get_back_button()
+
+# chart_<metric>_<window>: metric field, title, unit, Router threshold attribute
+CHART_METRICS = {
+    'ram': ('ram_percent', 'RAM', '%', 'ram_threshold'),
+    'cpu': ('cpu_load1', 'CPU load', '', 'cpu_threshold')
+}
+# window: (label, x tick step seconds, tick format, max gap seconds before the line breaks)
+CHART_WINDOWS = {
+    '24h': ('24ч', 4 * 3600, '%H:%M', 600),
+    '7d': ('7д', 86400, '%d.%m', 3 * 3600)
+}
+
+@callbacks.prefix('chart_')
+def handle_chart(ctx):
+    """Send one chart per reporting router of the chat.
+
+    24h is drawn from the raw samples, 7d from completed hourly averages. The
+    cache key includes the data generation, so an unchanged series is neither
+    re-rendered nor re-uploaded: the photo is resent by its file_id.
+    """
+    metric, _, window = ctx.arg.partition('_')
+    if metric not in CHART_METRICS or window not in CHART_WINDOWS:
+        return None
+    field, title, unit, threshold_attr = CHART_METRICS[metric]
+    scope = chat_routers(ctx.chat_id)
+    sent = 0
+    for router in scope:
+        store = router.metrics
+        if window == '24h':
+            generation = store.generation
+            # Plain snapshot: rendering happens outside state.lock
+            points = list(zip(store.history['timestamps'], store.history[field]))
+        else:
+            generation = store.hourly.generation
+            points = [(f'{hour}:30:00', value) for hour, value in store.hourly.completed(field)]
+        if not points:
+            continue
+        caption = f"📉 <b>{title}</b> · {CHART_WINDOWS[window][0]}"
+        if len(scope) > 1:
+            caption += f" · {router.name}"
+        chart_executor.submit(send_chart, ctx.chat_id, (router.id, field, window, generation),
+                              points, window, getattr(router, threshold_attr), unit, caption)
+        sent += 1
+    return "📉 Строю график..." if sent else "⏳ Недостаточно данных"
+
+def send_chart(chat_id, key, points, window, threshold, unit, caption):
+    """Render (or take from cache) and send one chart; runs on chart_executor"""
+    def render():
+        series = [(timestamp_seconds(timestamp), value) for timestamp, value in points]
+        # The x range follows the data, so one generation always gives the same picture
+        end = series[-1][0] + (1800 if window == '7d' else 0)
+        start = end - (7 * 86400 if window == '7d' else 86400)
+        _, step, fmt, max_gap = CHART_WINDOWS[window]
+        return render_line_chart(series, start, end, x_ticks=time_ticks(start, end, step, 3, fmt),
+                                 threshold=threshold, unit=unit, max_gap=max_gap)
+
+    try:
+        entry = chart_cache.get(key, render)
+    except Exception:
+        logger.exception(f"Chart {key} failed to render")
+        return
+    payload = {'chat_id': chat_id, 'caption': caption, 'parse_mode': 'HTML'}
+    if entry['file_id']:
+        chart_cache.reuse()
+        telegram.submit('sendPhoto', dict(payload, photo=entry['file_id']))
+        return
+    future = telegram.submit('sendPhoto', payload, files={'photo': ('chart.png', entry['png'], 'image/png')})
+    future.add_done_callback(lambda f: remember_chart_file_id(entry, f))
+
+def remember_chart_file_id(entry, future):
+    if future.exception() is not None:
+        return
+    photo = (future.result() or {}).get('photo') or []
+    if photo:
+        # Sizes ascend: the last one is the original upload
+        chart_cache.set_file_id(entry, photo[-1]['file_id'])
+
+@callbacks.route('build_later')
+def handle_build_later(ctx):
+    edit_telegram_message(ctx.chat_id, ctx.message_id, "⏰ Хорошо, напомню позже!")
+
+@callbacks.route('build_skip')
+def handle_build_skip(ctx):
+    edit_telegram_message(ctx.chat_id, ctx.message_id, "❌ Обновление пропущено")
+
+@callbacks.prefix('build_')
+def handle_build(ctx):
+    commit = ctx.arg
+    if not config.GITHUB_TOKEN:
+        edit_telegram_message(ctx.chat_id, ctx.message_id,
+                              "⚠️ <b>GitHub не настроен</b>\n\nЗадайте GITHUB_TOKEN, чтобы запускать сборку")
+        return None
+    # The tracker thread dispatches the workflow and edits the message on every status change
+    build, started = build_tracker.start(commit, (ctx.chat_id, ctx.message_id))
+    if started:
+        logger.info(f"Build requested for commit: {commit}")
+        return None
+    edit_telegram_message(ctx.chat_id, ctx.message_id, build_progress_text(build), reply_markup=build_keyboard(build))
+    return "Сборка этого commit уже идёт"
+
+BUILD_STATUS_TEXT = {
+    'dispatching': "⏳ Запускаю workflow...",
+    'queued': "🕐 В очереди GitHub Actions",
+    'in_progress': "🔨 Собирается (~2-3 минуты)",
+    'waiting': "🕐 Ожидает",
+    'pending': "🕐 В очереди GitHub Actions"
+}
+
+def build_progress_text(build):
+    text = f"🔨 <b>Сборка geosite</b>\n\nCommit: <code>{build.commit}</code>\n\n"
+    if build.error is not None:
+        return text + f"❌ <b>Ошибка:</b> {build.error}"
+    if build.status == 'completed':
+        if build.conclusion == 'success':
+            return text + "✅ <b>Готово!</b> Релиз опубликован"
+        return text + f"❌ <b>Сборка завершилась:</b> {build.conclusion}"
+    return text + BUILD_STATUS_TEXT.get(build.status, build.status)
+
+def build_keyboard(build):
+    if not build.html_url:
+        return None
+    return {"inline_keyboard": [[{"text": "🔗 GitHub Actions", "url": build.html_url}]]}
+
+@callbacks.route('alert_ack')
+def handle_alert_ack(ctx):
+    # Update button to show it was acknowledged
+    telegram.submit('editMessageReplyMarkup', {
+        'chat_id': ctx.chat_id,
+        'message_id': ctx.message_id,
+        'reply_markup': {'inline_keyboard': [[{"text": "✅ Прочитано", "callback_data": "none"}]]}
+    })
+    return '✅ Алерт отмечен как прочитанный'
+
+@callbacks.route('iot_menu')
+@callbacks.prefix('iot_menu_page_')
+def handle_iot_menu(ctx):
+    page = int(ctx.arg) if ctx.arg.isdigit() else 0
+    # Uptime is shown with minute precision, so the minute is part of the version
+    version = (state.generation('iot'), int(time.time() // 60))
+    show_cached_view(ctx, f'iot_menu:{page}', version, lambda: render_iot_menu(page))
+
+def render_iot_menu(page=0):
+    # Totals over all devices, status lines only for devices on this page
+    online_count = sum(1 for device in iot_devices_history.values() if device['status'] == 'connected')
+    rooms, page, pages = device_registry.page(page, config.IOT_MENU_PAGE_SIZE)
+    
+    status_lines = []
+    for room in rooms:
+        device = iot_devices_history[room]
+        status_icon = "✅" if device['status'] == 'connected' else "⚠️" if device['status'] == 'disconnected' else "❓"
+        uptime = format_uptime(device['uptime_start']) if device['uptime_start'] else "unknown"
+        status_lines.append(f"{status_icon} {device['name']}   (uptime: {uptime})")
+    
+    iot_menu_text = (
+        "🏠 <b>IoT Устройства</b>\n\n"
+        + (f"📊 Статус устройств (стр. {page + 1}/{pages}):\n" if pages > 1 else "📊 Статус всех устройств:\n")
+        + "\n".join(status_lines) + "\n\n"
+        f"Всего устройств: {len(iot_devices_history)}\n"
+        f"Онлайн: {online_count} | Офлайн: {len(iot_devices_history) - online_count}\n\n"
+        "Выберите устройство:"
+    )
+    return iot_menu_text, get_iot_menu(page)
+
+@callbacks.prefix('iot_device_')
+@callbacks.prefix('iot_refresh_')
+def handle_iot_device(ctx):
+    room = ctx.arg
+    if room not in iot_devices_history:
+        error_text = f"❌ Устройство не найдено: {room}"
+        edit_telegram_message(ctx.chat_id, ctx.message_id, error_text, reply_markup=get_iot_back_button())
+        return
+    
+    device = iot_devices_history[room]
+    status_icon = "✅" if device['status'] == 'connected' else "❌"
+    
+    uptime = "unknown"
+    if device['uptime_start'] and device['status'] == 'connected':
+        uptime = format_uptime(device['uptime_start'])
+    
+    # Get stats
+    disconnects_24h = device['stats_24h']['disconnects'].total()
+    
+    device_text = (
+        f"{device['icon']} <b>{device['name']}</b>\n\n"
+        f"📊 Статус: {status_icon} {'Подключена' if device['status'] == 'connected' else 'Отключена'}\n"
+        f"🕐 Работает: {uptime}\n"
+        f"📡 Сигнал: {device['signal'] or 'unknown'}\n"
+        f"🔄 IP: {device['ip']}\n"
+        f"🏠 Комната: {device['name'].split()[-1]}\n"
+    )
+    
+    if device['last_seen']:
+        try:
+            device_text += f"⏰ Последнее событие: {format_moscow_time(device['last_seen'], '%d.%m %H:%M')}\n"
+        except ValueError:
+            pass
+    
+    device_text += (
+        f"\n📈 За 24 часа:\n"
+        f"├ Отключений: {disconnects_24h} раз\n"
+    )
+    
+    # Last event
+    last_event = device['events'].last()
+    if last_event:
+        event_type = last_event['type']
+        event_icon = "❌" if event_type == 'disconnect' else "✅"
+        device_text += f"└ Последнее событие: {event_icon} {event_type}\n"
+    
+    edit_telegram_message(ctx.chat_id, ctx.message_id, device_text, reply_markup=get_iot_device_buttons(room))
+
+@callbacks.route('iot_history')
+def handle_iot_history_all(ctx):
+    all_events = []
+    for room, device in iot_devices_history.items():
+        for event in device['events'].latest(10):  # Last 10 per device
+            all_events.append({
+                'device': device['name'],
+                'icon': device['icon'],
+                'ts': event['ts'],
+                'timestamp': event['timestamp'],
+                'type': event['type'],
+                'uptime': event.get('uptime', ''),
+                'signal': event.get('signal', '')
+            })
+    
+    # Sort by timestamp descending
+    all_events.sort(key=lambda x: x['ts'], reverse=True)
+    
+    history_text = "📊 <b>История IoT устройств</b>\n\nПоследние 20 событий:\n\n"
+    
+    for event in all_events[:20]:
+        try:
+            event_icon = "❌" if event['type'] == 'disconnect' else "✅"
+            history_text += f"{format_moscow_time(event['timestamp'], '%d.%m %H:%M')} {event['icon']} {event['device']}\n"
+            history_text += f"{event_icon} {event['type']}"
+            if event.get('uptime'):
+                history_text += f" ({event['uptime']})"
+            history_text += "\n\n"
+        except ValueError:
+            pass
+    
+    edit_telegram_message(ctx.chat_id, ctx.message_id, history_text, reply_markup=get_iot_back_button())
+
+@callbacks.prefix('iot_history_')
+def handle_iot_history(ctx):
+    room = ctx.arg
+    if room not in iot_devices_history:
+        error_text = f"❌ Устройство не найдено: {room}"
+        edit_telegram_message(ctx.chat_id, ctx.message_id, error_text, reply_markup=get_iot_back_button())
+        return
+    
+    device = iot_devices_history[room]
+    history_text = f"📊 <b>История: {device['name']}</b>\n\nПоследние 10 событий:\n\n"
+    
+    for event in device['events'].latest(10):
+        try:
+            event_icon = "❌" if event['type'] == 'disconnect' else "✅"
+            history_text += f"{format_moscow_time(event['timestamp'], '%d.%m %H:%M')} {event_icon} {event['type']}\n"
+            if event.get('uptime'):
+                history_text += f"├ Работала: {event['uptime']}\n"
+            if event.get('signal'):
+                history_text += f"└ Сигнал: {event['signal']}\n"
+            history_text += "\n"
+        except ValueError:
+            pass
+    
+    edit_telegram_message(ctx.chat_id, ctx.message_id, history_text, reply_markup=get_iot_device_buttons(room))
+
+@callbacks.prefix('iot_mute_1h_')
+def handle_iot_mute(ctx):
+    room = ctx.arg
+    if room not in iot_devices_history:
+        return None
+    
+    device = iot_devices_history[room]
+    mute_until = datetime.now() + timedelta(hours=1)
+    muted_until = mute_until.isoformat()
+    with state.lock:
+        device['muted_until'] = muted_until
+        state.bump('iot')
+    scheduler.schedule(f"mute:{room}", mute_until.timestamp(), lambda: expire_mute(room, muted_until))
+    
+    # Update message to show muted status
+    muted_text = (
+        f"🔇 <b>{device['name']}</b>\n\n"
+        f"Уведомления отключены до {format_moscow_time(mute_until, '%H:%M')}\n\n"
+        f"Устройство будет продолжать мониториться,\n"
+        f"но уведомления не будут отправляться."
+    )
+    edit_telegram_message(ctx.chat_id, ctx.message_id, muted_text, reply_markup=get_iot_device_buttons(room))
+    return f'🔇 {device["name"]} - уведомления выключены на 1 час'
+
+@callbacks.route('iot_settings')
+def handle_iot_settings(ctx):
+    settings_text = (
+        "⚙️ <b>Настройки IoT мониторинга</b>\n\n"
+    )
+    
+    # With many devices list only those with non-default settings
+    compact = len(iot_devices_history) > config.IOT_MENU_PAGE_SIZE
+    hidden = 0
+    
+    for room, device in iot_devices_history.items():
+        notify_status = "✅ Включены" if device.get('notify', True) else "❌ Выключены"
+        muted = ""
+        if device.get('muted_until'):
+            try:
+                mute_until = datetime.fromisoformat(device['muted_until'])
+                if datetime.now() < mute_until:
+                    muted = f"\n├ 🔇 Тихо до {format_moscow_time(mute_until, '%H:%M')}"
+            except ValueError:
+                pass
+        
+        if compact and not muted and device.get('notify', True):
+            hidden += 1
+            continue
+        
+        settings_text += (
+            f"{device['icon']} <b>{device['name']}</b>\n"
+            f"├ Уведомления: {notify_status}{muted}\n"
+            f"└ Отключение: ✅ Каждое\n\n"
+        )
+    
+    if hidden:
+        settings_text += f"… ещё {hidden} устройств с уведомлениями по умолчанию\n\n"
+    
+    settings_text += (
+        f"🔔 Общие настройки:\n"
+        f"├ Частые отключения: >{config.IOT_DISCONNECT_THRESHOLD}/час\n"
+        f"└ Критичный офлайн: >{config.IOT_CRITICAL_OFFLINE_MIN} мин"
+    )
+    
+    edit_telegram_message(ctx.chat_id, ctx.message_id, settings_text, reply_markup=get_iot_back_button())
+
 @app.route('/telegram/webhook', methods=['POST'])
 def telegram_webhook():
     """Handle Telegram bot webhook"""
     try:
         update = request.json
-        logger.info(f"Telegram update received: {update}")
+        logger.info("Telegram update %s received", update.get('update_id'))
+        logger.debug("Telegram update: %s", update)
         
         # Handle callback queries (button presses)
         if 'callback_query' in update:
@@ -645,391 +1599,32 @@ def telegram_webhook():
                 return jsonify({'error': 'missing data'}), 400
             
             # Verify chat
-            if str(chat_id) != str(config.TELEGRAM_CHAT_ID):
+            if str(chat_id) not in allowed_chat_ids:
                 logger.warning(f"Unauthorized callback from chat: {chat_id}")
                 return jsonify({'status': 'ignored'})
             
-            # Answer callback to remove loading state
-            answer_result = requests.post(
-                f"{TELEGRAM_API}/answerCallbackQuery",
-                json={'callback_query_id': callback_id}
-            )
-            logger.info(f"Callback answer result: {answer_result.status_code}")
-            
-            # Handle different callbacks
-            if callback_data == 'menu' or callback_data == 'refresh':
-                welcome_text = (
-                    "🤖 <b>Geosite Manager</b>\n\n"
-                    "Управление OpenWrt роутером\n\n"
-                    "🔹 <b>Мониторинг:</b> RAM, CPU, WiFi\n"
-                    "🔹 <b>Geosite:</b> Автообновления\n"
-                    "🔹 <b>Алерты:</b> Критические события\n\n"
-                    "Выберите действие:"
-                )
-                edit_telegram_message(chat_id, message_id, welcome_text, reply_markup=get_main_menu())
+            # Handlers read shared state and only queue Telegram calls: cheap to run under the lock
+            with state.lock:
+                handled, answer_text = callbacks.dispatch(chat_id, message_id, callback_id, callback_data)
+            if not handled:
+                logger.warning(f"Unknown callback: {callback_data}")
             
-            elif callback_data == 'status':
-                status_text = (
-                    "⚙️ <b>Статус системы</b>\n\n"
-                    f"✅ <b>Railway:</b> Online\n"
-                    f"✅ <b>Webhooks:</b> Активны\n"
-                    f"📊 <b>Метрик:</b> {len(metrics_history['timestamps'])}\n"
-                    f"🚨 <b>Алертов:</b> {len(metrics_history['alerts'])}\n\n"
-                    f"🔧 <b>Конфигурация:</b>\n"
-                    f"├ RAM limit: {config.RAM_THRESHOLD}%\n"
-                    f"├ CPU limit: {config.CPU_THRESHOLD}\n"
-                    f"└ Категорий: {len(config.GEOSITE_CATEGORIES)}\n\n"
-                    f"🌐 <b>Router:</b> 192.168.31.1\n"
-                    f"📡 <b>Updates:</b> Каждые 5 мин"
-                )
-                edit_telegram_message(chat_id, message_id, status_text, reply_markup=get_back_button())
-            
-            elif callback_data == 'dashboard':
-                if not metrics_history['timestamps']:
-                    dashboard_text = (
-                        "📊 <b>Dashboard</b>\n\n"
-                        "⏳ Метрики еще не собраны.\n"
-                        "Ожидайте первого обновления\n"
-                        "(каждые 5 минут)"
-                    )
-                else:
-                    ram = metrics_history['ram_percent'][-1] if metrics_history['ram_percent'] else 0
-                    cpu = metrics_history['cpu_load1'][-1] if metrics_history['cpu_load1'] else 0
-                    clients = metrics_history['clients'][-1] if metrics_history['clients'] else 0
-                    clash_mem = metrics_history['openclash_memory'][-1] if metrics_history['openclash_memory'] else 0
-                    
-                    # RAM bar
-                    ram_bars = '█' * (int(ram) // 10) + '░' * (10 - int(ram) // 10)
-                    ram_status = '🟢' if ram < 70 else '🟡' if ram < 85 else '🔴'
-                    
-                    dashboard_text = (
-                        "📊 <b>Router Dashboard</b>\n\n"
-                        f"💾 <b>RAM:</b> {ram}% {ram_status}\n"
-                        f"{ram_bars}\n\n"
-                        f"🔥 <b>CPU Load:</b> {cpu}\n"
-                        f"{'🟢 Normal' if cpu < 2.0 else '🟡 High' if cpu < 3.0 else '🔴 Critical'}\n\n"
-                        f"📡 <b>WiFi:</b> {clients} клиентов\n"
-                        f"🌐 <b>OpenClash:</b> {clash_mem}m\n\n"
-                        f"📈 Собрано метрик: {len(metrics_history['timestamps'])}"
-                    )
-                edit_telegram_message(chat_id, message_id, dashboard_text, reply_markup=get_back_button())
-            
-            elif callback_data == 'alerts':
-                if not metrics_history['alerts']:
-                    alerts_text = (
-                        "🚨 <b>Алерты</b>\n\n"
-                        "✅ Алертов нет\n\n"
-                        "Всё работает нормально!"
-                    )
-                else:
-                    recent_alerts = metrics_history['alerts'][-5:]
-                    alerts_text = "🚨 <b>Последние алерты</b>\n\n"
-                    for i, alert in enumerate(recent_alerts, 1):
-                        icon = '🔴' if alert.get('severity') == 'critical' else '🟡'
-                        alerts_text += (
-                            f"{icon} <b>{alert['type'].upper()}</b>\n"
-                            f"├ Значение: {alert['value']}\n"
-                            f"├ Порог: {alert['threshold']}\n"
-                            f"└ {alert['timestamp'][:16]}\n\n"
-                        )
-                edit_telegram_message(chat_id, message_id, alerts_text, reply_markup=get_back_button())
-            
-            elif callback_data == 'stats':
-                if metrics_history['timestamps']:
-                    # Calculate statistics
-                    avg_ram = sum(metrics_history['ram_percent']) / len(metrics_history['ram_percent'])
-                    max_ram = max(metrics_history['ram_percent']) if metrics_history['ram_percent'] else 0
-                    avg_cpu = sum(metrics_history['cpu_load1']) / len(metrics_history['cpu_load1'])
-                    max_cpu = max(metrics_history['cpu_load1']) if metrics_history['cpu_load1'] else 0
-                    
-                    stats_text = (
-                        "📈 <b>Статистика за 24ч</b>\n\n"
-                        f"💾 <b>RAM:</b>\n"
-                        f"├ Средняя: {avg_ram:.1f}%\n"
-                        f"└ Максимум: {max_ram:.1f}%\n\n"
-                        f"🔥 <b>CPU:</b>\n"
-                        f"├ Средняя: {avg_cpu:.2f}\n"
-                        f"└ Максимум: {max_cpu:.2f}\n\n"
-                        f"📊 <b>Данных:</b>\n"
-                        f"├ Метрик: {len(metrics_history['timestamps'])}\n"
-                        f"└ Алертов: {len(metrics_history['alerts'])}"
-                    )
-                else:
-                    stats_text = (
-                        "📈 <b>Статистика</b>\n\n"
-                        "⏳ Недостаточно данных\n"
-                        "Подождите накопления метрик"
-                    )
-                edit_telegram_message(chat_id, message_id, stats_text, reply_markup=get_back_button())
-            
-            elif callback_data.startswith('build_'):
-                commit = callback_data.replace('build_', '')
-                if commit == 'later':
-                    response_text = "⏰ Хорошо, напомню позже!"
-                elif commit == 'skip':
-                    response_text = "❌ Обновление пропущено"
-                else:
-                    # TODO: Trigger actual build via GitHub Actions
-                    response_text = (
-                        f"🔨 <b>Сборка запущена!</b>\n\n"
-                        f"Commit: <code>{commit}</code>\n\n"
-                        "⏳ Это займёт ~2-3 минуты\n"
-                        "Я уведомлю когда будет готово!"
-                    )
-                    logger.info(f"Build triggered for commit: {commit}")
-                
-                edit_telegram_message(chat_id, message_id, response_text)
-            
-            elif callback_data == 'alert_ack':
-                # Answer callback to show "Принято" notification
-                requests.post(f"{TELEGRAM_API}/answerCallbackQuery", json={
-                    'callback_query_id': callback_id,
-                    'text': '✅ Алерт отмечен как прочитанный',
-                    'show_alert': False
-                }, timeout=10)
-                
-                # Update button to show it was acknowledged
-                requests.post(f"{TELEGRAM_API}/editMessageReplyMarkup", json={
-                    'chat_id': chat_id,
-                    'message_id': message_id,
-                    'reply_markup': {'inline_keyboard': [[{"text": "✅ Прочитано", "callback_data": "none"}]]}
-                }, timeout=10)
-            
-            # Handle IoT menu
-            elif callback_data == 'iot_menu':
-                from datetime import datetime
-                
-                # Build status summary
-                status_lines = []
-                online_count = 0
-                for room, device in iot_devices_history.items():
-                    status_icon = "✅" if device['status'] == 'connected' else "⚠️" if device['status'] == 'disconnected' else "❓"
-                    if device['status'] == 'connected':
-                        online_count += 1
-                    
-                    # Calculate uptime
-                    uptime = "unknown"
-                    if device['uptime_start']:
-                        try:
-                            start = datetime.fromisoformat(device['uptime_start'])
-                            delta = datetime.now() - start
-                            days = delta.days
-                            hours = delta.seconds // 3600
-                            if days > 0:
-                                uptime = f"{days}д {hours}ч"
-                            else:
-                                uptime = f"{hours}ч {(delta.seconds % 3600) // 60}м"
-                        except:
-                            uptime = "unknown"
-                    
-                    status_lines.append(f"{status_icon} {device['name']}   (uptime: {uptime})")
-                
-                iot_menu_text = (
-                    "🏠 <b>IoT Устройства</b>\n\n"
-                    "📊 Статус всех устройств:\n"
-                    + "\n".join(status_lines) + "\n\n"
-                    f"Всего устройств: {len(iot_devices_history)}\n"
-                    f"Онлайн: {online_count} | Офлайн: {len(iot_devices_history) - online_count}\n\n"
-                    "Выберите устройство:"
-                )
-                edit_telegram_message(chat_id, message_id, iot_menu_text, reply_markup=get_iot_menu())
-            
-            # Handle IoT device details
-            elif callback_data.startswith('iot_device_'):
-                from datetime import datetime
-                room = callback_data.replace('iot_device_', '')
-                
-                if room in iot_devices_history:
-                    device = iot_devices_history[room]
-                    status_icon = "✅" if device['status'] == 'connected' else "❌"
-                    
-                    # Calculate uptime
-                    uptime = "unknown"
-                    if device['uptime_start'] and device['status'] == 'connected':
-                        try:
-                            start = datetime.fromisoformat(device['uptime_start'])
-                            delta = datetime.now() - start
-                            hours = delta.seconds // 3600
-                            minutes = (delta.seconds % 3600) // 60
-                            if delta.days > 0:
-                                uptime = f"{delta.days}д {hours}ч"
-                            else:
-                                uptime = f"{hours}ч {minutes}м"
-                        except:
-                            uptime = "unknown"
-                    
-                    # Get stats
-                    disconnects_24h = device['stats_24h']['disconnects']
-                    
-                    device_text = (
-                        f"{device['icon']} <b>{device['name']}</b>\n\n"
-                        f"📊 Статус: {status_icon} {'Подключена' if device['status'] == 'connected' else 'Отключена'}\n"
-                        f"🕐 Работает: {uptime}\n"
-                        f"📡 Сигнал: {device['signal'] or 'unknown'}\n"
-                        f"🔄 IP: {device['ip']}\n"
-                        f"🏠 Комната: {device['name'].split()[-1]}\n"
-                    )
-                    
-                    if device['last_seen']:
-                        try:
-                            device_text += f"⏰ Последнее событие: {format_moscow_time(device['last_seen'], '%d.%m %H:%M')}\n"
-                        except:
-                            pass
-                    
-                    device_text += (
-                        f"\n📈 За 24 часа:\n"
-                        f"├ Отключений: {disconnects_24h} раз\n"
-                    )
-                    
-                    # Last event
-                    if device['events']:
-                        last_event = device['events'][0]
-                        event_type = last_event['type']
-                        event_icon = "❌" if event_type == 'disconnect' else "✅"
-                        device_text += f"└ Последнее событие: {event_icon} {event_type}\n"
-                    
-                    edit_telegram_message(chat_id, message_id, device_text, reply_markup=get_iot_device_buttons(room))
-                else:
-                    error_text = f"❌ Устройство не найдено: {room}"
-                    edit_telegram_message(chat_id, message_id, error_text, reply_markup=get_iot_back_button())
-            
-            # Handle IoT history
-            elif callback_data.startswith('iot_history'):
-                from datetime import datetime
-                
-                if callback_data == 'iot_history':
-                    # All devices history
-                    all_events = []
-                    for room, device in iot_devices_history.items():
-                        for event in device['events'][:10]:  # Last 10 per device
-                            all_events.append({
-                                'device': device['name'],
-                                'icon': device['icon'],
-                                'timestamp': event['timestamp'],
-                                'type': event['type'],
-                                'uptime': event.get('uptime', ''),
-                                'signal': event.get('signal', '')
-                            })
-                    
-                    # Sort by timestamp descending
-                    all_events.sort(key=lambda x: x['timestamp'], reverse=True)
-                    
-                    history_text = "📊 <b>История IoT устройств</b>\n\nПоследние 20 событий:\n\n"
-                    
-                    for event in all_events[:20]:
-                        try:
-                            event_icon = "❌" if event['type'] == 'disconnect' else "✅"
-                            history_text += f"{format_moscow_time(event['timestamp'], '%d.%m %H:%M')} {event['icon']} {event['device']}\n"
-                            history_text += f"{event_icon} {event['type']}"
-                            if event.get('uptime'):
-                                history_text += f" ({event['uptime']})"
-                            history_text += "\n\n"
-                        except:
-                            pass
-                    
-                    edit_telegram_message(chat_id, message_id, history_text, reply_markup=get_iot_back_button())
-                else:
-                    # Specific device history
-                    room = callback_data.replace('iot_history_', '')
-                    if room in iot_devices_history:
-                        device = iot_devices_history[room]
-                        history_text = f"📊 <b>История: {device['name']}</b>\n\nПоследние 10 событий:\n\n"
-                        
-                        for event in device['events'][:10]:
-                            try:
-                                event_icon = "❌" if event['type'] == 'disconnect' else "✅"
-                                history_text += f"{format_moscow_time(event['timestamp'], '%d.%m %H:%M')} {event_icon} {event['type']}\n"
-                                if event.get('uptime'):
-                                    history_text += f"├ Работала: {event['uptime']}\n"
-                                if event.get('signal'):
-                                    history_text += f"└ Сигнал: {event['signal']}\n"
-                                history_text += "\n"
-                            except:
-                                pass
-                        
-                        edit_telegram_message(chat_id, message_id, history_text, reply_markup=get_iot_device_buttons(room))
-                    else:
-                        error_text = f"❌ Устройство не найдено: {room}"
-                        edit_telegram_message(chat_id, message_id, error_text, reply_markup=get_iot_back_button())
-            
-            # Handle IoT mute
-            elif callback_data.startswith('iot_mute_1h_'):
-                from datetime import datetime, timedelta
-                room = callback_data.replace('iot_mute_1h_', '')
-                
-                if room in iot_devices_history:
-                    device = iot_devices_history[room]
-                    mute_until = datetime.now() + timedelta(hours=1)
-                    device['muted_until'] = mute_until.isoformat()
-                    
-                    requests.post(f"{TELEGRAM_API}/answerCallbackQuery", json={
-                        'callback_query_id': callback_id,
-                        'text': f'🔇 {device["name"]} - уведомления выключены на 1 час',
-                        'show_alert': False
-                    }, timeout=10)
-                    
-                    # Update message to show muted status
-                    muted_text = (
-                        f"🔇 <b>{device['name']}</b>\n\n"
-                        f"Уведомления отключены до {format_moscow_time(mute_until, '%H:%M')}\n\n"
-                        f"Устройство будет продолжать мониториться,\n"
-                        f"но уведомления не будут отправляться."
-                    )
-                    edit_telegram_message(chat_id, message_id, muted_text, reply_markup=get_iot_device_buttons(room))
-            
-            # Handle IoT settings
-            elif callback_data == 'iot_settings':
-                settings_text = (
-                    "⚙️ <b>Настройки IoT мониторинга</b>\n\n"
-                )
-                
-                for room, device in iot_devices_history.items():
-                    notify_status = "✅ Включены" if device.get('notify', True) else "❌ Выключены"
-                    muted = ""
-                    if device.get('muted_until'):
-                        try:
-                            mute_until = datetime.fromisoformat(device['muted_until'])
-                            if datetime.now() < mute_until:
-                                muted = f"\n├ 🔇 Тихо до {format_moscow_time(mute_until, '%H:%M')}"
-                        except:
-                            pass
-                    
-                    settings_text += (
-                        f"{device['icon']} <b>{device['name']}</b>\n"
-                        f"├ Уведомления: {notify_status}{muted}\n"
-                        f"└ Отключение: ✅ Каждое\n\n"
-                    )
-                
-                settings_text += (
-                    f"🔔 Общие настройки:\n"
-                    f"├ Частые отключения: >{config.IOT_DISCONNECT_THRESHOLD}/час\n"
-                    f"└ Критичный офлайн: >{config.IOT_CRITICAL_OFFLINE_MIN} мин"
-                )
-                
-                edit_telegram_message(chat_id, message_id, settings_text, reply_markup=get_iot_back_button())
+            # Answer callback once to remove loading state (queued, doesn't block webhook)
+            answer_callback_query(callback_id, answer_text)
             
             return jsonify({'status': 'ok'})
         
         # Handle regular messages
         message = update.get('message', {})
         chat_id = message.get('chat', {}).get('id')
-        text = message.get('text', '')
         
         # Only respond to configured chat
-        if str(chat_id) != str(config.TELEGRAM_CHAT_ID):
+        if str(chat_id) not in allowed_chat_ids:
             logger.warning(f"Unauthorized chat: {chat_id}")
             return jsonify({'status': 'ignored'})
         
         # Handle /start or any text message
-        welcome_text = (
-            "🤖 <b>Geosite Manager</b>\n\n"
-            "Управление OpenWrt роутером\n\n"
-            "🔹 <b>Мониторинг:</b> RAM, CPU, WiFi\n"
-            "🔹 <b>Geosite:</b> Автообновления\n"
-            "🔹 <b>Алерты:</b> Критические события\n\n"
-            "Выберите действие:"
-        )
-        send_telegram_message(welcome_text, reply_markup=get_main_menu())
+        send_telegram_message(WELCOME_TEXT, reply_markup=get_main_menu(), chat_id=chat_id)
         
         return jsonify({'status': 'ok'})
     
@@ -1037,6 +1632,16 @@ def telegram_webhook():
         logger.error(f"Error processing Telegram webhook: {e}")
         return jsonify({'error': str(e)}), 500
 
+def shutdown():
+    """Stop background senders: pending notifications stay in NOTIFY_QUEUE_FILE"""
+    scheduler.stop()
+    build_tracker.stop()
+    chart_executor.shutdown(wait=False)
+    notifier.stop()
+    telegram.close()
+    github.close()
+    async_logging.stop()
+
 if __name__ == '__main__':
     logger.info("Starting OpenWRTrouter Bot...")
     logger.info(f"Bot Token configured: {bool(config.TELEGRAM_BOT_TOKEN)}")
@@ -0,0 +1,77 @@
+"""
+Callback query dispatch for Telegram inline buttons
+Exact-match dict lookup with a prefix trie fallback
+"""
+from collections import namedtuple
+
+# chat_id, message_id, callback_id - from the callback query
+# data - full callback_data, arg - remainder after the matched prefix ('' for exact routes)
+CallbackContext = namedtuple('CallbackContext', 'chat_id message_id callback_id data arg')
+
+
+class _TrieNode:
+    __slots__ = ('children', 'handler')
+
+    def __init__(self):
+        self.children = {}
+        self.handler = None
+
+
+class CallbackRouter:
+    """Registry of callback_data handlers.
+
+    Exact routes are a single dict lookup. Prefix routes live in a character trie,
+    so lookup cost depends on the length of callback_data (max 64 bytes in Telegram),
+    not on the number of registered routes. The longest matching prefix wins.
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._trie = _TrieNode()
+
+    def route(self, data):
+        """Decorator: register handler for exact callback_data"""
+        def decorator(handler):
+            self._exact[data] = handler
+            return handler
+        return decorator
+
+    def prefix(self, prefix):
+        """Decorator: register handler for callback_data starting with prefix"""
+        def decorator(handler):
+            node = self._trie
+            for char in prefix:
+                node = node.children.setdefault(char, _TrieNode())
+            node.handler = handler
+            return handler
+        return decorator
+
+    def resolve(self, data):
+        """Find (handler, arg) for callback_data, or (None, None)"""
+        handler = self._exact.get(data)
+        if handler is not None:
+            return handler, ''
+
+        node = self._trie
+        match, match_len = None, 0
+        for i, char in enumerate(data):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.handler is not None:
+                match, match_len = node.handler, i + 1
+        if match is None:
+            return None, None
+        return match, data[match_len:]
+
+    def dispatch(self, chat_id, message_id, callback_id, data):
+        """Run handler for callback_data.
+
+        Returns (handled, answer_text): answer_text is what the handler wants to show
+        in the answerCallbackQuery toast (None for a plain answer).
+        """
+        handler, arg = self.resolve(data)
+        if handler is None:
+            return False, None
+        ctx = CallbackContext(chat_id, message_id, callback_id, data, arg)
+        return True, handler(ctx)
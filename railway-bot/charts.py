@@ -0,0 +1,242 @@
+"""
+Metric charts as PNG
+Pure-Python line chart rasterizer (palette PNG via zlib) and a cache of rendered images / Telegram file_ids
+"""
+import math
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+WIDTH, HEIGHT = 720, 360
+LEFT, RIGHT, TOP, BOTTOM = 56, 16, 16, 32
+SCALE = 2  # font pixel size
+
+# Palette indices
+BACKGROUND, GRID, AXIS, LINE, THRESHOLD, FILL = range(6)
+PALETTE = bytes([
+    255, 255, 255,   # background
+    226, 230, 236,   # grid
+    90, 96, 106,     # axis, labels
+    33, 111, 219,    # series
+    214, 48, 49,     # threshold
+    216, 230, 250,   # area under series
+])
+
+# 3x5 glyphs, one row per string, '#' = pixel
+FONT = {
+    '0': ('###', '#.#', '#.#', '#.#', '###'),
+    '1': ('.#.', '##.', '.#.', '.#.', '###'),
+    '2': ('###', '..#', '###', '#..', '###'),
+    '3': ('###', '..#', '###', '..#', '###'),
+    '4': ('#.#', '#.#', '###', '..#', '..#'),
+    '5': ('###', '#..', '###', '..#', '###'),
+    '6': ('###', '#..', '###', '#.#', '###'),
+    '7': ('###', '..#', '.#.', '.#.', '.#.'),
+    '8': ('###', '#.#', '###', '#.#', '###'),
+    '9': ('###', '#.#', '###', '..#', '###'),
+    '.': ('...', '...', '...', '...', '.#.'),
+    ':': ('...', '.#.', '...', '.#.', '...'),
+    '%': ('#.#', '..#', '.#.', '#..', '#.#'),
+    '-': ('...', '...', '###', '...', '...'),
+    'm': ('...', '...', '###', '###', '#.#'),
+    ' ': ('...', '...', '...', '...', '...'),
+}
+
+
+class Canvas:
+    """Palette-indexed pixel buffer"""
+
+    def __init__(self, width, height, color=BACKGROUND):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray([color]) * (width * height)
+
+    def set(self, x, y, color):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y * self.width + x] = color
+
+    def hline(self, x0, x1, y, color, dash=0):
+        for x in range(max(0, x0), min(self.width, x1 + 1)):
+            if not dash or (x // dash) % 2 == 0:
+                self.set(x, y, color)
+
+    def vline(self, x, y0, y1, color):
+        for y in range(max(0, y0), min(self.height, y1 + 1)):
+            self.set(x, y, color)
+
+    def line(self, x0, y0, x1, y1, color):
+        """Bresenham line, 2 px thick"""
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+        error = dx + dy
+        while True:
+            self.set(x0, y0, color)
+            self.set(x0, y0 + 1, color)
+            if x0 == x1 and y0 == y1:
+                return
+            doubled = 2 * error
+            if doubled >= dy:
+                error += dy
+                x0 += sx
+            if doubled <= dx:
+                error += dx
+                y0 += sy
+
+    def text(self, x, y, text, color, align='left'):
+        width = len(text) * 4 * SCALE - SCALE
+        if align == 'right':
+            x -= width
+        elif align == 'center':
+            x -= width // 2
+        for char in text:
+            for row, bits in enumerate(FONT.get(char, FONT[' '])):
+                for column, bit in enumerate(bits):
+                    if bit == '#':
+                        for py in range(SCALE):
+                            for px in range(SCALE):
+                                self.set(x + column * SCALE + px, y + row * SCALE + py, color)
+            x += 4 * SCALE
+
+    def png(self):
+        raw = b''.join(b'\x00' + bytes(self.pixels[y * self.width:(y + 1) * self.width])
+                       for y in range(self.height))
+
+        def chunk(kind, data):
+            return (struct.pack('>I', len(data)) + kind + data
+                    + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+        header = struct.pack('>IIBBBBB', self.width, self.height, 8, 3, 0, 0, 0)
+        return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'PLTE', PALETTE)
+                + chunk(b'IDAT', zlib.compress(raw, 9)) + chunk(b'IEND', b''))
+
+
+def nice_step(span, ticks=5):
+    """1 / 2 / 5 x 10^k step giving about `ticks` intervals over span"""
+    raw = span / ticks
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for factor in (1, 2, 5):
+        if raw <= factor * magnitude:
+            return factor * magnitude
+    return 10 * magnitude
+
+
+def format_value(value, step):
+    return f'{value:.{max(0, -math.floor(math.log10(step)))}f}'
+
+
+def time_ticks(start, end, step, utc_offset_hours, fmt):
+    """(epoch, label) at local-time multiples of step seconds between start and end"""
+    offset = utc_offset_hours * 3600
+    first = ((start + offset) // step + 1) * step - offset
+    tz = timezone(timedelta(hours=utc_offset_hours))
+    ticks = []
+    t = first
+    while t <= end:
+        ticks.append((t, datetime.fromtimestamp(t, tz).strftime(fmt)))
+        t += step
+    return ticks
+
+
+def render_line_chart(points, start, end, x_ticks=(), threshold=None, unit='', max_gap=None):
+    """PNG bytes of (epoch, value) points over [start, end].
+
+    The y axis starts at 0 and covers the data and the threshold; gaps longer
+    than max_gap seconds (a router that stopped reporting) break the line.
+    """
+    canvas = Canvas(WIDTH, HEIGHT)
+    plot_w, plot_h = WIDTH - LEFT - RIGHT, HEIGHT - TOP - BOTTOM
+    top_value = max([value for _, value in points] + [threshold or 0, 0])
+    step = nice_step(top_value * 1.1 or 1)
+    y_max = step * (int(top_value * 1.1 / step) + 1)
+
+    def x_of(t):
+        return LEFT + round((t - start) / max(1, end - start) * plot_w)
+
+    def y_of(value):
+        return TOP + plot_h - round(value / y_max * plot_h)
+
+    # Grid and y labels
+    value = 0
+    while value <= y_max + step / 1000:
+        y = y_of(value)
+        canvas.hline(LEFT, LEFT + plot_w, y, GRID)
+        canvas.text(LEFT - 6, y - 5, format_value(value, step) + unit, AXIS, align='right')
+        value += step
+    for t, label in x_ticks:
+        x = x_of(t)
+        canvas.vline(x, TOP, TOP + plot_h, GRID)
+        canvas.text(x, TOP + plot_h + 8, label, AXIS, align='center')
+
+    # Area and line
+    segments = []
+    previous = None
+    for t, value in points:
+        point = (x_of(t), y_of(value))
+        if previous is not None and not (max_gap and t - previous[0] > max_gap):
+            segments.append((previous[1], point))
+        previous = (t, point)
+    for (x0, y0), (x1, y1) in segments:
+        for x in range(x0, x1 + 1):
+            y = y0 + (y1 - y0) * (x - x0) // max(1, x1 - x0)
+            canvas.vline(x, y + 2, TOP + plot_h - 1, FILL)
+    if threshold is not None and threshold <= y_max:
+        canvas.hline(LEFT, LEFT + plot_w, y_of(threshold), THRESHOLD, dash=6)
+    for (x0, y0), (x1, y1) in segments:
+        canvas.line(x0, y0, x1, y1, LINE)
+    if len(points) == 1:
+        x, y = x_of(points[0][0]), y_of(points[0][1])
+        for dx in (-1, 0, 1):
+            canvas.vline(x + dx, y - 1, y + 1, LINE)
+
+    # Axes
+    canvas.vline(LEFT, TOP, TOP + plot_h, AXIS)
+    canvas.hline(LEFT, LEFT + plot_w, TOP + plot_h, AXIS)
+    return canvas.png()
+
+
+class ChartCache:
+    """Rendered charts keyed by (router, metric, window, data generation), LRU.
+
+    An entry keeps the PNG and, once Telegram has it, the photo file_id:
+    a repeated request for the same data costs neither rendering nor upload.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> {'png': bytes, 'file_id': str or None}
+        self.renders = 0
+        self.uploads = 0
+        self.reused = 0
+
+    def get(self, key, render):
+        """Entry for key, calling render() -> PNG bytes on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        entry = {'png': render(), 'file_id': None}
+        with self._lock:
+            self.renders += 1
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def set_file_id(self, entry, file_id):
+        """Photo uploaded: later sends of this entry reference it by file_id"""
+        with self._lock:
+            entry['file_id'] = file_id
+            self.uploads += 1
+
+    def reuse(self):
+        with self._lock:
+            self.reused += 1
+
+    def stats(self):
+        with self._lock:
+            return {'renders': self.renders, 'uploads': self.uploads, 'reused': self.reused,
+                    'entries': len(self._entries)}
@@ -10,25 +10,81 @@ load_dotenv()
 # Telegram Configuration
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID', '')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')  # можно указать локальный fake Bot API
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '8'))  # keep-alive соединений к Bot API
+TELEGRAM_SEND_WORKERS = int(os.getenv('TELEGRAM_SEND_WORKERS', '4'))  # потоков фоновой отправки
+TELEGRAM_TIMEOUT = float(os.getenv('TELEGRAM_TIMEOUT', '10'))
 
 # GitHub Configuration  
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN', '')
 GITHUB_REPO = os.getenv('GITHUB_REPO', 'susaninz/custom-geosite')
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')  # можно указать локальный fake GitHub API
+GITHUB_WORKFLOW = os.getenv('GITHUB_WORKFLOW', 'build-geosite.yml')  # workflow, запускаемый кнопкой build_<commit>
+GITHUB_REF = os.getenv('GITHUB_REF', 'main')
+GITHUB_POLL_MIN = float(os.getenv('GITHUB_POLL_MIN', '5'))  # опрос статуса run: от N секунд,
+GITHUB_POLL_MAX = float(os.getenv('GITHUB_POLL_MAX', '60'))  # удваивается до N, пока ничего не меняется
+GITHUB_BUILD_TIMEOUT = int(os.getenv('GITHUB_BUILD_TIMEOUT', '3600'))
 
 # Webhook Security
 WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', 'openwrt_yandex_stations_2025')
 
+# Logging (asynchronous, secrets and chat ids are redacted)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Доля INFO-записей по route, например: /telegram/webhook=0.1,/webhook/monitoring=0.2
+LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# Prometheus scrape endpoint /metrics (Bearer token, empty = open)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Routers (multi-router mode)
+# JSON-список роутеров в ROUTERS_FILE или переменной ROUTERS:
+# [{"id": "home", "name": "Home", "token": "...", "chat_id": "...", "ram_threshold": 85, "cpu_threshold": 3.0}]
+# Если не задано - один роутер ROUTER_ID с токеном WEBHOOK_SECRET
+ROUTERS_FILE = os.getenv('ROUTERS_FILE', '')
+ROUTERS_JSON = os.getenv('ROUTERS', '')
+ROUTER_ID = os.getenv('ROUTER_ID', 'main')
+ROUTER_NAME = os.getenv('ROUTER_NAME', 'OpenWrt')
+METRICS_MAX_RECORDS = int(os.getenv('METRICS_MAX_RECORDS', '1440'))  # 24 часа при сэмплах раз в минуту
+METRICS_BATCH_MAX_SAMPLES = int(os.getenv('METRICS_BATCH_MAX_SAMPLES', '1440'))  # лимит сэмплов в одном batch-запросе
+
+# Notification Queue (coalescing + rate limiting)
+NOTIFY_COALESCE_SECONDS = int(os.getenv('NOTIFY_COALESCE_SECONDS', '60'))  # окно склейки событий одного типа
+NOTIFY_RATE_PER_SEC = float(os.getenv('NOTIFY_RATE_PER_SEC', '1'))  # лимит Telegram ~1 сообщение/сек в чат
+NOTIFY_BURST = int(os.getenv('NOTIFY_BURST', '3'))
+NOTIFY_QUEUE_FILE = os.getenv('NOTIFY_QUEUE_FILE', '/tmp/geosite_bot_notify_queue.json')
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '10'))
+
 # Geosite Categories
+# Начальное значение: после каждой сборки заменяется списком из /webhook/build-complete
+# (категории выводятся из конфига OpenClash, см. scripts/config_categories.py)
 GEOSITE_CATEGORIES = os.getenv(
     'GEOSITE_CATEGORIES',
-    'category-ads-all,instagram,facebook,twitter,youtube,netflix,soundcloud,kinopub,category-ai-!cn,category-gov-ru'
+    'cn,instagram,facebook,twitter,youtube,netflix,soundcloud,kinopub,category-ai-!cn'
 ).split(',')
 
-# Monitoring Thresholds
+# Monitoring Thresholds (оцениваются ботом по потоку /webhook/monitoring, см. alerting.py)
 RAM_THRESHOLD = int(os.getenv('RAM_THRESHOLD', '85'))
 CPU_THRESHOLD = float(os.getenv('CPU_THRESHOLD', '3.0'))
+ALERT_SETTINGS = {
+    'sustain': int(os.getenv('ALERT_SUSTAIN_SECONDS', '180')),  # условие должно держаться N секунд
+    'ram_hysteresis': float(os.getenv('ALERT_RAM_HYSTERESIS', '5')),  # алерт снимается ниже порога на N п.п.
+    'cpu_hysteresis': float(os.getenv('ALERT_CPU_HYSTERESIS', '0.5')),
+    'ewma_alpha': float(os.getenv('ALERT_EWMA_ALPHA', '0.05')),  # вес нового сэмпла в среднем (~20 минут)
+    'zscore': float(os.getenv('ALERT_ZSCORE', '4')),  # аномалия: отклонение больше N сигм
+    'warmup': int(os.getenv('ALERT_WARMUP_SAMPLES', '30')),  # сэмплов до первых выводов об аномалиях
+}
+ALERT_MAX_AGE_SECONDS = int(os.getenv('ALERT_MAX_AGE_SECONDS', '900'))  # старые (backfill) алерты не отправлять
+
+# IoT Devices Registry
+# Список устройств: JSON-файл (IOT_DEVICES_FILE) или JSON в переменной IOT_DEVICES,
+# формат как у YANDEX_STATIONS ниже. Если не заданы - используется YANDEX_STATIONS.
+IOT_DEVICES_FILE = os.getenv('IOT_DEVICES_FILE', '')
+IOT_DEVICES_JSON = os.getenv('IOT_DEVICES', '')
+IOT_AUTO_REGISTER = os.getenv('IOT_AUTO_REGISTER', 'true').lower() == 'true'  # регистрировать новые MAC из webhook
+IOT_MENU_PAGE_SIZE = int(os.getenv('IOT_MENU_PAGE_SIZE', '8'))  # устройств на странице меню
 
-# Yandex Stations Configuration
+# Yandex Stations Configuration (default device list)
 YANDEX_STATIONS = {
     'living_room': {
         'name': 'Мини в гостиной',
@@ -36,6 +92,7 @@ YANDEX_STATIONS = {
         'mac': 'ac:ba:c0:54:f2:16',
         'ip': '192.168.31.140',
         'icon': '📱',
+        'label': 'Гостиная',
         'notify': True  # проблемная станция
     },
     'bedroom': {
@@ -44,6 +101,7 @@ YANDEX_STATIONS = {
         'mac': '3c:0b:4f:de:d8:3c',
         'ip': '192.168.31.102',
         'icon': '📱',
+        'label': 'Спальня',
         'notify': True
     },
     'kitchen': {
@@ -52,6 +110,7 @@ YANDEX_STATIONS = {
         'mac': '3c:0b:4f:5d:02:78',
         'ip': '192.168.31.131',
         'icon': '🔊',
+        'label': 'Кухня',
         'notify': True
     }
 }
@@ -59,7 +118,7 @@ YANDEX_STATIONS = {
 # IoT Monitoring Settings
 IOT_DISCONNECT_THRESHOLD = 3  # алерт если >3 отключений за час
 IOT_CRITICAL_OFFLINE_MIN = 30  # критический алерт если офлайн >30 минут
-IOT_MAX_EVENTS_PER_DEVICE = 100  # хранить последние 100 событий
+IOT_MAX_EVENTS_PER_DEVICE = int(os.getenv('IOT_MAX_EVENTS_PER_DEVICE', '1000'))  # хранить последние N событий
 
 # Port for Railway
 PORT = int(os.getenv('PORT', '8080'))
@@ -0,0 +1,153 @@
+"""
+IoT device registry
+Devices loaded from file/environment, hash indexes by room, MAC, hostname and IP
+"""
+import json
+import logging
+
+from iot_events import EventLog, WindowCounter
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_mac(mac):
+    """'AC-BA-C0-54-F2-16' / 'acbac054f216' -> 'ac:ba:c0:54:f2:16'"""
+    digits = ''.join(c for c in (mac or '').lower() if c in '0123456789abcdef')
+    if len(digits) != 12:
+        return (mac or '').lower()
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+def load_device_config(path='', env_json='', default=None):
+    """Load device definitions: JSON file, then JSON from environment, then default.
+
+    Accepted formats: {"room": {...}, ...} or [{"room": "...", ...}, ...]
+    """
+    raw = None
+    if path:
+        try:
+            with open(path) as f:
+                raw = json.load(f)
+            logger.info(f"Loaded IoT devices from {path}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load IoT devices from {path}: {e}")
+    if raw is None and env_json:
+        try:
+            raw = json.loads(env_json)
+        except ValueError as e:
+            logger.error(f"Invalid IOT_DEVICES JSON: {e}")
+    if raw is None:
+        raw = default or {}
+
+    if isinstance(raw, list):
+        return {item['room']: item for item in raw}
+    return raw
+
+
+class DeviceRegistry:
+    """Monitored IoT devices with O(1) lookup by room, MAC, hostname or IP.
+
+    `devices` is the room -> device state dict used by the webhook and menus.
+    """
+
+    def __init__(self, max_events=1000):
+        self.max_events = max_events
+        self.devices = {}
+        self._order = []      # rooms in registration order (menu pagination)
+        self._by_mac = {}
+        self._by_hostname = {}
+        self._by_ip = {}
+
+    def register(self, room, name, hostname='', mac='', ip='', icon='📱',
+                 notify=True, label=None, auto=False):
+        """Add device (or return existing one for this room)"""
+        if room in self.devices:
+            return self.devices[room]
+
+        device = {
+            'name': name,
+            'label': label or name,
+            'hostname': hostname,
+            'mac': normalize_mac(mac),
+            'ip': ip,
+            'icon': icon,
+            'notify': notify,
+            'auto_registered': auto,
+            'status': 'unknown',  # unknown, connected, disconnected
+            'last_seen': None,
+            'uptime_start': None,
+            'signal': None,
+            'events': EventLog(self.max_events),  # oldest-first, epoch timestamps
+            'stats_24h': {
+                'disconnects': WindowCounter(86400, 24),  # скользящее окно 24ч, шаг 1ч
+                'connects': WindowCounter(86400, 24)
+            },
+            'muted_until': None  # timestamp для функции "тихо 1ч"
+        }
+        self.devices[room] = device
+        self._order.append(room)
+        if device['mac']:
+            self._by_mac[device['mac']] = room
+        if hostname:
+            self._by_hostname[hostname.lower()] = room
+        if ip:
+            self._by_ip[ip] = room
+        return device
+
+    def load(self, definitions):
+        """Register devices from {room: {name, hostname, mac, ip, icon, notify, label}}"""
+        for room, item in definitions.items():
+            self.register(
+                room,
+                item.get('name', room),
+                hostname=item.get('hostname', ''),
+                mac=item.get('mac', ''),
+                ip=item.get('ip', ''),
+                icon=item.get('icon', '📱'),
+                notify=item.get('notify', True),
+                label=item.get('label')
+            )
+
+    def resolve(self, room=None, mac=None, hostname=None, ip=None):
+        """Find room id by any known identifier (checked in that order)"""
+        if room and room in self.devices:
+            return room
+        if mac:
+            found = self._by_mac.get(normalize_mac(mac))
+            if found:
+                return found
+        if hostname:
+            found = self._by_hostname.get(hostname.lower())
+            if found:
+                return found
+        if ip:
+            return self._by_ip.get(ip)
+        return None
+
+    def auto_register(self, mac, name='', hostname='', ip=''):
+        """Register device first seen in webhook traffic, keyed by its MAC"""
+        mac = normalize_mac(mac)
+        room = 'auto_' + mac.replace(':', '')
+        device = self.register(room, name or hostname or mac, hostname=hostname,
+                               mac=mac, ip=ip, icon='❔', auto=True)
+        logger.info(f"Auto-registered IoT device {room} ({device['name']})")
+        return room
+
+    def update_ip(self, room, ip):
+        """Keep IP index in sync when a device gets a new DHCP lease"""
+        device = self.devices[room]
+        if not ip or device['ip'] == ip:
+            return
+        if self._by_ip.get(device['ip']) == room:
+            del self._by_ip[device['ip']]
+        device['ip'] = ip
+        self._by_ip[ip] = room
+
+    def page(self, page, per_page):
+        """Rooms on menu page (0-based) and total page count"""
+        pages = max(1, -(-len(self._order) // per_page))
+        page = min(max(page, 0), pages - 1)
+        return self._order[page * per_page:(page + 1) * per_page], page, pages
+
+    def __len__(self):
+        return len(self.devices)
@@ -0,0 +1,118 @@
+"""
+Fake GitHub Actions API
+Local stand-in for the endpoints github_client uses: workflow_dispatch creates a run
+that goes queued -> in_progress -> completed, GETs answer 304 to a matching ETag.
+
+Usage:
+    python fake_github.py --port 9998 --step 10 [--conclusion failure]
+    GITHUB_API_URL=http://127.0.0.1:9998 GITHUB_TOKEN=test python app.py
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    """Runs advance one status every `step` seconds after dispatch"""
+    protocol_version = 'HTTP/1.1'
+    step = 10.0
+    conclusion = 'success'
+    runs = []
+    lock = threading.Lock()
+    rate_remaining = 5000
+    not_modified = 0
+
+    @classmethod
+    def run_state(cls, run):
+        stage = int((time.time() - run['_dispatched']) // cls.step)
+        status = ('queued', 'in_progress', 'completed')[min(stage, 2)]
+        return dict({key: value for key, value in run.items() if not key.startswith('_')},
+                    status=status, conclusion=cls.conclusion if status == 'completed' else None)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        match = re.fullmatch(r'/repos/([^/]+/[^/]+)/actions/workflows/([^/]+)/dispatches', self.path)
+        if not match:
+            return self.reply(404, {'message': 'Not Found'})
+        request_id = (body.get('inputs') or {}).get('request_id', '')
+        with self.lock:
+            run_id = len(self.runs) + 1
+            self.runs.append({
+                'id': run_id,
+                'name': 'Build Custom Geosite',
+                'display_title': f'Build Custom Geosite ({request_id})' if request_id else 'Build Custom Geosite',
+                'event': 'workflow_dispatch',
+                'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'html_url': f'https://github.com/{match.group(1)}/actions/runs/{run_id}',
+                '_dispatched': time.time(),
+            })
+        self.reply(204, None)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with self.lock:
+            runs = [self.run_state(run) for run in reversed(self.runs)]
+        match = re.fullmatch(r'/repos/[^/]+/[^/]+/actions/runs/(\d+)', url.path)
+        if match:
+            found = [run for run in runs if run['id'] == int(match.group(1))]
+            return self.reply(200, found[0]) if found else self.reply(404, {'message': 'Not Found'})
+        if re.fullmatch(r'/repos/[^/]+/[^/]+/actions/workflows/[^/]+/runs', url.path):
+            if 'status' in query:
+                runs = [run for run in runs if run['status'] == query['status']]
+            if query.get('created', '').startswith('>='):
+                runs = [run for run in runs if run['created_at'] >= query['created'][2:]]
+            return self.reply(200, {'total_count': len(runs), 'workflow_runs': runs})
+        self.reply(404, {'message': 'Not Found'})
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+        with self.lock:
+            if status == 200 and self.headers.get('If-None-Match') == etag:
+                # Like GitHub: a 304 doesn't use up the rate limit
+                FakeGitHubHandler.not_modified += 1
+                status, body = 304, b''
+            else:
+                FakeGitHubHandler.rate_remaining -= 1
+            remaining = self.rate_remaining
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-RateLimit-Remaining', str(remaining))
+        if status in (200, 304):
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=9998)
+    parser.add_argument('--step', type=float, default=10.0, help='seconds per run status')
+    parser.add_argument('--conclusion', default='success')
+    args = parser.parse_args()
+
+    FakeGitHubHandler.step = args.step
+    FakeGitHubHandler.conclusion = args.conclusion
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), FakeGitHubHandler)
+    print(f"Fake GitHub API on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"Rate limit used: {5000 - FakeGitHubHandler.rate_remaining}, "
+          f"304 answers: {FakeGitHubHandler.not_modified}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+GitHub Actions client
+workflow_dispatch of the geosite build and run tracking with conditional (ETag) polling
+"""
+import logging
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# run-name of a bot-dispatched run ends in " (<request_id>)"; other runs are titled
+# with the workflow name alone, which has no parentheses
+RUN_REQUEST_ID_RE = re.compile(r' \(([^()\s]+)\)$')
+
+
+class GitHubError(Exception):
+    """GitHub REST API call failed"""
+
+    def __init__(self, method, path, status_code, message, retry_after=None):
+        super().__init__(f"{method} {path}: HTTP {status_code}, {message}")
+        self.status_code = status_code
+        self.message = message
+        self.retry_after = retry_after
+
+
+class GitHubClient:
+    """GitHub REST client over one pooled requests.Session.
+
+    GETs are conditional: the last ETag and body per URL are kept and sent back
+    as If-None-Match, and a 304 answer returns the cached body. Authenticated
+    304 responses don't count against the rate limit, so polling an unchanged
+    run is free.
+    """
+
+    def __init__(self, token, repo, api_url='https://api.github.com', pool_size=2, timeout=10):
+        self.repo = repo
+        self.base_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Accept': 'application/vnd.github+json',
+            'X-GitHub-Api-Version': '2022-11-28',
+        })
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._etags = {}  # (path, params) -> (etag, body)
+        self.max_etags = 64
+        self.requests = 0
+        self.not_modified = 0
+        self.rate_remaining = None
+
+    def request(self, method, path, json=None, params=None):
+        """Send request, parsed JSON body (None if empty) or raise GitHubError"""
+        key = (path, tuple(sorted((params or {}).items())))
+        headers = {}
+        cached = None
+        if method == 'GET':
+            with self._lock:
+                cached = self._etags.get(key)
+            if cached is not None:
+                headers['If-None-Match'] = cached[0]
+
+        response = self.session.request(method, f"{self.base_url}{path}", json=json, params=params,
+                                        headers=headers, timeout=self.timeout)
+        with self._lock:
+            self.requests += 1
+            remaining = response.headers.get('X-RateLimit-Remaining')
+            if remaining is not None:
+                self.rate_remaining = int(remaining)
+            if response.status_code == 304 and cached is not None:
+                self.not_modified += 1
+                return cached[1]
+
+        if response.status_code >= 400:
+            try:
+                message = response.json().get('message', '')
+            except ValueError:
+                message = response.text
+            retry_after = response.headers.get('Retry-After')
+            if retry_after is None and response.headers.get('X-RateLimit-Remaining') == '0':
+                reset = response.headers.get('X-RateLimit-Reset')
+                retry_after = max(1, int(reset) - int(time.time())) if reset else None
+            raise GitHubError(method, path, response.status_code, message,
+                              int(retry_after) if retry_after is not None else None)
+
+        body = response.json() if response.content else None
+        etag = response.headers.get('ETag')
+        if method == 'GET' and etag:
+            with self._lock:
+                self._etags.pop(key, None)
+                self._etags[key] = (etag, body)
+                # Oldest first: runs lists of past dispatches, finished runs
+                while len(self._etags) > self.max_etags:
+                    del self._etags[next(iter(self._etags))]
+        return body
+
+    def dispatch_workflow(self, workflow, ref, inputs):
+        """POST workflow_dispatch (GitHub answers 204 without the run id)"""
+        self.request('POST', f'/repos/{self.repo}/actions/workflows/{workflow}/dispatches',
+                     json={'ref': ref, 'inputs': inputs})
+
+    def workflow_runs(self, workflow, **params):
+        """Runs of one workflow, newest first"""
+        body = self.request('GET', f'/repos/{self.repo}/actions/workflows/{workflow}/runs', params=params)
+        return (body or {}).get('workflow_runs', [])
+
+    def run(self, run_id):
+        return self.request('GET', f'/repos/{self.repo}/actions/runs/{run_id}')
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'not_modified': self.not_modified}
+
+    def close(self):
+        self.session.close()
+
+
+class Build:
+    """One requested build: dispatch id, tracked run and the messages showing it"""
+
+    def __init__(self, commit, request_id):
+        self.commit = commit
+        self.request_id = request_id
+        self.status = 'dispatching'  # then GitHub run status: queued / in_progress / completed
+        self.conclusion = None       # success / failure / cancelled ... once completed
+        self.run_id = None
+        self.html_url = None
+        self.error = None
+        self.watchers = []           # (chat_id, message_id)
+
+    @property
+    def finished(self):
+        return self.status == 'completed' or self.error is not None
+
+
+class BuildTracker:
+    """workflow_dispatch per commit, deduplicated, with run status tracking.
+
+    A second request for a commit that is already building attaches to the
+    running build instead of dispatching again; so does a request that finds a
+    dispatched run for the commit still queued or running on GitHub (e.g. after
+    a bot restart). The run is found by the request id in its run-name, then
+    polled on a background thread: conditional GETs, interval doubling from
+    `poll_min` up to `poll_max` while nothing changes and reset on every change.
+    `on_update(build)` is called on each status change, from the tracker thread.
+    """
+
+    def __init__(self, client, workflow, ref, on_update, poll_min=5, poll_max=60,
+                 find_timeout=120, build_timeout=3600):
+        self.client = client
+        self.workflow = workflow
+        self.ref = ref
+        self.on_update = on_update
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.find_timeout = find_timeout
+        self.build_timeout = build_timeout
+        self._lock = threading.Lock()
+        self._builds = {}  # commit -> Build
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _run_request_id(run):
+        match = RUN_REQUEST_ID_RE.search(run.get('display_title') or '')
+        return match.group(1) if match else None
+
+    def start(self, commit, watcher):
+        """(build, started): started is False if the request joined a running build"""
+        with self._lock:
+            build = self._builds.get(commit)
+            if build is not None and not build.finished:
+                if watcher not in build.watchers:
+                    build.watchers.append(watcher)
+                return build, False
+            build = Build(commit, f'{commit}-{uuid.uuid4().hex[:6]}')
+            build.watchers.append(watcher)
+            self._builds[commit] = build
+        threading.Thread(target=self._track, args=(build,), name=f'build-{commit}', daemon=True).start()
+        return build, True
+
+    def active(self):
+        """Number of builds being dispatched or tracked"""
+        with self._lock:
+            return sum(not build.finished for build in self._builds.values())
+
+    def stop(self):
+        self._stopped.set()
+
+    def _track(self, build):
+        self._notify(build)
+        try:
+            run = self._existing_run(build) or self._dispatch(build)
+            self._follow(build, run)
+        except Exception as e:
+            logger.error(f"Build {build.request_id} tracking failed: {e}")
+            build.error = str(e)
+            self._notify(build)
+
+    def _existing_run(self, build):
+        """Active dispatched run for the same commit, if any"""
+        for status in ('in_progress', 'queued'):
+            for run in self.client.workflow_runs(self.workflow, event='workflow_dispatch', status=status):
+                request_id = self._run_request_id(run)
+                if request_id and request_id.rpartition('-')[0] == build.commit:
+                    logger.info(f"Build {build.commit}: attaching to run {run['id']}")
+                    return run
+        return None
+
+    def _dispatch(self, build):
+        """Dispatch and wait for the run to show up, its first state"""
+        dispatched = datetime.now(timezone.utc) - timedelta(seconds=60)
+        self.client.dispatch_workflow(self.workflow, self.ref, {'force_build': 'true', 'commit': build.commit,
+                                                                'request_id': build.request_id})
+        logger.info(f"Build {build.request_id} dispatched")
+        build.status = 'queued'
+        self._notify(build)
+
+        created = dispatched.strftime('>=%Y-%m-%dT%H:%M:%SZ')
+        deadline = time.monotonic() + self.find_timeout
+        interval = self.poll_min
+        while time.monotonic() < deadline:
+            if self._stopped.wait(interval):
+                raise RuntimeError('tracker stopped')
+            for run in self.client.workflow_runs(self.workflow, event='workflow_dispatch', created=created):
+                if self._run_request_id(run) == build.request_id:
+                    return run
+            interval = min(interval * 2, self.poll_max)
+        raise RuntimeError(f'run not found {self.find_timeout}s after dispatch')
+
+    def _follow(self, build, run):
+        deadline = time.monotonic() + self.build_timeout
+        interval = self.poll_min
+        while True:
+            changed = self._apply(build, run)
+            if changed:
+                self._notify(build)
+                interval = self.poll_min
+            else:
+                interval = min(interval * 2, self.poll_max)
+            if build.finished:
+                return
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'run {build.run_id} not finished after {self.build_timeout}s')
+            if self._stopped.wait(interval):
+                return
+            try:
+                run = self.client.run(build.run_id)
+            except GitHubError as e:
+                if e.status_code < 500 and e.retry_after is None:
+                    raise
+                logger.warning(f"Build {build.request_id} poll failed: {e}")
+                interval = max(interval, e.retry_after or 0)
+
+    def _apply(self, build, run):
+        state = (run['id'], run.get('status'), run.get('conclusion'))
+        if state == (build.run_id, build.status, build.conclusion):
+            return False
+        build.run_id, build.status, build.conclusion = state
+        build.html_url = run.get('html_url')
+        return True
+
+    def _notify(self, build):
+        try:
+            self.on_update(build)
+        except Exception:
+            logger.exception(f"Build {build.request_id} update handler failed")
@@ -0,0 +1,28 @@
+"""
+Gunicorn production config
+Single process, thread pool: bot state (metrics, IoT devices, caches) is in memory
+"""
+import os
+
+import config
+
+bind = f"0.0.0.0:{config.PORT}"
+
+# State lives in the worker process - more workers would split it.
+# Concurrency comes from threads; Telegram calls never block request threads.
+workers = 1
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '8'))
+
+timeout = int(os.getenv('WEB_TIMEOUT', '30'))
+graceful_timeout = 10
+keepalive = 5  # router scripts and Telegram reuse connections
+
+accesslog = '-' if os.getenv('WEB_ACCESS_LOG', 'false').lower() == 'true' else None
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    """Flush queued Telegram calls and persist pending notifications"""
+    from app import shutdown
+    shutdown()
@@ -0,0 +1,125 @@
+"""
+IoT device event log
+Oldest-first event storage with epoch timestamps, bisect window queries and sliding-window counters
+"""
+import bisect
+import time
+from collections import Counter
+
+
+class EventLog:
+    """Bounded per-device event log, ordered oldest-first by epoch timestamp.
+
+    Appends are O(1) amortized (out-of-order events are inserted with bisect),
+    "how many events of type X in the last N seconds" is O(log n) per query.
+    """
+
+    def __init__(self, max_events=1000):
+        self.max_events = max_events
+        self._times = []    # epoch seconds, ascending
+        self._events = []   # event dicts, same order as _times
+        self._by_type = {}  # event type -> ascending epoch list
+
+    def append(self, ts, event):
+        """Add event with epoch timestamp ts"""
+        if not self._times or ts >= self._times[-1]:
+            self._times.append(ts)
+            self._events.append(event)
+        else:
+            index = bisect.bisect_right(self._times, ts)
+            self._times.insert(index, ts)
+            self._events.insert(index, event)
+        bisect.insort(self._by_type.setdefault(event['type'], []), ts)
+        self._trim()
+
+    def _trim(self):
+        # Drop oldest events in chunks so trimming stays amortized O(1) per append
+        excess = len(self._times) - self.max_events
+        if excess <= 0 or excess < max(1, self.max_events // 10):
+            return
+        # Same events out of _by_type as out of the main list: per type, the oldest n.
+        # (Trimming by timestamp would also drop kept events sharing the cutoff timestamp.)
+        removed = Counter(event['type'] for event in self._events[:excess])
+        del self._times[:excess]
+        del self._events[:excess]
+        for event_type, n in removed.items():
+            del self._by_type[event_type][:n]
+
+    def count_since(self, since_ts, event_type=None):
+        """Number of events (optionally of one type) with timestamp > since_ts"""
+        times = self._times if event_type is None else self._by_type.get(event_type, [])
+        return len(times) - bisect.bisect_right(times, since_ts)
+
+    def since(self, since_ts):
+        """Events with timestamp > since_ts, oldest-first"""
+        return self._events[bisect.bisect_right(self._times, since_ts):]
+
+    def latest(self, n=10):
+        """Last n events, newest-first"""
+        return self._events[:-n - 1:-1] if n > 0 else []
+
+    def last(self):
+        return self._events[-1] if self._events else None
+
+    def __len__(self):
+        return len(self._events)
+
+    def __bool__(self):
+        return bool(self._events)
+
+
+class WindowCounter:
+    """Sliding-window event counter over `window` seconds split into `buckets` slots.
+
+    Expired slots are cleared lazily on access, so counts decay on time without
+    keeping individual events. Precision is window / buckets.
+    """
+
+    def __init__(self, window=86400, buckets=24):
+        self.window = window
+        self.buckets = buckets
+        self.bucket_size = window / buckets
+        self._counts = [0] * buckets
+        self._slots = [None] * buckets  # absolute slot number currently stored in each bucket
+
+    def add(self, ts=None, amount=1):
+        """Count events at ts; events already outside the window are ignored"""
+        now = time.time()
+        ts = now if ts is None else ts
+        slot = int(ts // self.bucket_size)
+        if slot <= int(now // self.bucket_size) - self.buckets:
+            return
+        index = slot % self.buckets
+        stored = self._slots[index]
+        if stored is not None and stored > slot:
+            # Late event for a slot this bucket has already moved past
+            return
+        if stored != slot:
+            self._slots[index] = slot
+            self._counts[index] = 0
+        self._counts[index] += amount
+
+    def total(self, now=None):
+        """Sum of events within the window ending at now"""
+        now = time.time() if now is None else now
+        current = int(now // self.bucket_size)
+        oldest = current - self.buckets + 1
+        total = 0
+        for index, slot in enumerate(self._slots):
+            if slot is not None and oldest <= slot <= current:
+                total += self._counts[index]
+        return total
+
+    def next_expiry(self):
+        """Epoch time when the oldest non-empty bucket leaves the window (None if empty)"""
+        slots = [slot for slot, count in zip(self._slots, self._counts) if slot is not None and count]
+        return (min(slots) + self.buckets) * self.bucket_size if slots else None
+
+    def roll(self, now=None):
+        """Clear expired buckets (total() ignores them anyway; keeps next_expiry() current)"""
+        now = time.time() if now is None else now
+        oldest = int(now // self.bucket_size) - self.buckets + 1
+        for index, slot in enumerate(self._slots):
+            if slot is not None and slot < oldest:
+                self._slots[index] = None
+                self._counts[index] = 0
@@ -0,0 +1,223 @@
+"""
+Webhook load test
+Fires router / IoT / Telegram webhooks at the bot with a local fake Telegram API
+and reports throughput and latency percentiles.
+
+Usage:
+    python loadtest.py                                   # bot in-process (threaded server)
+    python loadtest.py --requests 5000 --concurrency 32 --telegram-latency 0.5
+    python loadtest.py --url http://127.0.0.1:8080 --secret $WEBHOOK_SECRET --chat-id $TELEGRAM_CHAT_ID
+        # running gunicorn; start it with TELEGRAM_API_URL=http://127.0.0.1:<--telegram-port>
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    """Answers every Bot API method with ok after `latency` seconds"""
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    calls = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.latency)
+        with self.lock:
+            FakeTelegramHandler.calls += 1
+        body = json.dumps({'ok': True, 'result': {'message_id': 1}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_requests(secret, chat_id):
+    """Request mix: (kind, path, headers, body) cycled by the workers"""
+    auth = {'Authorization': f'Bearer {secret}', 'Content-Type': 'application/json'}
+    start = datetime(2030, 1, 1)
+
+    def monitoring(i):
+        ts = (start + timedelta(seconds=i)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return json.dumps({'timestamp': ts, 'ram': {'percent': 40 + i % 30},
+                           'cpu': {'load1': (i % 20) / 10}, 'clients': i % 12,
+                           'openclash': {'memory': 120}})
+
+    def batch(i):
+        return '\n'.join(monitoring(i * 10 + k) for k in range(10))
+
+    def yandex(i):
+        return json.dumps({'event': 'disconnect' if i % 2 else 'connected', 'room': 'kitchen',
+                           'timestamp': datetime.now().isoformat(), 'signal': '-60'})
+
+    def callback(i):
+        data = ('dashboard', 'stats', 'iot_menu', 'alerts')[i % 4]
+        return json.dumps({'callback_query': {
+            'id': str(i), 'data': data,
+            'message': {'message_id': i % 50 + 1, 'chat': {'id': int(chat_id)}}
+        }})
+
+    ndjson = dict(auth, **{'Content-Type': 'application/x-ndjson'})
+    yandex_headers = {'X-Webhook-Secret': secret, 'Content-Type': 'application/json'}
+    json_headers = {'Content-Type': 'application/json'}
+    # Roughly what a busy deployment sees: mostly metrics, IoT events and button presses
+    return [
+        ('monitoring', '/webhook/monitoring', auth, monitoring),
+        ('monitoring', '/webhook/monitoring', auth, monitoring),
+        ('batch', '/webhook/monitoring/batch', ndjson, batch),
+        ('yandex', '/webhook/yandex-station', yandex_headers, yandex),
+        ('yandex', '/webhook/yandex-station', yandex_headers, yandex),
+        ('callback', '/telegram/webhook', json_headers, callback),
+        ('callback', '/telegram/webhook', json_headers, callback),
+    ]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run(url, total, concurrency, mix):
+    target = urlsplit(url)
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+    latencies = {}
+    errors = []
+    results_lock = threading.Lock()
+
+    def worker():
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        own = {}
+        own_errors = 0
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            kind, path, headers, make_body = mix[i % len(mix)]
+            body = make_body(i)
+            began = time.perf_counter()
+            try:
+                conn.request('POST', path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    own_errors += 1
+            except (OSError, http.client.HTTPException):
+                own_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+                continue
+            own.setdefault(kind, []).append(time.perf_counter() - began)
+        conn.close()
+        with results_lock:
+            for kind, values in own.items():
+                latencies.setdefault(kind, []).extend(values)
+            errors.append(own_errors)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - began, latencies, sum(errors)
+
+
+def report(elapsed, latencies, errors, telegram_latency):
+    def line(name, values):
+        values = sorted(values)
+        return (f"{name:<12} {len(values):>7} {percentile(values, 50) * 1000:>9.1f} "
+                f"{percentile(values, 90) * 1000:>9.1f} {percentile(values, 99) * 1000:>9.1f} "
+                f"{(values[-1] if values else 0) * 1000:>9.1f}")
+
+    everything = [value for values in latencies.values() for value in values]
+    print(f"\nFake Telegram latency: {telegram_latency * 1000:.0f} ms per call")
+    print(f"Requests: {len(everything)} in {elapsed:.2f}s -> {len(everything) / elapsed:.0f} req/s, "
+          f"errors: {errors}\n")
+    print(f"{'endpoint':<12} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for kind in sorted(latencies):
+        print(line(kind, latencies[kind]))
+    print(line('all', everything))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Webhook load test with a fake Telegram API')
+    parser.add_argument('--url', help='Running bot base URL (default: start bot in-process)')
+    parser.add_argument('--secret', default='loadtest-secret', help='Router webhook token')
+    parser.add_argument('--chat-id', default='1000', help='Allowed Telegram chat id')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--telegram-latency', type=float, default=0.3,
+                        help='Seconds the fake Telegram API takes per call')
+    parser.add_argument('--telegram-port', type=int, default=0)
+    parser.add_argument('--drain', action='store_true',
+                        help='In-process mode: wait for queued Telegram calls and report drain time')
+    args = parser.parse_args()
+
+    FakeTelegramHandler.latency = args.telegram_latency
+    telegram = start_server(ThreadingHTTPServer(('127.0.0.1', args.telegram_port), FakeTelegramHandler))
+    telegram_url = f'http://127.0.0.1:{telegram.server_port}'
+    print(f"Fake Telegram API on {telegram_url}")
+
+    url = args.url
+    if url is None:
+        # Configure the bot before import: config.py reads the environment once
+        os.environ.update({
+            'TELEGRAM_API_URL': telegram_url,
+            'TELEGRAM_BOT_TOKEN': 'loadtest',
+            'TELEGRAM_CHAT_ID': args.chat_id,
+            'WEBHOOK_SECRET': args.secret,
+            'NOTIFY_QUEUE_FILE': '',
+            'ROUTERS': '',
+            'ROUTERS_FILE': ''
+        })
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import logging
+        from werkzeug.serving import make_server
+        import app as bot
+
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        server = start_server(make_server('127.0.0.1', 0, bot.app, threaded=True))
+        url = f'http://127.0.0.1:{server.server_port}'
+        print(f"Bot in-process on {url} (threaded)")
+
+    elapsed, latencies, errors = run(url, args.requests, args.concurrency,
+                                     build_requests(args.secret, args.chat_id))
+    report(elapsed, latencies, errors, args.telegram_latency)
+    print(f"Telegram calls received so far: {FakeTelegramHandler.calls}")
+
+    if args.url is None:
+        if args.drain:
+            began = time.perf_counter()
+            bot.shutdown()
+            print(f"Telegram send queue drained in {time.perf_counter() - began:.1f}s, "
+                  f"{FakeTelegramHandler.calls} calls total")
+        else:
+            # Don't wait for background Telegram sends still queued in the bot
+            sys.stdout.flush()
+            os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
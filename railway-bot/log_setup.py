@@ -0,0 +1,170 @@
+"""
+Asynchronous logging
+Records are queued on the request thread; formatting, redaction and output happen in a background listener
+"""
+import itertools
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Telegram bot token (123456:ABC...), Authorization headers, chat ids in payloads
+BOT_TOKEN_RE = re.compile(r'\b\d{6,}:[A-Za-z0-9_-]{30,}\b')
+BEARER_RE = re.compile(r'(Bearer\s+)[^\s\'",}]+', re.IGNORECASE)
+CHAT_ID_RE = re.compile(r'''(['"]?(?:chat_id|chat['"]?:\s*\{['"]?id)['"]?\s*[:=]\s*['"]?)-?\d+''')
+
+
+def parse_sample_rates(value):
+    """'/telegram/webhook=0.1,/webhook/monitoring=0.2' -> {route: rate}"""
+    rates = {}
+    for item in (value or '').split(','):
+        route, sep, rate = item.strip().rpartition('=')
+        if sep and route:
+            try:
+                rates[route] = min(1.0, max(0.0, float(rate)))
+            except ValueError:
+                continue
+    return rates
+
+
+class RedactingFilter(logging.Filter):
+    """Masks secrets and chat ids in the final message (runs in the listener thread)"""
+
+    def __init__(self, secrets=()):
+        super().__init__()
+        self._secrets = set()
+        self._secrets_re = None
+        self.add_secrets(secrets)
+
+    def add_secrets(self, secrets):
+        """Mask these exact values (tokens, chat ids); shorter than 6 chars are ignored"""
+        self._secrets.update(str(secret) for secret in secrets if secret and len(str(secret)) >= 6)
+        if self._secrets:
+            # Longest first, so a secret containing another one is masked whole;
+            # no alphanumeric neighbours, so a chat id doesn't mask part of a longer number
+            alternatives = '|'.join(re.escape(secret) for secret in
+                                    sorted(self._secrets, key=len, reverse=True))
+            self._secrets_re = re.compile(f'(?<![A-Za-z0-9])(?:{alternatives})(?![A-Za-z0-9])')
+
+    def redact(self, text):
+        if self._secrets_re is not None:
+            text = self._secrets_re.sub('***', text)
+        text = BOT_TOKEN_RE.sub('***', text)
+        text = BEARER_RE.sub(r'\1***', text)
+        return CHAT_ID_RE.sub(r'\1***', text)
+
+    def filter(self, record):
+        record.msg = self.redact(record.getMessage())
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        if record.exc_text:
+            record.exc_text = self.redact(record.exc_text)
+        return True
+
+
+class LogSampler:
+    """Per-route sampling decision, made once per request.
+
+    keep(route) is True for 1 of every 1/rate requests of that route; routes
+    without a rate are always kept. Deterministic counters instead of random():
+    no RNG lock on the hot path. Each route has an itertools.count, whose
+    next() is atomic under the GIL, so concurrent requests never share a count.
+    """
+
+    def __init__(self, rates):
+        self.rates = rates
+        self._counters = {route: itertools.count() for route in rates}
+
+    def keep(self, route):
+        rate = self.rates.get(route) if route else None
+        if rate is None or rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        counter = self._counters.get(route)
+        if counter is None:
+            # Rate added after start: setdefault keeps the first counter if two requests race here
+            counter = self._counters.setdefault(route, itertools.count())
+        return next(counter) % round(1 / rate) == 0
+
+
+class SamplingFilter(logging.Filter):
+    """Drops records below WARNING of requests not kept by the sampler.
+
+    `decision_getter()` returns the current request's decision (True outside requests).
+    """
+
+    def __init__(self, decision_getter):
+        super().__init__()
+        self.decision_getter = decision_getter
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.decision_getter()
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener.
+
+    The stock prepare() formats the message on the calling thread, which is
+    exactly the cost we want off the request path: the record is queued as is
+    and %-style arguments are rendered by the listener. A full queue drops the
+    record instead of blocking the request.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AsyncLogging:
+    """Root logger -> bounded queue -> listener thread -> redaction -> stdout"""
+
+    def __init__(self, level=logging.INFO, sample_decision=None,
+                 secrets=(), queue_size=10000, stream=None):
+        self.redactor = RedactingFilter(secrets)
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(logging.Formatter(LOG_FORMAT))
+        output.addFilter(self.redactor)
+
+        self.handler = DeferredQueueHandler(queue.Queue(maxsize=queue_size))
+        if sample_decision is not None:
+            self.handler.addFilter(SamplingFilter(sample_decision))
+        self.listener = logging.handlers.QueueListener(self.handler.queue, output,
+                                                       respect_handler_level=True)
+        self.level = level
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        """Install queue handler on root logger and start the listener (idempotent)"""
+        with self._lock:
+            if self._started:
+                return
+            root = logging.getLogger()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(self.handler)
+            root.setLevel(self.level)
+            self.listener.start()
+            self._started = True
+
+    def stop(self):
+        """Flush queued records"""
+        with self._lock:
+            if self._started:
+                self.listener.stop()
+                self._started = False
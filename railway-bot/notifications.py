@@ -0,0 +1,258 @@
+"""
+Outbound notification scheduler
+Coalesces bursts per key, respects Telegram rate limits, retries from a persistent queue
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from telegram_client import TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Telegram message length limit
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """Token bucket rate limiter with support for server-imposed pauses"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is available now)"""
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds, now):
+        """Honor Telegram `retry_after`: no sends until it expires"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+
+
+class NotificationScheduler:
+    """Per-key coalescing notification queue.
+
+    The first event for a key is sent right away; further events for the same key
+    within `window` seconds are merged and sent as one digest when the window ends.
+    Pending entries are persisted to `queue_path` and survive restarts.
+    """
+
+    def __init__(self, client, chat_id, window=30, rate=1.0, burst=3,
+                 queue_path=None, max_attempts=10):
+        self.client = client
+        self.chat_id = chat_id
+        self.window = window
+        self.bucket = TokenBucket(rate, burst)
+        self.queue_path = queue_path
+        self.max_attempts = max_attempts
+
+        self._cond = threading.Condition()
+        self._pending = {}       # key -> entry (not yet delivered)
+        self._window_until = {}  # key -> wall time when current coalescing window closes
+        self._thread = None
+        self._stopped = False
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+        self._load()
+        if self._pending:
+            # Restored after a restart: deliver without waiting for the next notify()
+            self.start()
+
+    def notify(self, key, text, reply_markup=None, chat_id=None):
+        """Queue notification, merging it with pending ones for the same key"""
+        now = time.time()
+        with self._cond:
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry['texts'].append(text)
+                if reply_markup:
+                    entry['reply_markup'] = reply_markup
+                self.coalesced += 1
+            else:
+                window_until = self._window_until.get(key, 0)
+                # Leading edge goes out now, the rest of the burst waits for the window
+                due = now if window_until <= now else window_until
+                self._pending[key] = {
+                    'key': key,
+                    'chat_id': chat_id or self.chat_id,
+                    'texts': [text],
+                    'reply_markup': reply_markup,
+                    'due': due,
+                    'attempts': 0
+                }
+                if window_until <= now:
+                    self._window_until[key] = now + self.window
+            self._save()
+            self._cond.notify()
+        self.start()
+
+    def depth(self):
+        """Number of pending (undelivered) notifications"""
+        with self._cond:
+            return len(self._pending)
+
+    def start(self):
+        """Start dispatcher thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='notifications', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                entry, wait = self._next_entry()
+                while not self._stopped and (entry is None or wait > 0):
+                    self._cond.wait(timeout=wait if entry is not None else None)
+                    entry, wait = self._next_entry()
+                if self._stopped:
+                    return
+                # Detach entry: events arriving during the send start a new entry
+                del self._pending[entry['key']]
+                self.bucket.take(time.monotonic())
+            self._deliver(entry)
+
+    def _next_entry(self):
+        """Earliest due entry and seconds to wait before it may be sent"""
+        if not self._pending:
+            return None, None
+        entry = min(self._pending.values(), key=lambda e: e['due'])
+        wait = max(entry['due'] - time.time(), self.bucket.delay(time.monotonic()))
+        return entry, wait
+
+    def _deliver(self, entry):
+        payload = {
+            'chat_id': entry.get('chat_id') or self.chat_id,
+            'text': self._render(entry['texts']),
+            'parse_mode': 'HTML'
+        }
+        if entry['reply_markup']:
+            payload['reply_markup'] = entry['reply_markup']
+
+        try:
+            self.client.call('sendMessage', payload)
+            self.sent += 1
+            with self._cond:
+                self._save()
+            return
+        except TelegramError as e:
+            if e.retry_after:
+                logger.warning(f"Telegram rate limit for {entry['key']}, retry after {e.retry_after}s")
+                self.bucket.pause(e.retry_after, time.monotonic())
+                delay = 0
+            elif e.status_code == 429:
+                # Rate limited without retry_after: back off like a server error
+                logger.warning(f"Telegram rate limit for {entry['key']}, no retry_after")
+                delay = min(300, 5 * 2 ** entry['attempts'])
+            elif 400 <= e.status_code < 500:
+                # Bad request won't succeed on retry
+                logger.error(f"Dropping notification {entry['key']}: {e}")
+                self.dropped += 1
+                with self._cond:
+                    self._save()
+                return
+            else:
+                delay = min(300, 5 * 2 ** entry['attempts'])
+        except Exception as e:
+            logger.error(f"Error sending notification {entry['key']}: {e}")
+            delay = min(300, 5 * 2 ** entry['attempts'])
+
+        entry['attempts'] += 1
+        if entry['attempts'] >= self.max_attempts:
+            logger.error(f"Dropping notification {entry['key']} after {entry['attempts']} attempts")
+            self.dropped += 1
+            with self._cond:
+                self._save()
+            return
+        self._requeue(entry, delay)
+
+    def _requeue(self, entry, delay):
+        with self._cond:
+            newer = self._pending.get(entry['key'])
+            if newer is not None:
+                # Events arrived while sending: failed ones go first in the digest
+                newer['texts'][:0] = entry['texts']
+                newer['due'] = min(newer['due'], time.time() + delay)
+            else:
+                entry['due'] = time.time() + delay
+                self._pending[entry['key']] = entry
+            self._save()
+            self._cond.notify()
+
+    @staticmethod
+    def _render(texts):
+        """Single text as is, several as one digest within Telegram length limit"""
+        if len(texts) == 1:
+            return texts[0][:MAX_MESSAGE_LENGTH]
+
+        header = f"📦 <b>Сводка: {len(texts)} событий</b>\n\n"
+        separator = "\n\n➖➖➖\n\n"
+        body = ""
+        shown = 0
+        # Newest events are the most relevant: fill from the end
+        for text in reversed(texts):
+            candidate = text + (separator + body if body else "")
+            if len(header) + len(candidate) + 64 > MAX_MESSAGE_LENGTH:
+                break
+            body = candidate
+            shown += 1
+        if shown < len(texts):
+            body += f"\n\n… и ещё {len(texts) - shown} более ранних"
+        return header + body
+
+    def _load(self):
+        if not self.queue_path or not os.path.exists(self.queue_path):
+            return
+        try:
+            with open(self.queue_path) as f:
+                entries = json.load(f)
+            for entry in entries:
+                self._pending[entry['key']] = entry
+            if entries:
+                logger.info(f"Restored {len(entries)} pending notifications from {self.queue_path}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Failed to load notification queue {self.queue_path}: {e}")
+
+    def _save(self):
+        """Persist pending entries (caller holds the lock)"""
+        if not self.queue_path:
+            return
+        tmp_path = f"{self.queue_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(list(self._pending.values()), f, ensure_ascii=False)
+            os.replace(tmp_path, self.queue_path)
+        except OSError as e:
+            logger.error(f"Failed to persist notification queue: {e}")
@@ -0,0 +1,69 @@
+"""
+Versioned render cache for Telegram menu views
+Skips re-rendering and re-sending views whose data hasn't changed
+"""
+import threading
+from collections import OrderedDict
+
+
+class RenderCache:
+    """Cache of rendered (text, reply_markup) per view and data version.
+
+    `version` is any hashable built from data generation counters: a view is
+    rebuilt only when its version changes. The cache also remembers which
+    view/version each message currently shows, so pressing the same button
+    again costs no outbound editMessageText.
+    """
+
+    def __init__(self, max_messages=256):
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._views = {}              # view -> (version, text, reply_markup)
+        self._shown = OrderedDict()   # (chat_id, message_id) -> (view, version), LRU
+        self.hits = 0
+        self.misses = 0
+        self.skipped_edits = 0
+
+    def render(self, view, version, builder):
+        """Return cached (text, reply_markup) for view, calling builder() on version change"""
+        with self._lock:
+            cached = self._views.get(view)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                return cached[1], cached[2]
+            self.misses += 1
+
+        text, reply_markup = builder()
+        with self._lock:
+            self._views[view] = (version, text, reply_markup)
+        return text, reply_markup
+
+    def is_shown(self, chat_id, message_id, view, version):
+        """True if the message already displays this view at this version"""
+        with self._lock:
+            shown = self._shown.get((chat_id, message_id)) == (view, version)
+            if shown:
+                self._shown.move_to_end((chat_id, message_id))
+                self.skipped_edits += 1
+            return shown
+
+    def mark_shown(self, chat_id, message_id, view, version):
+        with self._lock:
+            self._shown[(chat_id, message_id)] = (view, version)
+            self._shown.move_to_end((chat_id, message_id))
+            while len(self._shown) > self.max_messages:
+                self._shown.popitem(last=False)
+
+    def forget(self, chat_id, message_id):
+        """Message content changed outside the cache (or the edit failed)"""
+        with self._lock:
+            self._shown.pop((chat_id, message_id), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'skipped_edits': self.skipped_edits,
+                'tracked_messages': len(self._shown)
+            }
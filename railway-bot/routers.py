@@ -0,0 +1,238 @@
+"""
+Router namespaces
+Per-router metric stores, alert thresholds and webhook secrets
+"""
+import bisect
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Metric series stored per sample, in addition to 'timestamps'
+METRIC_FIELDS = ('ram_percent', 'cpu_load1', 'clients', 'openclash_memory')
+
+
+def normalize_timestamp(value):
+    """ISO 8601 timestamp -> naive UTC 'YYYY-MM-DDTHH:MM:SS' (None if unparsable).
+
+    Routers send '...Z', the server uses naive utcnow(): one canonical form keeps
+    samples sortable as strings and makes dedupe by timestamp exact.
+    """
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat(timespec='seconds')
+
+
+class HourlyRollup:
+    """Per-hour sums / counts of metric fields, for views longer than the raw history.
+
+    Buckets are keyed by 'YYYY-MM-DDTHH' (string-sortable like the timestamps);
+    the last `hours` buckets are kept. `generation` changes only when a completed
+    hour changes (a new hour starts, or a backfilled sample lands in an old one),
+    so anything derived from completed hours stays valid for up to an hour.
+    """
+
+    def __init__(self, fields, hours=168):
+        self.fields = fields
+        self.hours = hours
+        self._hours = []     # sorted bucket keys
+        self._buckets = {}   # key -> [count, sum per field...]
+        self.generation = 0
+
+    def add(self, timestamp, values):
+        """Account one stored sample; values is {field: number}"""
+        key = timestamp[:13]
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._hours) >= self.hours + 1 and key < self._hours[0]:
+                return
+            bisect.insort(self._hours, key)
+            bucket = self._buckets[key] = [0] + [0.0] * len(self.fields)
+            if len(self._hours) > self.hours + 1:
+                del self._buckets[self._hours.pop(0)]
+            self.generation += 1
+        elif key != self._hours[-1]:
+            self.generation += 1
+        bucket[0] += 1
+        for i, field in enumerate(self.fields, 1):
+            bucket[i] += values.get(field) or 0
+
+    def completed(self, field):
+        """[(hour key, average)] of all hours but the current (last) one"""
+        i = self.fields.index(field) + 1
+        return [(key, self._buckets[key][i] / self._buckets[key][0]) for key in self._hours[:-1]]
+
+
+class MetricStore:
+    """Last `max_records` samples of one router as parallel lists, alerts and hourly averages.
+
+    Samples are kept sorted by timestamp; a sample whose timestamp is already
+    stored is ignored, so re-sent batches and backfill are idempotent.
+    """
+
+    def __init__(self, max_records=288, max_alerts=100):
+        self.max_records = max_records
+        self.max_alerts = max_alerts
+        self.history = {'timestamps': [], 'alerts': []}
+        for field in METRIC_FIELDS:
+            self.history[field] = []
+        self.generation = 0
+        self.hourly = HourlyRollup(('ram_percent', 'cpu_load1'))
+
+    def add_sample(self, timestamp, data):
+        """Store one monitoring sample (router JSON payload).
+
+        Returns 'stored', 'duplicate' (timestamp already known) or 'expired'
+        (backfill older than the retained window).
+        """
+        history = self.history
+        timestamps = history['timestamps']
+        values = (
+            data.get('ram', {}).get('percent', 0),
+            data.get('cpu', {}).get('load1', 0),
+            data.get('clients', 0),
+            data.get('openclash', {}).get('memory', 0)
+        )
+        if not timestamps or timestamp > timestamps[-1]:
+            timestamps.append(timestamp)
+            for field, value in zip(METRIC_FIELDS, values):
+                history[field].append(value)
+        else:
+            # Backfilled sample: insert in place unless it's a duplicate or already expired
+            index = bisect.bisect_left(timestamps, timestamp)
+            if index < len(timestamps) and timestamps[index] == timestamp:
+                return 'duplicate'
+            if len(timestamps) >= self.max_records and index == 0:
+                return 'expired'
+            timestamps.insert(index, timestamp)
+            for field, value in zip(METRIC_FIELDS, values):
+                history[field].insert(index, value)
+
+        # Keep only last max_records samples
+        excess = len(history['timestamps']) - self.max_records
+        if excess > 0:
+            for key in ('timestamps',) + METRIC_FIELDS:
+                del history[key][:excess]
+        self.hourly.add(timestamp, dict(zip(METRIC_FIELDS, values)))
+        self.generation += 1
+        return 'stored'
+
+    def add_alert(self, alert_record):
+        self.history['alerts'].append(alert_record)
+        if len(self.history['alerts']) > self.max_alerts:
+            del self.history['alerts'][0]
+        self.generation += 1
+
+    def latest(self, field, default=0):
+        values = self.history[field]
+        return values[-1] if values else default
+
+    def __len__(self):
+        return len(self.history['timestamps'])
+
+
+class Router:
+    """One monitored router: identity, notification chat, thresholds and metrics"""
+
+    def __init__(self, router_id, name, chat_id, ram_threshold, cpu_threshold, max_records=288):
+        self.id = router_id
+        self.name = name
+        self.chat_id = str(chat_id)
+        self.ram_threshold = ram_threshold
+        self.cpu_threshold = cpu_threshold
+        self.metrics = MetricStore(max_records)
+        # alerting.AlertEvaluator over the incoming samples, set up by the app
+        self.alerts = None
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+class RouterRegistry:
+    """Routers indexed by id and by SHA-256 of their webhook token.
+
+    Authentication hashes the presented token and does one dict lookup: cost
+    doesn't depend on the number of routers, and timing reveals nothing about
+    how many characters of a real token matched.
+    """
+
+    def __init__(self):
+        self.routers = {}
+        self._by_token = {}
+
+    def add(self, router, token):
+        if not token:
+            raise ValueError(f"Router {router.id} has no webhook token")
+        digest = token_digest(token)
+        if digest in self._by_token:
+            raise ValueError(f"Router {router.id} reuses the token of {self._by_token[digest].id}")
+        self.routers[router.id] = router
+        self._by_token[digest] = router
+        return router
+
+    def authenticate(self, token):
+        """Router owning this webhook token, or None"""
+        if not token:
+            return None
+        return self._by_token.get(token_digest(token))
+
+    def get(self, router_id):
+        return self.routers.get(router_id)
+
+    def chat_ids(self):
+        return {router.chat_id for router in self.routers.values()}
+
+    def for_chat(self, chat_id):
+        """Routers notifying this chat"""
+        return [router for router in self.routers.values() if router.chat_id == str(chat_id)]
+
+    def __iter__(self):
+        return iter(self.routers.values())
+
+    def __len__(self):
+        return len(self.routers)
+
+
+def load_routers(path='', env_json='', default=None, max_records=288):
+    """Build registry from JSON list of routers (file, then env), else single default router.
+
+    Item format: {"id": "home", "name": "Home AX3200", "token": "...",
+                  "chat_id": "...", "ram_threshold": 85, "cpu_threshold": 3.0}
+    Missing chat_id / thresholds are taken from the default router.
+    """
+    raw = None
+    if path:
+        try:
+            with open(path) as f:
+                raw = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load routers from {path}: {e}")
+    if raw is None and env_json:
+        try:
+            raw = json.loads(env_json)
+        except ValueError as e:
+            logger.error(f"Invalid ROUTERS JSON: {e}")
+
+    registry = RouterRegistry()
+    default = default or {}
+    for item in raw or [default]:
+        router = Router(
+            item['id'],
+            item.get('name', item['id']),
+            item.get('chat_id', default.get('chat_id', '')),
+            item.get('ram_threshold', default.get('ram_threshold')),
+            item.get('cpu_threshold', default.get('cpu_threshold')),
+            max_records=max_records
+        )
+        registry.add(router, item.get('token', ''))
+    logger.info(f"Routers configured: {', '.join(registry.routers)}")
+    return registry
@@ -0,0 +1,150 @@
+"""
+Background timers
+Hashed timer wheel on one thread: device offline deadlines, mute expiry, 24h counter roll-over
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """Hashed timer wheel: `slots` buckets of `tick` seconds, timers keyed by name.
+
+    schedule / cancel are O(1) (a dict operation in one slot); a tick only looks
+    at the timers hashed to its slot, so cost follows armed timers, not the number
+    of devices. Timers further out than one revolution stay in their slot and are
+    skipped until their tick comes round. Scheduling an existing key replaces it.
+    """
+
+    def __init__(self, tick=1.0, slots=3600, now=None):
+        self.tick = tick
+        self.slots = slots
+        self._wheel = [{} for _ in range(slots)]
+        self._slot_of = {}  # key -> slot index
+        self._current = self._tick_of(time.time() if now is None else now)
+
+    def _tick_of(self, when):
+        return int(when // self.tick)
+
+    def schedule(self, key, when, callback):
+        """Run callback() at epoch time `when` (next tick if already past)"""
+        self.cancel(key)
+        expires = max(self._tick_of(when), self._current + 1)
+        index = expires % self.slots
+        self._wheel[index][key] = (expires, callback)
+        self._slot_of[key] = index
+
+    def cancel(self, key):
+        index = self._slot_of.pop(key, None)
+        if index is not None:
+            del self._wheel[index][key]
+
+    def pending(self, key):
+        return key in self._slot_of
+
+    def advance(self, now):
+        """Pop callbacks of timers expired by `now`, in expiry order"""
+        target = self._tick_of(now)
+        due = []
+        # After a long stall one revolution visits every slot; later ticks add nothing new
+        for tick in range(self._current + 1, min(target, self._current + self.slots) + 1):
+            bucket = self._wheel[tick % self.slots]
+            for key in [key for key, (expires, _) in bucket.items() if expires <= target]:
+                due.append((bucket[key][0], key, bucket.pop(key)[1]))
+                del self._slot_of[key]
+        self._current = max(self._current, target)
+        due.sort(key=lambda item: item[0])
+        return [(key, callback) for _, key, callback in due]
+
+    def next_expiry(self):
+        """Epoch time of the earliest armed timer's tick, None if nothing is armed"""
+        if not self._slot_of:
+            return None
+        later = None
+        # Walk the slots from the current tick: the first timer due in this
+        # revolution wins; timers a revolution or more out are kept as fallback
+        for tick in range(self._current + 1, self._current + self.slots + 1):
+            for expires, _ in self._wheel[tick % self.slots].values():
+                if expires == tick:
+                    return tick * self.tick
+                later = expires if later is None else min(later, expires)
+        return later * self.tick
+
+    def __len__(self):
+        return len(self._slot_of)
+
+
+class Scheduler:
+    """TimerWheel driven by a daemon thread.
+
+    The thread sleeps until the earliest armed timer's tick (woken early by
+    schedule / stop) and blocks without waking when there are none. Callbacks run on the scheduler thread,
+    outside the wheel lock: they take their own locks and must not block long.
+    """
+
+    def __init__(self, tick=1.0, slots=3600):
+        self._wheel = TimerWheel(tick, slots)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.fired = 0
+
+    def schedule(self, key, when, callback):
+        with self._cond:
+            self._wheel.schedule(key, when, callback)
+            self._cond.notify()
+        self.start()
+
+    def cancel(self, key):
+        with self._cond:
+            self._wheel.cancel(key)
+
+    def pending(self, key):
+        with self._cond:
+            return self._wheel.pending(key)
+
+    def armed(self):
+        """Number of armed timers"""
+        with self._cond:
+            return len(self._wheel)
+
+    def start(self):
+        """Start timer thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not len(self._wheel):
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                delay = self._wheel.next_expiry() - time.time()
+                if delay > 0:
+                    # A schedule() for an earlier time notifies: advance finds nothing, the delay is recomputed
+                    self._cond.wait(timeout=delay)
+                if self._stopped:
+                    return
+                due = self._wheel.advance(time.time())
+            for key, callback in due:
+                self.fired += 1
+                try:
+                    callback()
+                except Exception:
+                    logger.exception(f"Timer {key} failed")
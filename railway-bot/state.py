@@ -0,0 +1,32 @@
+"""
+Shared bot state
+Router metrics, IoT devices and render cache behind one lock for threaded serving
+"""
+import threading
+
+
+class BotState:
+    """Everything request handlers read and write, guarded by `lock`.
+
+    Under a threaded server (gunicorn gthread) webhooks and button presses run
+    concurrently: mutations and multi-step reads take `lock`. Handlers only queue
+    Telegram calls, never wait on them, so the lock is held for microseconds.
+    Data lives in one process - run a single worker and scale with threads.
+    """
+
+    def __init__(self, routers, devices, render_cache, geosite_categories):
+        self.lock = threading.RLock()
+        self.routers = routers
+        self.devices = devices
+        self.render_cache = render_cache
+        # Categories of the last successful build (reported by build-complete)
+        self.geosite_categories = list(geosite_categories)
+        self._generations = {'metrics': 0, 'iot': 0}
+
+    def bump(self, name):
+        """Mark data changed: render cache versions built from it become stale"""
+        with self.lock:
+            self._generations[name] += 1
+
+    def generation(self, name):
+        return self._generations[name]
@@ -0,0 +1,122 @@
+"""
+Telegram Bot API client
+Pooled keep-alive HTTP session with a background send queue
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramError(Exception):
+    """Telegram Bot API call failed"""
+
+    def __init__(self, method, status_code, description, retry_after=None):
+        super().__init__(f"{method}: HTTP {status_code}, {description}")
+        self.method = method
+        self.status_code = status_code
+        self.description = description
+        self.retry_after = retry_after
+
+
+class TelegramClient:
+    """Thin Bot API client over one pooled requests.Session.
+
+    call()      - blocking request, returns `result` or raises TelegramError
+    submit()    - queue a request for the background workers, returns a Future
+    call_many() - dispatch independent requests concurrently and wait for all
+
+    `observer(method, seconds, error)` is called after every request (error is
+    None on success) - used for latency / failure metrics.
+    """
+
+    def __init__(self, token, api_url='https://api.telegram.org',
+                 pool_size=8, workers=4, timeout=10, observer=None):
+        self.base_url = f"{api_url.rstrip('/')}/bot{token}"
+        self.timeout = timeout
+        self.observer = observer
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Threads are started lazily on first submit(), so the pool is
+        # created per gunicorn worker after fork
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='telegram')
+
+    def call(self, method, payload=None, files=None):
+        """Call Bot API method synchronously"""
+        if self.observer is None:
+            return self._call(method, payload, files)
+        started = time.perf_counter()
+        try:
+            result = self._call(method, payload, files)
+        except Exception as e:
+            self.observer(method, time.perf_counter() - started, e)
+            raise
+        self.observer(method, time.perf_counter() - started, None)
+        return result
+
+    def _call(self, method, payload, files):
+        if files:
+            response = self.session.post(f"{self.base_url}/{method}", data=payload,
+                                         files=files, timeout=self.timeout)
+        else:
+            response = self.session.post(f"{self.base_url}/{method}", json=payload or {},
+                                         timeout=self.timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {'ok': False, 'description': response.text}
+
+        if response.status_code == 200 and body.get('ok', True):
+            return body.get('result')
+
+        retry_after = (body.get('parameters') or {}).get('retry_after')
+        raise TelegramError(method, response.status_code,
+                            body.get('description', ''), retry_after)
+
+    def submit(self, method, payload=None, files=None):
+        """Queue Bot API call for background dispatch"""
+        with self._pending_lock:
+            self._pending += 1
+        future = self._executor.submit(self.call, method, payload, files)
+        future.add_done_callback(lambda f: self._done(method, f))
+        return future
+
+    def pending(self):
+        """Calls queued or in flight in the background workers"""
+        return self._pending
+
+    def call_many(self, calls):
+        """Dispatch independent (method, payload) calls concurrently.
+
+        Returns list of results in the same order; failed calls yield the exception.
+        """
+        futures = [self.submit(method, payload) for method, payload in calls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        """Drain send queue and close pooled connections"""
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def _done(self, method, future):
+        with self._pending_lock:
+            self._pending -= 1
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Telegram {method} failed: {error}")
@@ -0,0 +1,151 @@
+"""
+Bot telemetry
+Counters, gauges and histograms exposed in OpenMetrics text format
+"""
+import bisect
+import threading
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Seconds: from in-memory handlers (~1ms) to slow Telegram calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    """Metric family with optional labels.
+
+    Values are either recorded by the app (inc/set/observe) or produced at scrape
+    time by `callback`: a function returning a value (no labels) or a
+    {label values tuple: value} dict. Callbacks keep hot paths free of bookkeeping
+    for data the app already holds.
+    """
+    type = 'unknown'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _snapshot(self):
+        if self.callback is not None:
+            values = self.callback()
+            return values if isinstance(values, dict) else {(): values}
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        for key, value in self._snapshot().items():
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}\n"
+
+    def render(self):
+        yield f"# TYPE {self.name} {self.type}\n"
+        yield f"# HELP {self.name} {_escape(self.documentation)}\n"
+        yield from self.samples()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self._snapshot().items():
+            yield f"{self.name}_total{_labels(self.labelnames, key)} {_number(value)}\n"
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Fixed-bucket histogram: observe() is one bisect and three additions"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, last slot is +Inf; then sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def _snapshot(self):
+        with self._lock:
+            return {key: list(state) for key, state in self._values.items()}
+
+    def samples(self):
+        bounds = self.buckets + (float('inf'),)
+        for key, state in self._snapshot().items():
+            cumulative = 0
+            for bound, count in zip(bounds, state):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}\n"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}\n"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(state[-1])}\n"
+
+
+class Registry:
+    """Ordered set of metric families; render() streams the exposition line by line"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Counter(name, documentation, labelnames, callback))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        for metric in self._metrics:
+            yield from metric.render()
+        yield "# EOF\n"
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bot runs from its own directory (Procfile): modules import each other flat
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
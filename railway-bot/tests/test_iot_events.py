@@ -0,0 +1,43 @@
+import iot_events
+from iot_events import EventLog, WindowCounter
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def test_late_event_does_not_reset_current_bucket(monkeypatch):
+    clock = FakeClock(1015.0)
+    monkeypatch.setattr(iot_events, 'time', clock)
+    counter = WindowCounter(window=100, buckets=10)
+    for _ in range(3):
+        counter.add(1015.0)
+    # Maps to the same bucket as now, but a whole window earlier
+    counter.add(915.0)
+    assert counter.total(1015.0) == 3
+
+
+def test_late_event_inside_window_is_counted(monkeypatch):
+    monkeypatch.setattr(iot_events, 'time', FakeClock(1015.0))
+    counter = WindowCounter(window=100, buckets=10)
+    counter.add(1015.0)
+    counter.add(960.0)
+    assert counter.total(1015.0) == 2
+    # Both age out with their buckets
+    assert counter.total(1065.0) == 1
+    assert counter.total(1125.0) == 0
+
+
+def test_event_log_trim_keeps_type_index_consistent():
+    log = EventLog(max_events=10)
+    for i in range(25):
+        # Four events per timestamp: trimming cuts through runs of equal timestamps
+        log.append(100 + i // 4, {'type': 'door' if i % 3 == 0 else 'motion'})
+    kept = [event['type'] for event in log.since(0)]
+    assert log.count_since(0) == len(kept)
+    assert log.count_since(0, 'door') == kept.count('door')
+    assert log.count_since(0, 'motion') == kept.count('motion')
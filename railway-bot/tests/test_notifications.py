@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+
+from notifications import NotificationScheduler, TokenBucket
+
+
+class FakeClient:
+    """Records sendMessage payloads; `fail` makes every call raise"""
+
+    def __init__(self, fail=None):
+        self.fail = fail
+        self.sent = []
+        self.called = threading.Event()
+
+    def call(self, method, payload):
+        self.called.set()
+        if self.fail:
+            raise self.fail
+        self.sent.append(payload)
+        return {}
+
+    def wait_sent(self, n, timeout=5):
+        for _ in range(int(timeout / 0.02)):
+            if len(self.sent) >= n:
+                return True
+            time.sleep(0.02)
+        return len(self.sent) >= n
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(rate=2.0, burst=2)
+    now = bucket.updated
+    for _ in range(2):
+        assert bucket.delay(now) == 0
+        bucket.take(now)
+    assert bucket.delay(now) == 0.5
+    assert bucket.delay(now + 0.5) == 0
+
+
+def test_token_bucket_pause_overrides_tokens():
+    bucket = TokenBucket(rate=10.0, burst=5)
+    now = bucket.updated
+    bucket.pause(3, now)
+    assert bucket.delay(now + 1) == 2
+    assert bucket.delay(now + 3) == 0
+
+
+def test_burst_is_coalesced_into_one_digest():
+    client = FakeClient()
+    scheduler = NotificationScheduler(client, chat_id='1', window=0.3, rate=100, burst=10)
+    try:
+        scheduler.notify('device:1', 'event 0')
+        assert client.wait_sent(1)
+        for i in range(1, 4):
+            scheduler.notify('device:1', f'event {i}')
+        assert client.wait_sent(2)
+        assert scheduler.depth() == 0
+    finally:
+        scheduler.stop()
+    # Leading edge alone, then the rest of the window as one digest, newest last
+    assert client.sent[0]['text'] == 'event 0'
+    digest = client.sent[1]['text']
+    assert 'Сводка: 3 событий' in digest
+    assert digest.index('event 1') < digest.index('event 3')
+    assert scheduler.coalesced == 2
+    assert len(client.sent) == 2
+
+
+def test_keys_are_not_coalesced_together():
+    client = FakeClient()
+    scheduler = NotificationScheduler(client, chat_id='1', window=30, rate=100, burst=10)
+    try:
+        scheduler.notify('a', 'for a', chat_id='7')
+        scheduler.notify('b', 'for b')
+        assert client.wait_sent(2)
+    finally:
+        scheduler.stop()
+    assert sorted((payload['chat_id'], payload['text']) for payload in client.sent) == [('1', 'for b'),
+                                                                                       ('7', 'for a')]
+
+
+def test_failed_send_is_persisted(tmp_path):
+    queue_path = tmp_path / 'queue.json'
+    client = FakeClient(fail=RuntimeError('network down'))
+    scheduler = NotificationScheduler(client, chat_id='1', queue_path=str(queue_path))
+    try:
+        scheduler.notify('door', 'opened')
+        assert client.called.wait(5)
+    finally:
+        scheduler.stop()
+    entries = json.loads(queue_path.read_text())
+    assert [(entry['key'], entry['texts'], entry['attempts']) for entry in entries] == [('door', ['opened'], 1)]
+
+
+def test_restored_queue_is_delivered_without_notify(tmp_path):
+    queue_path = tmp_path / 'queue.json'
+    queue_path.write_text(json.dumps([{'key': 'door', 'chat_id': '5', 'texts': ['opened', 'closed'],
+                                       'reply_markup': None, 'due': 0, 'attempts': 2}]))
+    client = FakeClient()
+    scheduler = NotificationScheduler(client, chat_id='1', queue_path=str(queue_path))
+    try:
+        assert client.wait_sent(1)
+    finally:
+        scheduler.stop()
+    assert client.sent[0]['chat_id'] == '5'
+    assert 'opened' in client.sent[0]['text'] and 'closed' in client.sent[0]['text']
+    assert json.loads(queue_path.read_text()) == []
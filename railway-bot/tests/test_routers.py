@@ -0,0 +1,44 @@
+from routers import MetricStore, normalize_timestamp
+
+
+def sample(ram):
+    return {'ram': {'percent': ram}, 'cpu': {'load1': ram / 100}, 'clients': 1}
+
+
+def ts(minute):
+    return f'2026-10-19T10:{minute:02d}:00'
+
+
+def test_duplicate_timestamp_is_not_stored_twice():
+    store = MetricStore(max_records=10)
+    assert store.add_sample(ts(0), sample(10)) == 'stored'
+    generation = store.generation
+    assert store.add_sample(ts(0), sample(99)) == 'duplicate'
+    assert store.history['ram_percent'] == [10]
+    assert store.generation == generation
+
+
+def test_backfill_is_inserted_in_time_order():
+    store = MetricStore(max_records=10)
+    for minute, ram in ((0, 10), (10, 30), (5, 20)):
+        assert store.add_sample(ts(minute), sample(ram)) == 'stored'
+    assert store.history['timestamps'] == [ts(0), ts(5), ts(10)]
+    assert store.history['ram_percent'] == [10, 20, 30]
+    assert store.add_sample(ts(5), sample(0)) == 'duplicate'
+
+
+def test_backfill_older_than_window_is_expired():
+    store = MetricStore(max_records=3)
+    for minute in (10, 20, 30, 40):
+        store.add_sample(ts(minute), sample(minute))
+    assert store.history['timestamps'] == [ts(20), ts(30), ts(40)]
+    assert store.add_sample(ts(15), sample(1)) == 'expired'
+    # Inside the retained window: placed, and the oldest sample falls out instead
+    assert store.add_sample(ts(25), sample(25)) == 'stored'
+    assert store.history['timestamps'] == [ts(25), ts(30), ts(40)]
+
+
+def test_timestamps_normalize_to_one_form():
+    assert normalize_timestamp('2026-10-19T10:00:00Z') == '2026-10-19T10:00:00'
+    assert normalize_timestamp('2026-10-19T13:00:00+03:00') == '2026-10-19T10:00:00'
+    assert normalize_timestamp('yesterday') is None
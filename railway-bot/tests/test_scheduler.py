@@ -0,0 +1,61 @@
+import threading
+import time
+
+from scheduler import Scheduler, TimerWheel
+
+
+def fired(wheel, now):
+    return [key for key, _ in wheel.advance(now)]
+
+
+def test_timers_fire_in_expiry_order():
+    wheel = TimerWheel(tick=1.0, slots=10, now=100.0)
+    wheel.schedule('late', 105.0, None)
+    wheel.schedule('early', 102.0, None)
+    assert fired(wheel, 101.0) == []
+    assert fired(wheel, 106.0) == ['early', 'late']
+    assert len(wheel) == 0
+
+
+def test_cancel_and_reschedule():
+    wheel = TimerWheel(tick=1.0, slots=10, now=100.0)
+    wheel.schedule('a', 103.0, None)
+    wheel.schedule('b', 103.0, None)
+    wheel.cancel('a')
+    wheel.cancel('missing')
+    # Rescheduling replaces the pending timer
+    wheel.schedule('b', 107.0, None)
+    assert not wheel.pending('a') and wheel.pending('b')
+    assert fired(wheel, 104.0) == []
+    assert fired(wheel, 107.0) == ['b']
+
+
+def test_timer_beyond_one_revolution_waits_its_turn():
+    wheel = TimerWheel(tick=1.0, slots=10, now=100.0)
+    wheel.schedule('far', 125.0, None)
+    assert wheel.next_expiry() == 125.0
+    assert fired(wheel, 115.0) == []
+    assert fired(wheel, 125.0) == ['far']
+    assert wheel.next_expiry() is None
+
+
+def test_next_expiry_prefers_this_revolution():
+    wheel = TimerWheel(tick=1.0, slots=10, now=100.0)
+    wheel.schedule('far', 112.0, None)   # same slot as 102, one revolution later
+    wheel.schedule('near', 104.0, None)
+    assert wheel.next_expiry() == 104.0
+    wheel.cancel('near')
+    assert wheel.next_expiry() == 112.0
+
+
+def test_scheduler_runs_callbacks():
+    scheduler = Scheduler(tick=0.01, slots=100)
+    done = threading.Event()
+    try:
+        scheduler.schedule('x', time.time() + 0.05, done.set)
+        scheduler.schedule('y', time.time() + 0.02, lambda: None)
+        scheduler.cancel('y')
+        assert done.wait(2)
+    finally:
+        scheduler.stop()
+    assert scheduler.fired == 1
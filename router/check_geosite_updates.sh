@@ -20,10 +20,12 @@ GITHUB_API="https://api.github.com/repos/${GITHUB_REPO}/commits/master"
 echo "${LOG_PREFIX} $(date '+%Y-%m-%d %H:%M:%S') - Starting check..."
 
 # Get latest commit from GitHub
+# application/vnd.github.sha returns just the 40-char sha instead of the full commit JSON
 echo "${LOG_PREFIX} Fetching latest commit from GitHub..."
-LATEST_COMMIT=$(curl -s "${GITHUB_API}" | grep -o '"sha": "[^"]*"' | head -1 | cut -d'"' -f4)
+LATEST_COMMIT=$(curl -fsS --connect-timeout 10 --max-time 30 \
+    -H "Accept: application/vnd.github.sha" "${GITHUB_API}")
 
-if [ -z "$LATEST_COMMIT" ]; then
+if ! echo "$LATEST_COMMIT" | grep -qE '^[0-9a-f]{40}$'; then
     echo "${LOG_PREFIX} ERROR: Failed to fetch latest commit from GitHub"
     exit 1
 fi
@@ -13,13 +13,24 @@
 # ============================================================================
 
 GITHUB_REPO="susaninz/openwrtrouter"
-GITHUB_API="https://api.github.com/repos/$GITHUB_REPO/releases/latest"
+# Манифест релиза: версия, размер, sha256 и URL каждого файла (несколько сотен байт)
+MANIFEST_URL="https://github.com/$GITHUB_REPO/releases/download/latest/manifest.txt"
+MANIFEST_FILE="/tmp/geosite_manifest.txt"
+# Ключ подписи манифеста (секрет MANIFEST_KEY в GitHub); пустой - подпись не проверяется
+MANIFEST_KEY=""
+# Локальное зеркало (scripts/rule_mirror.py), например "http://192.168.31.10:8099":
+# манифест и файлы берутся с него, sha256 по-прежнему сверяются с подписанным манифестом
+MIRROR_URL=""
 
 OPENCLASH_DIR="/etc/openclash"
 GEOSITE_FILE="$OPENCLASH_DIR/geosite.dat"
 VERSION_FILE="$OPENCLASH_DIR/.geosite_version"
 BACKUP_DIR="$OPENCLASH_DIR/backups"
 
+# Delta-обновления: применяются если есть python3 и скрипт (scripts/delta_patch.py из репозитория),
+# иначе / при любой ошибке - полное скачивание
+DELTA_TOOL="/root/delta_patch.py"
+
 # Webhook для уведомлений в Telegram (через Railway)
 WEBHOOK_URL="https://openwrtrouter-production.up.railway.app"
 WEBHOOK_SECRET="9fde3ba2adf1c3d063291a508c9873edc879312363bf709424a7bbc63333573c"
@@ -97,53 +108,152 @@ get_current_version() {
     fi
 }
 
-get_latest_release() {
-    log "Checking GitHub for latest release..."
+asset_url() {
+    # URL из манифеста, либо тот же файл на локальном зеркале
+    if [ -n "$MIRROR_URL" ]; then
+        echo "$MIRROR_URL/${1##*/}"
+    else
+        echo "$1"
+    fi
+}
+
+verify_signature() {
+    local manifest="$1"
+    
+    if [ -z "$MANIFEST_KEY" ]; then
+        log "WARNING: MANIFEST_KEY not set, manifest signature not checked"
+        return 0
+    fi
+    
+    # Подпись - последняя строка "sig <hex>", HMAC-SHA256 от всего, что выше
+    local expected=$(tail -n 1 "$manifest" | awk '$1 == "sig" { print $2 }')
+    local actual=""
+    if command -v openssl >/dev/null 2>&1; then
+        actual=$(sed '$d' "$manifest" | openssl dgst -sha256 -hmac "$MANIFEST_KEY" | awk '{ print $NF }')
+    elif command -v python3 >/dev/null 2>&1; then
+        actual=$(sed '$d' "$manifest" | MANIFEST_KEY="$MANIFEST_KEY" python3 -c \
+            'import hashlib,hmac,os,sys; print(hmac.new(os.environ["MANIFEST_KEY"].encode(), sys.stdin.buffer.read(), hashlib.sha256).hexdigest())')
+    else
+        log "ERROR: openssl or python3 required to verify manifest signature"
+        return 1
+    fi
     
-    # Получаем информацию о последнем релизе
-    local response=$(curl -s --connect-timeout 10 --max-time 30 "$GITHUB_API")
+    if [ -z "$expected" ] || [ "$expected" != "$actual" ]; then
+        log "ERROR: Manifest signature mismatch"
+        return 1
+    fi
+    return 0
+}
+
+get_latest_release() {
+    log "Fetching release manifest..."
     
-    if [ $? -ne 0 ] || [ -z "$response" ]; then
-        log "ERROR: Failed to fetch release info from GitHub"
+    if ! curl -fsSL -o "$MANIFEST_FILE" "$(asset_url "$MANIFEST_URL")" --connect-timeout 10 --max-time 30 >> "$LOG_FILE" 2>&1; then
+        log "ERROR: Failed to fetch manifest from GitHub"
         return 1
     fi
     
-    # Извлекаем tag_name (версию)
-    local tag=$(echo "$response" | grep '"tag_name"' | head -1 | sed 's/.*"tag_name": "\([^"]*\)".*/\1/')
+    if [ "$(head -n 1 "$MANIFEST_FILE")" != "geosite-manifest 1" ]; then
+        log "ERROR: Unknown manifest format"
+        return 1
+    fi
     
-    # Извлекаем download URL для geosite.dat
-    local url=$(echo "$response" | grep '"browser_download_url".*geosite.dat"' | head -1 | sed 's/.*"browser_download_url": "\([^"]*\)".*/\1/')
+    verify_signature "$MANIFEST_FILE" || return 1
     
-    # Извлекаем размер файла
-    local size=$(echo "$response" | grep '"size"' | head -1 | sed 's/.*"size": \([0-9]*\).*/\1/')
+    # Строки: "version <tag>", "asset <name> <size> <sha256> <url>"
+    local tag=$(awk '$1 == "version" { print $2; exit }' "$MANIFEST_FILE")
+    local asset=$(awk '$1 == "asset" && $2 == "geosite.dat" { print $3, $4, $5; exit }' "$MANIFEST_FILE")
     
-    if [ -z "$tag" ] || [ -z "$url" ]; then
-        log "ERROR: Failed to parse release info"
+    if [ -z "$tag" ] || [ -z "$asset" ]; then
+        log "ERROR: Failed to parse manifest"
         return 1
     fi
     
-    # Сохраняем в переменные окружения для последующего использования
+    set -- $asset
     export LATEST_TAG="$tag"
-    export DOWNLOAD_URL="$url"
-    export FILE_SIZE="$size"
+    export FILE_SIZE="$1"
+    export FILE_SHA256="$2"
+    export DOWNLOAD_URL=$(asset_url "$3")
     
     log "Latest release: $tag"
-    log "Download URL: $url"
-    log "File size: $size bytes"
+    log "Download URL: $DOWNLOAD_URL"
+    log "File size: $FILE_SIZE bytes, sha256: $FILE_SHA256"
+    
+    return 0
+}
+
+verify_download() {
+    local file="$1"
+    
+    local size=$(wc -c < "$file" 2>/dev/null)
+    if [ "$size" != "$FILE_SIZE" ]; then
+        log "ERROR: Size mismatch: got $size, manifest says $FILE_SIZE"
+        return 1
+    fi
+    
+    local sha=$(sha256sum "$file" | cut -d' ' -f1)
+    if [ "$sha" != "$FILE_SHA256" ]; then
+        log "ERROR: sha256 mismatch: got $sha"
+        return 1
+    fi
+    
+    log "✓ Size and sha256 match manifest"
+    return 0
+}
+
+download_delta() {
+    local temp_file="$1"
+    local delta_file="/tmp/geosite.dat.delta"
+    
+    [ -f "$GEOSITE_FILE" ] || return 1
+    command -v python3 >/dev/null 2>&1 || return 1
+    [ -f "$DELTA_TOOL" ] || return 1
+    
+    # Дельта в манифесте привязана к sha256 исходного файла: берём ту, что подходит к нашему
+    # (строка "delta <name> <source sha256> <size> <sha256> <url>")
+    local current_sha=$(sha256sum "$GEOSITE_FILE" | cut -d' ' -f1)
+    local delta_url=$(awk -v sha="$current_sha" \
+        '$1 == "delta" && $2 == "geosite.dat" && $3 == sha { print $6; exit }' "$MANIFEST_FILE")
+    
+    if [ -z "$delta_url" ]; then
+        log "No delta for current file, using full download"
+        return 1
+    fi
+    delta_url=$(asset_url "$delta_url")
+    
+    log "Trying delta update: $delta_url"
+    if ! curl -fsSL -o "$delta_file" "$delta_url" --connect-timeout 30 --max-time 60 >> "$LOG_FILE" 2>&1; then
+        log "WARNING: Delta download failed, falling back to full download"
+        rm -f "$delta_file"
+        return 1
+    fi
+    
+    # Патч проверяет sha256 исходного и результирующего файла
+    if ! python3 "$DELTA_TOOL" apply "$GEOSITE_FILE" "$delta_file" "$temp_file" >> "$LOG_FILE" 2>&1; then
+        log "WARNING: Delta apply failed, falling back to full download"
+        rm -f "$delta_file" "$temp_file"
+        return 1
+    fi
     
+    log "✓ Delta applied ($(wc -c < "$delta_file") bytes downloaded)"
+    rm -f "$delta_file"
     return 0
 }
 
 download_geosite() {
     local temp_file="/tmp/geosite.dat.new"
     
+    if download_delta "$temp_file" && verify_download "$temp_file"; then
+        export TEMP_GEOSITE="$temp_file"
+        return 0
+    fi
+    rm -f "$temp_file"
+    
     log "Downloading geosite.dat..."
     log "URL: $DOWNLOAD_URL"
     
     # Скачиваем файл (используем curl с follow redirects)
-    curl -L -o "$temp_file" "$DOWNLOAD_URL" --connect-timeout 30 --max-time 120 2>&1 | tee -a "$LOG_FILE"
-    
-    if [ $? -ne 0 ]; then
+    if ! curl -fsSL -o "$temp_file" "$DOWNLOAD_URL" --connect-timeout 30 --max-time 120 >> "$LOG_FILE" 2>&1; then
         log "ERROR: Download failed"
         rm -f "$temp_file"
         return 1
@@ -155,16 +265,13 @@ download_geosite() {
         return 1
     fi
     
-    # Получаем размер файла (совместимо с BusyBox)
-    local downloaded_size=$(wc -c < "$temp_file" 2>/dev/null)
-    
-    if [ -z "$downloaded_size" ] || [ "$downloaded_size" -lt 10000 ]; then
-        log "ERROR: Downloaded file is too small ($downloaded_size bytes)"
+    # Сверяем размер и sha256 с манифестом до установки
+    if ! verify_download "$temp_file"; then
         rm -f "$temp_file"
         return 1
     fi
     
-    log "✓ Downloaded successfully ($downloaded_size bytes)"
+    log "✓ Downloaded successfully ($FILE_SIZE bytes)"
     
     # Сохраняем путь к временному файлу
     export TEMP_GEOSITE="$temp_file"
@@ -271,10 +378,11 @@ main() {
         exit 1
     fi
     
-    # 4. Сравниваем версии
-    if [ "$CURRENT_VERSION" = "$LATEST_TAG" ]; then
-        log "Already up to date: $CURRENT_VERSION"
+    # 4. Сравниваем по sha256: новый тег с тем же содержимым не требует скачивания и рестарта
+    if [ -f "$GEOSITE_FILE" ] && [ "$(sha256sum "$GEOSITE_FILE" | cut -d' ' -f1)" = "$FILE_SHA256" ]; then
+        log "Already up to date: $CURRENT_VERSION (sha256 matches $LATEST_TAG)"
         log "No update needed"
+        [ "$CURRENT_VERSION" = "$LATEST_TAG" ] || echo "$LATEST_TAG" > "$VERSION_FILE"
         exit 0
     fi
     
@@ -3,16 +3,25 @@
 # Router Monitoring Script for OpenWrt
 # Collects metrics and sends to Railway for monitoring
 #
-# Usage: Run via cron every 5 minutes
-# */5 * * * * /root/monitor_router.sh >> /tmp/monitor.log 2>&1
+# Usage: Run via cron every minute
+# * * * * * /root/monitor_router.sh >> /tmp/monitor.log 2>&1
+#
+# Samples are buffered locally (NDJSON) and flushed in one request every
+# FLUSH_EVERY samples. If Railway is unreachable the buffer is kept and
+# backfilled on the next successful flush (server dedupes by timestamp).
+#
+# Alert thresholds are evaluated by the bot on the sample stream (hysteresis,
+# sustained duration, anomalies); the router only reports raw metrics.
 #
 
 # Configuration
 RAILWAY_URL="https://openwrtrouter-production.up.railway.app"
 WEBHOOK_SECRET="9fde3ba2adf1c3d063291a508c9873edc879312363bf709424a7bbc63333573c"
-RAM_THRESHOLD=85
-CPU_THRESHOLD=3.0
 LOG_PREFIX="[Monitor]"
+BUFFER_FILE="/tmp/monitor_buffer.ndjson"
+SENDING_FILE="/tmp/monitor_buffer.sending"
+FLUSH_EVERY=5          # samples per batch (5 min at 1-minute sampling)
+MAX_BUFFER=1440        # keep at most 24h of samples during outages
 
 # Keep only last 10 log entries
 LOG_FILE="/tmp/monitor.log"
@@ -78,87 +87,52 @@ fi
 
 echo "${LOG_PREFIX} OpenClash: ${OPENCLASH_STATUS} (${OPENCLASH_MEMORY}m)"
 
-# Check for critical conditions
-ALERT=false
-ALERT_TYPE=""
-ALERT_VALUE=0
-
-if [ "$RAM_PERCENT" -gt "$RAM_THRESHOLD" ]; then
-    ALERT=true
-    ALERT_TYPE="ram"
-    ALERT_VALUE=$RAM_PERCENT
-    echo "${LOG_PREFIX} ALERT: RAM ${RAM_PERCENT}% > ${RAM_THRESHOLD}%"
+# OpenClash down is reported right away instead of waiting for a full batch
+URGENT=false
+if [ "$OPENCLASH_STATUS" = "stopped" ]; then
+    URGENT=true
 fi
 
-# Convert CPU load to integer for comparison (multiply by 100)
-CPU_LOAD1_INT=$(echo "$CPU_LOAD1" | awk '{printf "%d", $1*100}')
-CPU_THRESHOLD_INT=$(echo "$CPU_THRESHOLD" | awk '{printf "%d", $1*100}')
+TIMESTAMP=$(date -u '+%Y-%m-%dT%H:%M:%SZ')
 
-if [ "$CPU_LOAD1_INT" -gt "$CPU_THRESHOLD_INT" ]; then
-    ALERT=true
-    ALERT_TYPE="cpu"
-    ALERT_VALUE=$CPU_LOAD1
-    echo "${LOG_PREFIX} ALERT: CPU Load ${CPU_LOAD1} > ${CPU_THRESHOLD}"
-fi
+# Buffer the sample (one JSON object per line)
+echo "{\"timestamp\": \"${TIMESTAMP}\", \"ram\": {\"total\": ${RAM_TOTAL}, \"used\": ${RAM_USED}, \"free\": ${RAM_FREE}, \"percent\": ${RAM_PERCENT}}, \"cpu\": {\"load1\": ${CPU_LOAD1}, \"load5\": ${CPU_LOAD5}, \"load15\": ${CPU_LOAD15}}, \"clients\": ${WIFI_CLIENTS}, \"openclash\": {\"status\": \"${OPENCLASH_STATUS}\", \"memory\": ${OPENCLASH_MEMORY}}}" >> "$BUFFER_FILE"
 
-if [ "$OPENCLASH_STATUS" = "stopped" ]; then
-    ALERT=true
-    ALERT_TYPE="openclash"
-    ALERT_VALUE=0
-    echo "${LOG_PREFIX} ALERT: OpenClash is down"
+# Samples left over from a failed flush go first
+if [ -f "$SENDING_FILE" ]; then
+    cat "$BUFFER_FILE" >> "$SENDING_FILE" && rm -f "$BUFFER_FILE"
+else
+    mv "$BUFFER_FILE" "$SENDING_FILE"
 fi
 
-# Prepare JSON payload
-TIMESTAMP=$(date -u '+%Y-%m-%dT%H:%M:%SZ')
+PENDING=$(wc -l < "$SENDING_FILE")
+if [ "$PENDING" -gt "$MAX_BUFFER" ]; then
+    tail -n "$MAX_BUFFER" "$SENDING_FILE" > "${SENDING_FILE}.tmp" && mv "${SENDING_FILE}.tmp" "$SENDING_FILE"
+    PENDING=$MAX_BUFFER
+fi
 
-if [ "$ALERT" = "true" ]; then
-    # Send alert webhook
-    PAYLOAD=$(cat <<EOF
-{
-  "type": "${ALERT_TYPE}",
-  "value": ${ALERT_VALUE},
-  "threshold": ${RAM_THRESHOLD},
-  "timestamp": "${TIMESTAMP}",
-  "metrics": {
-    "ram": {"total": ${RAM_TOTAL}, "used": ${RAM_USED}, "percent": ${RAM_PERCENT}},
-    "cpu": {"load1": ${CPU_LOAD1}, "load5": ${CPU_LOAD5}, "load15": ${CPU_LOAD15}},
-    "clients": ${WIFI_CLIENTS},
-    "openclash": {"status": "${OPENCLASH_STATUS}", "memory": ${OPENCLASH_MEMORY}}
-  },
-  "alert": true
-}
-EOF
-)
-    ENDPOINT="/webhook/alert"
-    echo "${LOG_PREFIX} Sending ALERT webhook..."
-else
-    # Send normal monitoring data
-    PAYLOAD=$(cat <<EOF
-{
-  "timestamp": "${TIMESTAMP}",
-  "ram": {"total": ${RAM_TOTAL}, "used": ${RAM_USED}, "free": ${RAM_FREE}, "percent": ${RAM_PERCENT}},
-  "cpu": {"load1": ${CPU_LOAD1}, "load5": ${CPU_LOAD5}, "load15": ${CPU_LOAD15}},
-  "clients": ${WIFI_CLIENTS},
-  "openclash": {"status": "${OPENCLASH_STATUS}", "memory": ${OPENCLASH_MEMORY}},
-  "alert": false
-}
-EOF
-)
-    ENDPOINT="/webhook/monitoring"
+if [ "$PENDING" -lt "$FLUSH_EVERY" ] && [ "$URGENT" != "true" ]; then
+    # Not enough samples yet: keep them for the next run
+    mv "$SENDING_FILE" "$BUFFER_FILE"
+    echo "${LOG_PREFIX} Buffered ${PENDING}/${FLUSH_EVERY} samples"
+    echo "${LOG_PREFIX} Monitoring completed"
+    exit 0
 fi
 
-# Send webhook to Railway
+# Flush all buffered samples in one request
 HTTP_CODE=$(curl -s -w "%{http_code}" -o /tmp/monitor_response.txt \
     -X POST \
     -H "Authorization: Bearer ${WEBHOOK_SECRET}" \
-    -H "Content-Type: application/json" \
-    -d "${PAYLOAD}" \
-    "${RAILWAY_URL}${ENDPOINT}")
+    -H "Content-Type: application/x-ndjson" \
+    --data-binary "@${SENDING_FILE}" \
+    "${RAILWAY_URL}/webhook/monitoring/batch")
 
 if [ "$HTTP_CODE" = "200" ]; then
-    echo "${LOG_PREFIX} Data sent successfully (HTTP ${HTTP_CODE})"
+    rm -f "$SENDING_FILE"
+    echo "${LOG_PREFIX} ${PENDING} samples sent successfully (HTTP ${HTTP_CODE})"
 else
-    echo "${LOG_PREFIX} ERROR: Failed to send data (HTTP ${HTTP_CODE})"
+    # Keep samples for backfill on the next run
+    echo "${LOG_PREFIX} ERROR: Failed to send ${PENDING} samples (HTTP ${HTTP_CODE}), kept for retry"
     cat /tmp/monitor_response.txt
 fi
 
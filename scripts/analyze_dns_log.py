@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Match router DNS query logs against geosite categories.
+
+Streams dnsmasq (log-queries) and mihomo logs line by line (plain or .gz),
+classifies every queried domain against the categories parsed by
+build_srs.parse_data_file and reports how often each rule entry was hit.
+Entries nobody resolves are dead weight in the router's memory.
+
+Recognized lines:
+    dnsmasq[123]: query[A] www.youtube.com from 192.168.1.10
+    ... msg="[TCP] 192.168.1.10:51000 --> www.youtube.com:443 match ..."
+    ... msg="[DNS] www.youtube.com --> [142.250.1.1]"
+
+Usage:
+    # report
+    python3 analyze_dns_log.py --data-dir domain-list-community/data \\
+        --log dnsmasq.log --log mihomo.log.gz youtube "category-ai-!cn:ai"
+    # trimmed rule-sets: observed entries + safety margin
+    python3 analyze_dns_log.py ... --trim-dir build/trimmed --formats singbox,clash
+
+Safety margin in trim mode, on top of entries with >= --min-hits hits:
+  - entries under the same registrable name (last two labels) as a hit entry,
+    so sibling CDN / API hosts of a used service stay
+  - all keyword entries (cheap, and they catch hosts the log didn't show)
+  - entries listed in --keep files
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import build_srs  # noqa: E402
+
+QUERY_PATTERNS = [
+    re.compile(r'dnsmasq\[\d+\]: query\[\w+\] (\S+) from '),
+    re.compile(r'--> ([A-Za-z0-9.-]+\.[A-Za-z]{2,}):\d+'),
+    re.compile(r'\[DNS\] (\S+?)\.? -->'),
+]
+CACHE_LIMIT = 200000
+
+
+def iter_queries(paths):
+    """Queried domain names from log files, lower-cased, trailing dot removed"""
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', errors='replace') as f:
+            for line in f:
+                for pattern in QUERY_PATTERNS:
+                    match = pattern.search(line)
+                    if match:
+                        yield match.group(1).rstrip('.').lower()
+                        break
+
+
+class Classifier:
+    """Domain -> matching (category, kind, entry) list, via suffix / exact maps and keywords"""
+
+    def __init__(self):
+        self.suffixes = {}
+        self.domains = {}
+        self.keywords = []
+        self._cache = {}
+
+    def add(self, category, rules):
+        for suffix in rules.suffixes:
+            self.suffixes.setdefault(suffix.lower(), []).append((category, 'suffix', suffix))
+        for domain in rules.domains:
+            self.domains.setdefault(domain.lower(), []).append((category, 'domain', domain))
+        self.keywords.extend((keyword.lower(), (category, 'keyword', keyword)) for keyword in rules.keywords)
+
+    def classify(self, name):
+        matches = self._cache.get(name)
+        if matches is not None:
+            return matches
+        matches = list(self.domains.get(name, ()))
+        labels = name.split('.')
+        for i in range(len(labels)):
+            matches.extend(self.suffixes.get('.'.join(labels[i:]), ()))
+        matches.extend(entry for keyword, entry in self.keywords if keyword in name)
+        if len(self._cache) >= CACHE_LIMIT:
+            self._cache.clear()
+        self._cache[name] = matches
+        return matches
+
+
+def registrable(name):
+    return '.'.join(name.split('.')[-2:])
+
+
+def trim(rules, hits, min_hits, keep):
+    """Observed entries + safety margin (see module docstring)"""
+    used = {entry for (kind, entry), count in hits.items() if count >= min_hits}
+    used_bases = {registrable(entry) for entry in used}
+
+    def wanted(entry):
+        return entry in used or entry in keep or registrable(entry) in used_bases
+
+    return build_srs.RuleSet([s for s in rules.suffixes if wanted(s)],
+                             [d for d in rules.domains if wanted(d)],
+                             list(rules.keywords))
+
+
+def read_keep(paths):
+    keep = set()
+    for path in paths or ():
+        with open(path) as f:
+            keep.update(line.split('#', 1)[0].strip() for line in f)
+    keep.discard('')
+    return keep
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DNS log hit report and trimmed rule-sets')
+    parser.add_argument('--data-dir', required=True, help='Path to domain-list-community/data directory')
+    parser.add_argument('--log', action='append', required=True,
+                        help='dnsmasq / mihomo log file (.gz ok), repeatable')
+    parser.add_argument('categories', nargs='+', help='Categories (format: name[:output_name])')
+    parser.add_argument('--top', type=int, default=15, help='Top entries per category in the report')
+    parser.add_argument('--json', metavar='PATH', help='Write full hit report as JSON')
+    parser.add_argument('--trim-dir', help='Write trimmed rule-sets here (observed + safety margin)')
+    parser.add_argument('--min-hits', type=int, default=1, help='Trim: hits needed to keep an entry')
+    parser.add_argument('--keep', action='append', help='Trim: file of entries always kept, repeatable')
+    build_srs.add_format_arguments(parser)
+    args = parser.parse_args()
+
+    classifier = Classifier()
+    rulesets = {}
+    for spec in args.categories:
+        category, _, output_name = spec.partition(':')
+        rules = build_srs.make_ruleset(*build_srs.parse_data_file(args.data_dir, category))
+        rulesets[output_name or category] = rules
+        classifier.add(output_name or category, rules)
+
+    hits = {name: Counter() for name in rulesets}
+    queries = matched = 0
+    for name in iter_queries(args.log):
+        queries += 1
+        matches = classifier.classify(name)
+        if matches:
+            matched += 1
+        for category, kind, entry in matches:
+            hits[category][(kind, entry)] += 1
+
+    print(f'Queries: {queries}, matched a category: {matched} '
+          f'({matched / max(1, queries):.1%}), distinct names cached: {len(classifier._cache)}\n')
+    report = {'queries': queries, 'matched': matched, 'categories': {}}
+    for name, rules in rulesets.items():
+        total = len(rules.suffixes) + len(rules.domains) + len(rules.keywords)
+        used = len(hits[name])
+        print(f'{name}: {used}/{total} entries hit ({used / max(1, total):.1%}), '
+              f'{sum(hits[name].values())} queries')
+        for (kind, entry), count in hits[name].most_common(args.top):
+            print(f'    {count:>8}  {kind:<7} {entry}')
+        report['categories'][name] = {
+            'entries': total,
+            'entries_hit': used,
+            'hits': {f'{kind}:{entry}': count for (kind, entry), count in hits[name].most_common()},
+        }
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+
+    if args.trim_dir:
+        os.makedirs(args.trim_dir, exist_ok=True)
+        keep = read_keep(args.keep)
+        print(f'\nTrimmed rule-sets -> {args.trim_dir} (min hits {args.min_hits}, {len(keep)} kept entries)')
+        for name, rules in rulesets.items():
+            trimmed = trim(rules, hits[name], args.min_hits, keep)
+            build_srs.write_formats(args.trim_dir, name, trimmed, args.formats, args)
+            before = len(rules.suffixes) + len(rules.domains)
+            after = len(trimmed.suffixes) + len(trimmed.domains)
+            print(f'  {name}: {before} -> {after} domain/suffix entries, '
+                  f'{len(trimmed.keywords)} keywords kept')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Build IP-CIDR rule-sets from local CIDR lists.
+
+Reads custom-data/ip/NAME.txt (one CIDR per line, # comments), normalizes
+host bits, then merges overlapping / adjacent prefixes per address family
+as integer ranges and re-splits every range into the fewest aligned
+prefixes. Output per category:
+
+  geoip-NAME.json   sing-box rule-set source (version 2, ip_cidr) for `sing-box rule-set compile`
+  geoip-NAME.list   Clash/Mihomo rule-provider (behavior: ipcidr, format: text)
+
+Usage:
+    python3 build_ipcidr.py --input-dir custom-data/ip --output-dir build/srs telegram whatsapp
+
+Category format: name[:output_name], as in build_srs.py.
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import sys
+
+
+def read_cidrs(path):
+    """CIDR lines of a file -> (ipv4 [(start, end)], ipv6 [(start, end)], invalid lines)"""
+    ranges = {4: [], 6: []}
+    invalid = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                network = ipaddress.ip_network(line, strict=False)
+            except ValueError:
+                invalid.append(line)
+                continue
+            start = int(network.network_address)
+            ranges[network.version].append((start, start + network.num_addresses - 1))
+    return ranges[4], ranges[6], invalid
+
+
+def merge_ranges(ranges):
+    """Sort and merge overlapping or adjacent [start, end] integer ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def range_to_prefixes(start, end, bits):
+    """Fewest aligned prefixes covering [start, end]: (network int, prefix length)"""
+    prefixes = []
+    while start <= end:
+        # Largest block aligned at start (lowest set bit) that doesn't overrun end
+        size = start & -start if start else 1 << bits
+        while size > end - start + 1:
+            size >>= 1
+        prefixes.append((start, bits - size.bit_length() + 1))
+        start += size
+    return prefixes
+
+
+def aggregate(ranges, version):
+    bits = 32 if version == 4 else 128
+    address = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+    return [f'{address(network)}/{length}'
+            for start, end in merge_ranges(ranges)
+            for network, length in range_to_prefixes(start, end, bits)]
+
+
+def write_singbox(output_dir, name, cidrs):
+    path = os.path.join(output_dir, f'geoip-{name}.json')
+    ruleset = {'version': 2, 'rules': [{'ip_cidr': cidrs}] if cidrs else []}
+    with open(path, 'w') as f:
+        json.dump(ruleset, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    return path
+
+
+def write_clash(output_dir, name, cidrs):
+    path = os.path.join(output_dir, f'geoip-{name}.list')
+    with open(path, 'w') as f:
+        for cidr in cidrs:
+            f.write(cidr + '\n')
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build sing-box / Clash IP-CIDR rule-sets from CIDR lists'
+    )
+    parser.add_argument('--input-dir', required=True,
+                        help='Directory with NAME.txt CIDR lists (e.g. custom-data/ip)')
+    parser.add_argument('--output-dir', required=True,
+                        help='Output directory for rule-set files')
+    parser.add_argument('categories', nargs='+',
+                        help='Categories to process (format: name[:output_name])')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    failed = False
+
+    for spec in args.categories:
+        category, _, output_name = spec.partition(':')
+        output_name = output_name or category
+        path = os.path.join(args.input_dir, f'{category}.txt')
+        if not os.path.exists(path):
+            print(f'  ERROR: {path} not found', file=sys.stderr)
+            failed = True
+            continue
+
+        ipv4, ipv6, invalid = read_cidrs(path)
+        for line in invalid:
+            print(f'  WARNING: {category}: invalid CIDR {line!r}, skipped', file=sys.stderr)
+        cidrs4, cidrs6 = aggregate(ipv4, 4), aggregate(ipv6, 6)
+        write_singbox(args.output_dir, output_name, cidrs4 + cidrs6)
+        write_clash(args.output_dir, output_name, cidrs4 + cidrs6)
+
+        print(f'  {category} -> geoip-{output_name}: {len(ipv4) + len(ipv6)} input prefixes '
+              f'-> {len(cidrs4) + len(cidrs6)} ({len(cidrs4)} IPv4, {len(cidrs6)} IPv6)')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
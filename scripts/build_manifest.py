@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Build a signed release manifest for router-side updates.
+
+Line-oriented so the router can parse it with awk (no JSON parser):
+
+    geosite-manifest 1
+    version v1.0.5-commit-abc123
+    asset geosite.dat 91234 <sha256> <url>
+    asset geosite-youtube.srs 2345 <sha256> <url>
+    delta geosite.dat <source sha256> 248 <sha256> <url>
+    sig <hex HMAC-SHA256 of all bytes above this line>
+
+The signature is HMAC-SHA256 with a key shared with the router
+(MANIFEST_KEY secret). Verify on the router with
+`sed '$d' manifest.txt | openssl dgst -sha256 -hmac "$KEY"`.
+
+Usage:
+    python3 build_manifest.py --version v1.0.5-commit-abc123 \
+        --base-url https://github.com/OWNER/REPO/releases/download/latest \
+        --output build/manifest.txt build/geosite.dat build/srs/*.srs build/delta/*.delta
+"""
+
+import argparse
+import hashlib
+import hmac
+import os
+import sys
+
+MANIFEST_HEADER = 'geosite-manifest 1'
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def delta_source(path):
+    """Asset name and source sha256 of a delta (from its header, see delta_patch.py)"""
+    from delta_patch import read_header
+
+    with open(path, 'rb') as f:
+        source_hash = read_header(f.read(256))[0]
+    name = os.path.basename(path).split('.from-', 1)[0]
+    return name, source_hash.hex()
+
+
+def build_manifest(version, base_url, files):
+    base_url = base_url.rstrip('/')
+    lines = [MANIFEST_HEADER, f'version {version}']
+    deltas = []
+    for path in sorted(files):
+        name = os.path.basename(path)
+        if ' ' in name:
+            raise ValueError(f'asset name with space: {name}')
+        size = os.path.getsize(path)
+        entry = f'{size} {sha256_file(path)} {base_url}/{name}'
+        if name.endswith('.delta'):
+            asset, source = delta_source(path)
+            deltas.append(f'delta {asset} {source} {entry}')
+        else:
+            lines.append(f'asset {name} {entry}')
+    return '\n'.join(lines + deltas) + '\n'
+
+
+def sign(body, key):
+    return hmac.new(key.encode(), body.encode(), hashlib.sha256).hexdigest()
+
+
+def parse_manifest(text, key=None):
+    """Manifest text -> {'version', 'assets': {name: (size, sha256, url)}, 'deltas': [...]}.
+
+    With `key` the signature line is required and checked (ValueError on mismatch).
+    Deltas are (name, source sha256, size, sha256, url) tuples.
+    """
+    lines = text.splitlines(keepends=True)
+    if not lines or lines[0].strip() != MANIFEST_HEADER:
+        raise ValueError('not a geosite manifest')
+    if lines[-1].startswith('sig '):
+        signature = lines.pop()[4:].strip()
+        if key and not hmac.compare_digest(signature, sign(''.join(lines), key)):
+            raise ValueError('manifest signature mismatch')
+    elif key:
+        raise ValueError('manifest is not signed')
+
+    manifest = {'version': None, 'assets': {}, 'deltas': []}
+    for line in lines[1:]:
+        fields = line.split()
+        if fields[:1] == ['version'] and len(fields) == 2:
+            manifest['version'] = fields[1]
+        elif fields[:1] == ['asset'] and len(fields) == 5:
+            manifest['assets'][fields[1]] = (int(fields[2]), fields[3], fields[4])
+        elif fields[:1] == ['delta'] and len(fields) == 6:
+            manifest['deltas'].append((fields[1], fields[2], int(fields[3]), fields[4], fields[5]))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build signed release manifest')
+    parser.add_argument('--version', required=True, help='Release version / tag')
+    parser.add_argument('--base-url', required=True, help='Download URL prefix for assets')
+    parser.add_argument('--output', required=True, help='Manifest file to write')
+    parser.add_argument('--key-env', default='MANIFEST_KEY',
+                        help='Environment variable with HMAC key (default: MANIFEST_KEY)')
+    parser.add_argument('files', nargs='+', help='Release assets (*.delta are listed as deltas)')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    body = build_manifest(args.version, args.base_url, args.files)
+
+    key = os.environ.get(args.key_env, '')
+    if key:
+        body += f'sig {sign(body, key)}\n'
+    else:
+        print(f'WARNING: {args.key_env} not set, manifest is unsigned', file=sys.stderr)
+
+    with open(args.output, 'w') as f:
+        f.write(body)
+    print(body, end='')
+    print(f'\nManifest: {args.output} ({len(body)} bytes)')
+
+
+if __name__ == '__main__':
+    main()
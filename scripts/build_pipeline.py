@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Geosite build driver with per-stage timing.
+
+Runs the whole nightly build as named stages and measures each one:
+wall time, CPU time (this process + child processes like git / go / sing-box)
+and peak RSS (per stage). Results go to stdout, optionally to JSON and a markdown table,
+and are compared against a baseline to flag regressions.
+
+Stages:
+    clone        git clone --depth 1 domain-list-community (skipped with --data-dir),
+                 or a blobless clone checked out at --dlc-commit
+    cn_stub      replace data/cn with custom-data/cn
+    resolve      include: closure of the categories -> data-filtered/
+    build_dat    go run ./ --datapath=data-filtered -> geosite.dat
+    singbox      download sing-box (skipped if already on PATH)
+    build_srs    rule-set files in every --formats format, one parse per category (build_srs.py)
+    build_ip     IP-CIDR rule-sets from custom-data/ip (build_ipcidr.py)
+    compile_srs  sing-box rule-set compile, timed per file
+
+Usage:
+    python3 build_pipeline.py --work-dir work --output-dir build \
+        --categories "cn instagram youtube category-ai-!cn" \
+        --srs "youtube instagram category-ai-!cn:ai" \
+        --json build/timings.json --baseline prev/timings.json
+    python3 build_pipeline.py ... --profile build/profile   # cProfile dump per Python stage
+
+Exit codes: 0 ok, 1 stage failed, 5 regression vs baseline (with --fail-on-regression).
+"""
+
+import argparse
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import resource
+import shutil
+import subprocess
+import sys
+import tarfile
+import time
+import urllib.request
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import build_ipcidr  # noqa: E402
+import build_srs  # noqa: E402
+
+DLC_REPO = 'https://github.com/v2fly/domain-list-community.git'
+SINGBOX_URL = ('https://github.com/SagerNet/sing-box/releases/download/'
+               'v{version}/sing-box-{version}-linux-amd64.tar.gz')
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StageError(Exception):
+    """A build stage failed"""
+
+
+# ru_maxrss is KB on Linux, bytes on macOS
+RSS_SCALE = 1024 * 1024 if sys.platform == 'darwin' else 1024
+
+
+def _cpu_seconds():
+    """CPU seconds of this process + reaped children"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _reset_own_peak():
+    """Reset this process's peak RSS (Linux clear_refs); False if only the lifetime peak is available"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _own_peak_mb():
+    """Peak RSS of this process since the last reset (VmHWM), else since start"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / RSS_SCALE
+
+
+class Pipeline:
+    """Records stages as {name, status, wall_s, cpu_s, rss_peak_mb, items}.
+
+    rss_peak_mb is the stage's own peak: the largest of this process (peak reset
+    at stage start) and every command the stage ran (wait4 rusage of that child).
+    Where the peak can't be reset the record gets rss_scope: cumulative.
+    """
+
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir
+        self.stages = []
+        self.began = time.perf_counter()
+        self._child_peak_mb = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        record = {'name': name, 'status': 'ok', 'items': {}}
+        self.stages.append(record)
+        print(f'\n=== {name} ===', flush=True)
+        profiler = cProfile.Profile() if self.profile_dir else None
+        self._child_peak_mb = 0.0
+        scoped = _reset_own_peak()
+        cpu_before = _cpu_seconds()
+        began = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        except Exception as e:
+            record['status'] = 'failed'
+            record['error'] = str(e)
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            record['wall_s'] = round(time.perf_counter() - began, 3)
+            record['cpu_s'] = round(_cpu_seconds() - cpu_before, 3)
+            record['rss_peak_mb'] = round(max(_own_peak_mb(), self._child_peak_mb), 1)
+            if not scoped:
+                record['rss_scope'] = 'cumulative'
+            if not record['items']:
+                del record['items']
+            if profiler and record['status'] != 'skipped':
+                self._dump_profile(name, profiler)
+            print(f'--- {name}: {record["status"]}, {record["wall_s"]:.2f}s wall, '
+                  f'{record["cpu_s"]:.2f}s cpu, {record["rss_peak_mb"]:.0f} MB peak'
+                  f'{" (cumulative)" if not scoped else ""}', flush=True)
+
+    def _dump_profile(self, name, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f'{name}.prof')
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(10)
+        print(f'  profile: {path}')
+        print('\n'.join('  ' + line for line in out.getvalue().strip().splitlines()[-14:]))
+
+    def run(self, cmd, cwd=None):
+        print(f'  $ {" ".join(cmd)}', flush=True)
+        process = subprocess.Popen(cmd, cwd=cwd)
+        try:
+            # wait4 instead of wait: the child's own rusage, so its peak RSS counts for this stage only
+            _, status, usage = os.wait4(process.pid, 0)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        process.returncode = os.waitstatus_to_exitcode(status)
+        self._child_peak_mb = max(self._child_peak_mb, usage.ru_maxrss / RSS_SCALE)
+        if process.returncode != 0:
+            raise StageError(f'{cmd[0]} exited with {process.returncode}')
+
+    def result(self):
+        return {
+            'stages': self.stages,
+            'total_wall_s': round(time.perf_counter() - self.began, 3),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'generated': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+
+
+def resolve_includes(data_dir, categories):
+    """Data files needed for `categories`, following include: recursively"""
+    needed = set()
+    pending = list(categories)
+    while pending:
+        category = pending.pop()
+        name = category
+        if not os.path.exists(os.path.join(data_dir, name)) and '-!' in name:
+            name = name.rsplit('-!', 1)[0]
+        if name in needed:
+            continue
+        path = os.path.join(data_dir, name)
+        if not os.path.exists(path):
+            print(f'  WARNING: {name} not found')
+            continue
+        needed.add(name)
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('include:'):
+                    pending.append(line[8:].split()[0])
+    return sorted(needed)
+
+
+def stage_clone(pipeline, dlc_dir, existing, commit=None):
+    with pipeline.stage('clone') as record:
+        if existing or os.path.isdir(os.path.join(dlc_dir, '.git')):
+            record['status'] = 'skipped'
+            return
+        if not commit:
+            pipeline.run(['git', 'clone', '--depth', '1', DLC_REPO, dlc_dir])
+            return
+        # A (possibly abbreviated) older commit: history without blobs, then check it out
+        pipeline.run(['git', 'clone', '--filter=blob:none', '--no-checkout', DLC_REPO, dlc_dir])
+        pipeline.run(['git', 'checkout', '--quiet', commit], cwd=dlc_dir)
+
+
+def stage_cn_stub(pipeline, data_dir):
+    with pipeline.stage('cn_stub'):
+        # Mihomo rejects geosite.dat without "cn"; the stub keeps it to one domain
+        shutil.copy(os.path.join(REPO_ROOT, 'custom-data', 'cn'), os.path.join(data_dir, 'cn'))
+
+
+def stage_resolve(pipeline, data_dir, filtered_dir, categories):
+    with pipeline.stage('resolve') as record:
+        needed = resolve_includes(data_dir, categories)
+        shutil.rmtree(filtered_dir, ignore_errors=True)
+        os.makedirs(filtered_dir)
+        for name in needed:
+            shutil.copy(os.path.join(data_dir, name), filtered_dir)
+        record['items'] = {'files': len(needed)}
+        print(f'  {len(needed)} data files: {" ".join(needed)}')
+
+
+def stage_build_dat(pipeline, dlc_dir, filtered_dir, output_dir):
+    with pipeline.stage('build_dat') as record:
+        if shutil.which('go') is None:
+            record['status'] = 'skipped'
+            print('  go not found, geosite.dat not built')
+            return
+        pipeline.run(['go', 'run', './', f'--datapath={os.path.abspath(filtered_dir)}',
+                      f'--outputdir={os.path.abspath(output_dir)}'], cwd=dlc_dir)
+        dlc = os.path.join(output_dir, 'dlc.dat')
+        dat = os.path.join(output_dir, 'geosite.dat')
+        if os.path.exists(dlc):
+            os.replace(dlc, dat)
+        if not os.path.exists(dat) or os.path.getsize(dat) < 10000:
+            raise StageError('geosite.dat missing or too small')
+        record['items'] = {'bytes': os.path.getsize(dat)}
+
+
+def stage_singbox(pipeline, version, work_dir):
+    with pipeline.stage('singbox') as record:
+        binary = shutil.which('sing-box')
+        if binary:
+            record['status'] = 'skipped'
+            return binary
+        archive = os.path.join(work_dir, 'sing-box.tar.gz')
+        urllib.request.urlretrieve(SINGBOX_URL.format(version=version), archive)
+        with tarfile.open(archive) as tar:
+            member = next(m for m in tar.getmembers() if m.name.endswith('/sing-box'))
+            member.name = 'sing-box'
+            tar.extract(member, work_dir)
+        return os.path.join(work_dir, 'sing-box')
+
+
+def stage_build_srs(pipeline, data_dir, srs_dir, specs, options):
+    with pipeline.stage('build_srs') as record:
+        os.makedirs(srs_dir, exist_ok=True)
+        for spec in specs:
+            category, _, output_name = spec.partition(':')
+            began = time.perf_counter()
+            rules = build_srs.make_ruleset(*build_srs.parse_data_file(data_dir, category))
+            build_srs.write_formats(srs_dir, output_name or category, rules, options.formats, options)
+            record['items'][output_name or category] = round(time.perf_counter() - began, 4)
+
+
+def stage_build_ip(pipeline, ip_dir, srs_dir, specs):
+    with pipeline.stage('build_ip') as record:
+        if not specs:
+            record['status'] = 'skipped'
+            return
+        for spec in specs:
+            category, _, output_name = spec.partition(':')
+            ipv4, ipv6, invalid = build_ipcidr.read_cidrs(os.path.join(ip_dir, f'{category}.txt'))
+            if invalid:
+                raise StageError(f'{category}: invalid CIDR lines: {", ".join(invalid)}')
+            cidrs = build_ipcidr.aggregate(ipv4, 4) + build_ipcidr.aggregate(ipv6, 6)
+            build_ipcidr.write_singbox(srs_dir, output_name or category, cidrs)
+            build_ipcidr.write_clash(srs_dir, output_name or category, cidrs)
+            record['items'][output_name or category] = len(cidrs)
+
+
+def stage_compile_srs(pipeline, singbox, srs_dir):
+    with pipeline.stage('compile_srs') as record:
+        if singbox is None:
+            record['status'] = 'skipped'
+            return
+        for name in sorted(os.listdir(srs_dir)):
+            if not name.endswith('.json'):
+                continue
+            began = time.perf_counter()
+            source = os.path.join(srs_dir, name)
+            pipeline.run([singbox, 'rule-set', 'compile', source, '-o', source[:-5] + '.srs'])
+            record['items'][name[:-5]] = round(time.perf_counter() - began, 3)
+
+
+def compare(result, baseline, tolerance, min_delta):
+    """Stages slower than baseline by more than `tolerance` (fraction) and `min_delta` seconds"""
+    previous = {stage['name']: stage for stage in baseline.get('stages', [])}
+    regressions = []
+    for stage in result['stages']:
+        old = previous.get(stage['name'])
+        if old is None or stage['status'] != 'ok' or old.get('status') != 'ok':
+            continue
+        delta = stage['wall_s'] - old['wall_s']
+        if delta > min_delta and stage['wall_s'] > old['wall_s'] * (1 + tolerance):
+            regressions.append((stage['name'], old['wall_s'], stage['wall_s']))
+    return regressions
+
+
+def markdown(result, regressions):
+    slow = {name for name, _, _ in regressions}
+    lines = ['| Stage | Status | Wall s | CPU s | Peak RSS MB |', '|---|---|---:|---:|---:|']
+    for stage in result['stages']:
+        flag = ' ⚠️' if stage['name'] in slow else ''
+        lines.append(f"| {stage['name']}{flag} | {stage['status']} | {stage['wall_s']:.2f} | "
+                     f"{stage['cpu_s']:.2f} | {stage['rss_peak_mb']:.0f} |")
+    lines.append(f"| **total** | | {result['total_wall_s']:.2f} | | |")
+    for name, old, new in regressions:
+        lines.append(f'\n⚠️ `{name}`: {old:.2f}s → {new:.2f}s')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Timed geosite build pipeline')
+    parser.add_argument('--work-dir', default='work', help='Scratch directory (clone, sing-box)')
+    parser.add_argument('--output-dir', default='build', help='geosite.dat and srs/ go here')
+    parser.add_argument('--data-dir', help='Existing domain-list-community checkout (skips clone)')
+    parser.add_argument('--dlc-commit', help='Build this domain-list-community commit instead of master HEAD')
+    parser.add_argument('--categories', required=True, help='geosite.dat categories (space separated)')
+    parser.add_argument('--srs', required=True, help='sing-box rule-sets: name[:output_name] (space separated)')
+    parser.add_argument('--ip', default='', help='IP-CIDR rule-sets: name[:output_name] (space separated)')
+    parser.add_argument('--ip-dir', default=os.path.join(REPO_ROOT, 'custom-data', 'ip'),
+                        help='CIDR lists directory (default: custom-data/ip)')
+    build_srs.add_format_arguments(parser)
+    parser.add_argument('--singbox-version', default=os.environ.get('SINGBOX_VERSION', '1.13.2'))
+    parser.add_argument('--profile', metavar='DIR', help='Write cProfile dump per stage to DIR')
+    parser.add_argument('--json', metavar='PATH', help='Write timings as JSON')
+    parser.add_argument('--markdown', metavar='PATH', help='Append markdown table (e.g. $GITHUB_STEP_SUMMARY)')
+    parser.add_argument('--baseline', metavar='PATH', help='Previous timings JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed slowdown vs baseline, fraction (default: 0.5)')
+    parser.add_argument('--min-delta', type=float, default=2.0,
+                        help='Ignore slowdowns under this many seconds (default: 2.0)')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+    dlc_dir = args.data_dir or os.path.join(args.work_dir, 'domain-list-community')
+    data_dir = os.path.join(dlc_dir, 'data')
+    filtered_dir = os.path.join(dlc_dir, 'data-filtered')
+    srs_dir = os.path.join(args.output_dir, 'srs')
+
+    pipeline = Pipeline(args.profile)
+    exit_code = 0
+    try:
+        stage_clone(pipeline, dlc_dir, existing=args.data_dir is not None, commit=args.dlc_commit)
+        stage_cn_stub(pipeline, data_dir)
+        stage_resolve(pipeline, data_dir, filtered_dir, args.categories.split())
+        stage_build_dat(pipeline, dlc_dir, filtered_dir, args.output_dir)
+        singbox = stage_singbox(pipeline, args.singbox_version, args.work_dir)
+        stage_build_srs(pipeline, filtered_dir, srs_dir, args.srs.split(), args)
+        stage_build_ip(pipeline, args.ip_dir, srs_dir, args.ip.split())
+        stage_compile_srs(pipeline, singbox, srs_dir)
+    except Exception as e:
+        print(f'ERROR: {e}', file=sys.stderr)
+        exit_code = 1
+
+    result = pipeline.result()
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance, args.min_delta)
+        result['regressions'] = [{'stage': name, 'baseline_s': old, 'wall_s': new}
+                                 for name, old, new in regressions]
+    table = markdown(result, regressions)
+    print('\n' + table)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+    if args.markdown:
+        with open(args.markdown, 'a') as f:
+            f.write('\n## ⏱️ Build stages\n\n' + table)
+    if regressions and args.fail_on_regression and exit_code == 0:
+        exit_code = 5
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,22 @@
 #!/usr/bin/env python3
 """
-Build sing-box rule-set source JSON files from domain-list-community data.
+Build rule-set files from domain-list-community data.
 
-Parses domain-list-community text format and generates sing-box rule-set
-JSON source files (version 2) for compilation with `sing-box rule-set compile`.
+Parses domain-list-community text format once per category and fans the
+result out to every requested format in the same pass:
+
+  singbox     geosite-NAME.json          sing-box rule-set source (version 2),
+                                         for `sing-box rule-set compile`
+  clash       geosite-NAME.list          Clash/Mihomo rule-provider, behavior: domain, format: text
+  clash-yaml  geosite-NAME.yaml          same, format: yaml (payload:)
+  dnsmasq     geosite-NAME.nftset.conf   dnsmasq nftset= lines: resolved IPs land in an
+                                         nftables set, routing happens in the kernel
+  adguard     geosite-NAME.adguard.txt   AdGuard Home / AdGuard DNS filter rules
 
 Usage:
     python3 build_srs.py --data-dir domain-list-community/data --output-dir build/srs \
         youtube instagram facebook "category-ai-!cn:ai"
+    python3 build_srs.py --formats singbox,clash,dnsmasq ...
 
 Category format: category_name[:output_name]
   - category_name: name of the data file in domain-list-community
@@ -19,6 +28,10 @@ import argparse
 import json
 import os
 import sys
+from collections import namedtuple
+
+# Deduplicated, sorted entries of one category; shared by all writers
+RuleSet = namedtuple('RuleSet', 'suffixes domains keywords')
 
 
 def parse_data_file(data_dir, category, exclude_attrs=None, visited=None):
@@ -119,16 +132,117 @@ def build_ruleset_json(suffixes, domains, keywords):
     }
 
 
+def make_ruleset(suffixes, domains, keywords):
+    return RuleSet(sorted(set(suffixes)), sorted(set(domains)), sorted(set(keywords)))
+
+
+def _write_lines(path, lines):
+    with open(path, 'w') as f:
+        for line in lines:
+            f.write(line)
+            f.write('\n')
+
+
+def write_singbox(output_dir, name, rules, options):
+    path = os.path.join(output_dir, f'geosite-{name}.json')
+    with open(path, 'w') as f:
+        json.dump(build_ruleset_json(rules.suffixes, rules.domains, rules.keywords),
+                  f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    return path, 0
+
+
+def _clash_entries(rules):
+    # behavior: domain - "+.x" is x and its subdomains, "x" is exact; no keyword support
+    return [f'+.{suffix}' for suffix in rules.suffixes] + rules.domains
+
+
+def write_clash(output_dir, name, rules, options):
+    path = os.path.join(output_dir, f'geosite-{name}.list')
+    _write_lines(path, _clash_entries(rules))
+    return path, len(rules.keywords)
+
+
+def write_clash_yaml(output_dir, name, rules, options):
+    path = os.path.join(output_dir, f'geosite-{name}.yaml')
+    _write_lines(path, ['payload:'] + [f"  - '{entry}'" for entry in _clash_entries(rules)])
+    return path, len(rules.keywords)
+
+
+def write_dnsmasq(output_dir, name, rules, options):
+    """nftset=/a.com/b.com/4#inet#fw4#geosite_NAME4,6#inet#fw4#geosite_NAME6
+
+    dnsmasq matches a domain and all its subdomains, so exact domains already
+    covered by a suffix are dropped; keywords can't be expressed.
+    """
+    set_name = 'geosite_' + ''.join(c if c.isalnum() else '_' for c in name)
+    table = options.nftset_table
+    target = f'4#{table}#{set_name}4,6#{table}#{set_name}6'
+    suffixes = set(rules.suffixes)
+    names = list(rules.suffixes)
+    for domain in rules.domains:
+        labels = domain.split('.')
+        if not any('.'.join(labels[i:]) in suffixes for i in range(len(labels))):
+            names.append(domain)
+    names.sort()
+    step = options.nftset_chunk
+    path = os.path.join(output_dir, f'geosite-{name}.nftset.conf')
+    _write_lines(path, [f"nftset=/{'/'.join(names[i:i + step])}/{target}"
+                        for i in range(0, len(names), step)])
+    return path, len(rules.keywords)
+
+
+def write_adguard(output_dir, name, rules, options):
+    # ||x^ - x and subdomains, |x^ - exact host, plain text - substring match
+    path = os.path.join(output_dir, f'geosite-{name}.adguard.txt')
+    _write_lines(path, [f'||{suffix}^' for suffix in rules.suffixes] +
+                 [f'|{domain}^' for domain in rules.domains] + rules.keywords)
+    return path, 0
+
+
+WRITERS = {
+    'singbox': write_singbox,
+    'clash': write_clash,
+    'clash-yaml': write_clash_yaml,
+    'dnsmasq': write_dnsmasq,
+    'adguard': write_adguard,
+}
+
+
+def write_formats(output_dir, name, rules, formats, options):
+    """Write `rules` in every format; returns [(path, skipped entries)]"""
+    return [WRITERS[fmt](output_dir, name, rules, options) for fmt in formats]
+
+
+def parse_formats(value):
+    formats = [fmt.strip() for fmt in value.split(',') if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in WRITERS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown format(s): {', '.join(unknown)} (available: {', '.join(WRITERS)})")
+    return formats
+
+
+def add_format_arguments(parser):
+    parser.add_argument('--formats', type=parse_formats, default=['singbox'],
+                        help=f"Comma-separated output formats: {', '.join(WRITERS)} (default: singbox)")
+    parser.add_argument('--nftset-table', default='inet#fw4',
+                        help='dnsmasq: nftables family#table for nftset= (default: inet#fw4)')
+    parser.add_argument('--nftset-chunk', type=int, default=100,
+                        help='dnsmasq: domains per nftset= line (default: 100)')
+
+
 def main():
     parser = argparse.ArgumentParser(
-        description='Build sing-box .srs source JSON from domain-list-community data'
+        description='Build sing-box / Clash / dnsmasq / AdGuard rule-sets from domain-list-community data'
     )
     parser.add_argument('--data-dir', required=True,
                         help='Path to domain-list-community/data directory')
     parser.add_argument('--output-dir', required=True,
-                        help='Output directory for JSON source files')
+                        help='Output directory for rule-set files')
     parser.add_argument('categories', nargs='+',
                         help='Categories to process (format: name[:output_name])')
+    add_format_arguments(parser)
     args = parser.parse_args()
 
     os.makedirs(args.output_dir, exist_ok=True)
@@ -141,24 +255,21 @@ def main():
         else:
             category = output_name = spec
 
-        suffixes, domains, keywords = parse_data_file(args.data_dir, category)
-        ruleset = build_ruleset_json(suffixes, domains, keywords)
+        rules = make_ruleset(*parse_data_file(args.data_dir, category))
+        outputs = write_formats(args.output_dir, output_name, rules, args.formats, args)
 
-        n_suffix = len(ruleset['rules'][0].get('domain_suffix', [])) if ruleset['rules'] else 0
-        n_domain = len(ruleset['rules'][0].get('domain', [])) if ruleset['rules'] else 0
-        n_keyword = len(ruleset['rules'][0].get('domain_keyword', [])) if ruleset['rules'] else 0
+        n_suffix, n_domain, n_keyword = len(rules.suffixes), len(rules.domains), len(rules.keywords)
         n_total = n_suffix + n_domain + n_keyword
         total_entries += n_total
 
-        outfile = os.path.join(args.output_dir, f'geosite-{output_name}.json')
-        with open(outfile, 'w') as f:
-            json.dump(ruleset, f, indent=2, ensure_ascii=False)
-            f.write('\n')
-
-        print(f'  {category} -> geosite-{output_name}.json: '
+        print(f'  {category} -> geosite-{output_name}: '
               f'{n_total} entries ({n_suffix} suffix, {n_domain} domain, {n_keyword} keyword)')
+        for path, skipped in outputs:
+            note = f' ({skipped} keyword entries not expressible, skipped)' if skipped else ''
+            print(f'      {os.path.basename(path)}{note}')
 
-    print(f'\nDone: {len(args.categories)} rule-sets, {total_entries} total entries')
+    print(f'\nDone: {len(args.categories)} categories x {len(args.formats)} formats, '
+          f'{total_entries} total entries')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Derive build categories from the Clash / OpenClash config.
+
+The config is the single source of truth for what the routers use:
+every GEOSITE,<category> rule (including inside AND/OR/NOT logic rules)
+and every rule-provider URL pointing at our geosite-*/geoip-* release
+assets. The build gets exactly those categories - smallest geosite.dat and
+.srs set, and no hand-kept list to drift.
+
+Text-based on purpose (no YAML parser needed): it also works on the
+generator script in update-vpn-subscriptions.yml, which holds the rules
+verbatim.
+
+Usage:
+    python3 config_categories.py openclash-config.yaml
+        categories: cn category-ai-!cn facebook ...
+        srs:        category-ai-!cn:ai facebook ...
+        ip:         telegram whatsapp
+    python3 config_categories.py config.yaml --github-output "$GITHUB_OUTPUT"
+    python3 config_categories.py config.yaml --check "youtube,instagram,..."   # exit 1 on drift
+"""
+
+import argparse
+import re
+import sys
+
+GEOSITE_RE = re.compile(r'\bGEOSITE,\s*([^,)\s\'"]+)', re.IGNORECASE)
+PROVIDER_URL_RE = re.compile(r'/(geosite|geoip)-([A-Za-z0-9_.!-]+?)\.(?:srs|mrs|list|yaml|json)\b')
+
+# Mihomo rejects geosite.dat without "cn" (see custom-data/cn): always built
+REQUIRED = ('cn',)
+# Release file name -> geosite category, for categories whose file name differs
+FILE_NAMES = {'category-ai-!cn': 'ai'}
+# Categories that only exist as a geosite.dat stub, not as rule-sets
+DAT_ONLY = {'cn'}
+
+
+def extract(text):
+    """Config text -> (geosite categories, geoip names), sorted"""
+    categories = set(REQUIRED)
+    ip = set()
+    by_file_name = {name: category for category, name in FILE_NAMES.items()}
+    for line in text.splitlines():
+        if line.lstrip().startswith('#'):
+            continue
+        categories.update(match.lower() for match in GEOSITE_RE.findall(line))
+        for kind, name in PROVIDER_URL_RE.findall(line):
+            if kind == 'geoip':
+                ip.add(name)
+            else:
+                categories.add(by_file_name.get(name, name))
+    return sorted(categories), sorted(ip)
+
+
+def srs_specs(categories):
+    """build_srs.py specs (name[:output_name]) for rule-set formats"""
+    specs = []
+    for category in categories:
+        if category in DAT_ONLY:
+            continue
+        name = FILE_NAMES.get(category)
+        specs.append(f'{category}:{name}' if name else category)
+    return specs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract GEOSITE categories from a Clash config')
+    parser.add_argument('config', nargs='+', help='Config file(s); categories are merged')
+    parser.add_argument('--github-output', metavar='PATH',
+                        help='Append categories= / srs= / ip= lines (GitHub Actions step outputs)')
+    parser.add_argument('--check', metavar='LIST',
+                        help='Comma/space separated category list to compare against; exit 1 if different')
+    args = parser.parse_args()
+
+    categories, ip = set(), set()
+    for path in args.config:
+        with open(path, encoding='utf-8') as f:
+            found, found_ip = extract(f.read())
+        categories.update(found)
+        ip.update(found_ip)
+    categories, ip = sorted(categories), sorted(ip)
+    specs = srs_specs(categories)
+
+    print(f"categories: {' '.join(categories)}")
+    print(f"srs:        {' '.join(specs)}")
+    print(f"ip:         {' '.join(ip)}")
+
+    if args.github_output:
+        with open(args.github_output, 'a') as f:
+            f.write(f"categories={' '.join(categories)}\n")
+            f.write(f"srs={' '.join(specs)}\n")
+            f.write(f"ip={' '.join(ip)}\n")
+
+    if args.check is not None:
+        listed = {item for item in re.split(r'[,\s]+', args.check) if item}
+        missing = sorted(set(categories) - listed)
+        unused = sorted(listed - set(categories))
+        if missing or unused:
+            if missing:
+                print(f'Used by config but not listed: {" ".join(missing)}', file=sys.stderr)
+            if unused:
+                print(f'Listed but not used by config: {" ".join(unused)}', file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
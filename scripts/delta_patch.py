@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Binary delta between two releases of geosite.dat / geosite-*.srs.
+
+Delta = copy ranges of the old file + inserted new bytes, found by rsync-style
+block matching (rolling Adler hash over the target, index of source blocks),
+op stream compressed with xz. Both files are pinned by SHA-256 in the header:
+apply refuses a wrong source and verifies the result before writing it.
+
+Usage:
+    python3 delta_patch.py make OLD NEW DELTA [--max-ratio 0.7]
+    python3 delta_patch.py apply OLD DELTA OUT
+    python3 delta_patch.py info DELTA
+
+Exit codes (apply): 0 ok, 2 source doesn't match delta, 3 corrupt delta / result mismatch.
+make exits with 4 (and writes nothing) if the delta isn't smaller than
+--max-ratio of the new file - the full download is the better deal then.
+
+Only the standard library is used, so the router needs nothing but python3.
+"""
+
+import argparse
+import hashlib
+import lzma
+import os
+import struct
+import sys
+
+MAGIC = b'GSDELTA1'
+HEADER = struct.Struct('>8s32s32sQQ')  # magic, source sha256, target sha256, source size, target size
+BLOCK = 32
+OP_COPY = 1
+OP_INSERT = 2
+
+
+class DeltaError(Exception):
+    """Delta can't be applied"""
+
+    def __init__(self, message, exit_code=3):
+        super().__init__(message)
+        self.exit_code = exit_code
+
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _adler(window):
+    """Weak rolling checksum of a block: (a, b) as in rsync"""
+    a = b = 0
+    size = len(window)
+    for k, byte in enumerate(window):
+        a += byte
+        b += (size - k) * byte
+    return a & 0xffff, b & 0xffff
+
+
+def _match_length(source, s, target, t):
+    """Length of the common run source[s:] / target[t:] (compares 64-byte slices first)"""
+    length = 0
+    limit = min(len(source) - s, len(target) - t)
+    while length + 64 <= limit and source[s + length:s + length + 64] == target[t + length:t + length + 64]:
+        length += 64
+    while length < limit and source[s + length] == target[t + length]:
+        length += 1
+    return length
+
+
+def diff(source, target, block=BLOCK):
+    """List of ops: (OP_COPY, offset, length) / (OP_INSERT, bytes)"""
+    index = {}
+    for offset in range(0, len(source) - block + 1, block):
+        a, b = _adler(source[offset:offset + block])
+        index.setdefault(a | (b << 16), offset)
+
+    ops = []
+    literal_start = 0
+    i = 0
+    n = len(target)
+    if n >= block:
+        a, b = _adler(target[:block])
+    while i + block <= n:
+        offset = index.get(a | (b << 16))
+        if offset is not None and source[offset:offset + block] == target[i:i + block]:
+            # Grow the match backwards into pending literal bytes, then forwards
+            s, t = offset, i
+            while s > 0 and t > literal_start and source[s - 1] == target[t - 1]:
+                s -= 1
+                t -= 1
+            length = _match_length(source, s, target, t)
+            if t > literal_start:
+                ops.append((OP_INSERT, target[literal_start:t]))
+            ops.append((OP_COPY, s, length))
+            i = literal_start = t + length
+            if i + block <= n:
+                a, b = _adler(target[i:i + block])
+            continue
+        if i + block < n:
+            out_byte, in_byte = target[i], target[i + block]
+            a = (a - out_byte + in_byte) & 0xffff
+            b = (b - block * out_byte + a) & 0xffff
+        i += 1
+    if literal_start < n:
+        ops.append((OP_INSERT, target[literal_start:]))
+    return ops
+
+
+def make_delta(source, target):
+    stream = bytearray()
+    for op in diff(source, target):
+        if op[0] == OP_COPY:
+            stream += bytes([OP_COPY]) + _varint(op[1]) + _varint(op[2])
+        else:
+            stream += bytes([OP_INSERT]) + _varint(len(op[1])) + op[1]
+    header = HEADER.pack(MAGIC, hashlib.sha256(source).digest(), hashlib.sha256(target).digest(),
+                         len(source), len(target))
+    return header + lzma.compress(bytes(stream), preset=9 | lzma.PRESET_EXTREME)
+
+
+def read_header(delta):
+    if len(delta) < HEADER.size:
+        raise DeltaError('delta too short')
+    magic, source_hash, target_hash, source_size, target_size = HEADER.unpack_from(delta)
+    if magic != MAGIC:
+        raise DeltaError('not a delta file')
+    return source_hash, target_hash, source_size, target_size
+
+
+def apply_delta(source, delta):
+    source_hash, target_hash, source_size, target_size = read_header(delta)
+    if len(source) != source_size or hashlib.sha256(source).digest() != source_hash:
+        raise DeltaError('source file does not match delta', exit_code=2)
+    try:
+        stream = lzma.decompress(delta[HEADER.size:])
+    except lzma.LZMAError as e:
+        raise DeltaError(f'corrupt delta: {e}')
+
+    out = bytearray()
+    pos = 0
+    try:
+        while pos < len(stream):
+            op = stream[pos]
+            pos += 1
+            if op == OP_COPY:
+                offset, pos = _read_varint(stream, pos)
+                length, pos = _read_varint(stream, pos)
+                out += source[offset:offset + length]
+            elif op == OP_INSERT:
+                length, pos = _read_varint(stream, pos)
+                out += stream[pos:pos + length]
+                pos += length
+            else:
+                raise DeltaError(f'unknown op {op} at {pos - 1}')
+    except IndexError:
+        raise DeltaError('truncated delta')
+
+    if len(out) != target_size or hashlib.sha256(out).digest() != target_hash:
+        raise DeltaError('result checksum mismatch')
+    return bytes(out)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Binary delta for geosite.dat / .srs releases')
+    sub = parser.add_subparsers(dest='command', required=True)
+    make = sub.add_parser('make', help='Create delta OLD -> NEW')
+    make.add_argument('old')
+    make.add_argument('new')
+    make.add_argument('delta')
+    make.add_argument('--max-ratio', type=float, default=0.7,
+                      help='Skip delta larger than this fraction of NEW (default: 0.7)')
+    apply = sub.add_parser('apply', help='Rebuild NEW from OLD and delta')
+    apply.add_argument('old')
+    apply.add_argument('delta')
+    apply.add_argument('out')
+    info = sub.add_parser('info', help='Show delta header')
+    info.add_argument('delta')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'make':
+            source, target = _read(args.old), _read(args.new)
+            delta = make_delta(source, target)
+            ratio = len(delta) / max(1, len(target))
+            print(f'{os.path.basename(args.new)}: delta {len(delta)} bytes, '
+                  f'full {len(target)} bytes ({ratio:.1%})')
+            if ratio > args.max_ratio:
+                print(f'  skipped: larger than {args.max_ratio:.0%} of full file')
+                return 4
+            _write_atomic(args.delta, delta)
+        elif args.command == 'apply':
+            result = apply_delta(_read(args.old), _read(args.delta))
+            _write_atomic(args.out, result)
+            print(f'Patched {args.out}: {len(result)} bytes, sha256 verified')
+        else:
+            source_hash, target_hash, source_size, target_size = read_header(_read(args.delta))
+            print(f'source: {source_hash.hex()} ({source_size} bytes)')
+            print(f'target: {target_hash.hex()} ({target_size} bytes)')
+    except DeltaError as e:
+        print(f'ERROR: {e}', file=sys.stderr)
+        return e.exit_code
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Optimize the rule list of a generated Clash / Mihomo config.
+
+mihomo walks `rules:` top to bottom for every new connection, so a
+connection that ends up on MATCH pays for every rule above it. This tool:
+
+  - merges DOMAIN / DOMAIN-SUFFIX rules with the same target into one inline
+    rule-provider (behavior: domain, a trie lookup instead of N string checks),
+    when nothing with a different target in between could match them first
+  - moves hot rules (by a traffic sample) earlier, greedily, only past rules
+    with the same target or rules that can't match the same connection -
+    every connection still gets the same policy
+  - reports the estimated average number of rules evaluated per connection
+
+Precedence is kept conservatively: rules whose contents are unknown (RULE-SET
+from http providers, GEOSITE without --data-dir, logic rules, ports, processes)
+are treated as overlapping every rule of the same kind. Domain and IP rules
+are only treated as disjoint in fake-ip mode with `no-resolve` on the IP rule;
+otherwise a redir-host / sniffed connection can carry both.
+
+Traffic sample (--sample, repeatable, .gz ok): dnsmasq query logs, mihomo
+connection logs ("--> host:port"), or plain "host" / "count host" lines.
+IP rules only match sampled IP connections (hosts are not resolved), regexp
+geosite entries are ignored for matching (and make the category count as
+unknown for precedence). Without a sample every original rule is assumed
+to be the first match of an equal share of connections.
+
+Usage:
+    python3 optimize_rules.py openclash-config.yaml
+    python3 optimize_rules.py openclash-config.yaml --sample mihomo.log.gz \\
+        --data-dir domain-list-community/data --output optimized.yaml
+"""
+
+import argparse
+import gzip
+import ipaddress
+import os
+import re
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import build_srs  # noqa: E402
+
+DOMAIN_TYPES = {'DOMAIN', 'DOMAIN-SUFFIX', 'DOMAIN-KEYWORD', 'GEOSITE'}
+IP_TYPES = {'IP-CIDR', 'IP-CIDR6', 'GEOIP', 'IP-ASN'}
+LOGIC_TYPES = {'AND', 'OR', 'NOT', 'SUB-RULE'}
+SAMPLE_PATTERNS = [
+    re.compile(r'query\[\w+\] (\S+) from '),
+    re.compile(r'--> (\[[0-9A-Fa-f:.]+\]|[^\s:]+):\d+'),
+]
+PLAIN_SAMPLE_RE = re.compile(r'^\s*(?:(\d+)\s+)?([A-Za-z0-9.:_-]+)\s*$')
+TOP_LEVEL_RE = re.compile(r'^[A-Za-z][\w-]*:')
+
+
+class Rule:
+    """One rules: entry and what it can match.
+
+    kind: 'domain', 'ip' or 'other'; `known` is False when the entries behind
+    the rule can't be seen (provider, geosite without data, port, process...)
+    """
+
+    def __init__(self, text, rule_type, payload, target, options):
+        self.text = text
+        self.type = rule_type
+        self.payload = payload
+        self.target = target
+        self.no_resolve = 'no-resolve' in options
+        self.kind = 'domain' if rule_type in DOMAIN_TYPES else 'ip' if rule_type in IP_TYPES else 'other'
+        if 'src' in options:
+            self.kind = 'other'
+        self.known = rule_type in ('DOMAIN', 'DOMAIN-SUFFIX', 'DOMAIN-KEYWORD', 'IP-CIDR', 'IP-CIDR6')
+        # complete: every entry is in the sets below (safe to reason about overlap)
+        self.complete = self.known
+        self.suffixes, self.domains, self.keywords, self.networks = set(), set(), [], []
+        self.members = [self]
+        if rule_type == 'DOMAIN-SUFFIX':
+            self.suffixes.add(payload.lower())
+        elif rule_type == 'DOMAIN':
+            self.domains.add(payload.lower())
+        elif rule_type == 'DOMAIN-KEYWORD':
+            self.keywords.append(payload.lower())
+        elif rule_type in ('IP-CIDR', 'IP-CIDR6'):
+            try:
+                self.networks.append(ipaddress.ip_network(payload, strict=False))
+            except ValueError:
+                self.known = self.complete = False
+
+    def load_geosite(self, data_dir):
+        rules = build_srs.make_ruleset(*build_srs.parse_data_file(data_dir, self.payload))
+        self.suffixes = {suffix.lower() for suffix in rules.suffixes}
+        self.domains = {domain.lower() for domain in rules.domains}
+        self.keywords = [keyword.lower() for keyword in rules.keywords]
+        self.known = True
+        # parse_data_file drops regexp: entries; such a category may match more than the sets
+        self.complete = not has_regexp(data_dir, self.payload)
+
+    def matches(self, host, ip):
+        if self.type == 'MATCH':
+            return True
+        if not self.known:
+            return False
+        if self.kind == 'ip':
+            return ip is not None and any(ip in network for network in self.networks)
+        if host is None:
+            return False
+        if host in self.domains:
+            return True
+        labels = host.split('.')
+        if any('.'.join(labels[i:]) in self.suffixes for i in range(len(labels))):
+            return True
+        return any(keyword in host for keyword in self.keywords)
+
+
+def category_path(data_dir, category):
+    """Data file of a category (category-ai-!cn -> category-ai), None if missing"""
+    path = os.path.join(data_dir, category)
+    if not os.path.exists(path) and '-!' in category:
+        path = os.path.join(data_dir, category.rsplit('-!', 1)[0])
+    return path if os.path.exists(path) else None
+
+
+def has_regexp(data_dir, category, visited=None):
+    """Does the category (or anything it includes) have regexp: entries?"""
+    visited = set() if visited is None else visited
+    if category in visited:
+        return False
+    visited.add(category)
+    path = category_path(data_dir, category)
+    if path is None:
+        return False
+    with open(path) as f:
+        entries = [line.split()[0] for line in f if line.strip() and not line.lstrip().startswith('#')]
+    return any(entry.startswith('regexp:') for entry in entries) or any(
+        has_regexp(data_dir, entry[8:], visited) for entry in entries if entry.startswith('include:'))
+
+
+def parse_rule(text):
+    """'- TYPE,payload,target[,options]' (without '- ') -> Rule"""
+    rule_type, _, rest = text.partition(',')
+    rule_type = rule_type.strip().upper()
+    if rule_type == 'MATCH':
+        return Rule(text, rule_type, '', rest.strip(), [])
+    if rule_type in LOGIC_TYPES:
+        # Payload is a parenthesized list with its own commas
+        depth = 0
+        for i, char in enumerate(rest):
+            depth += {'(': 1, ')': -1}.get(char, 0)
+            if depth == 0 and char == ',':
+                payload, fields = rest[:i], rest[i + 1:].split(',')
+                break
+        else:
+            payload, fields = rest, ['']
+    else:
+        payload, _, tail = rest.partition(',')
+        fields = tail.split(',')
+    return Rule(text, rule_type, payload.strip(), fields[0].strip(),
+                [field.strip() for field in fields[1:]])
+
+
+def find_rules(lines):
+    """Index range [start, end) of the rule lines of the top-level rules: block"""
+    start = next((i + 1 for i, line in enumerate(lines) if re.match(r'^rules:\s*$', line)), None)
+    if start is None:
+        raise ValueError('no top-level rules: block')
+    end = start
+    while end < len(lines) and not TOP_LEVEL_RE.match(lines[end]):
+        end += 1
+    return start, end
+
+
+def provider_behaviors(lines):
+    """rule-providers name -> behavior, read from the config text"""
+    behaviors = {}
+    name = None
+    inside = False
+    for line in lines:
+        if TOP_LEVEL_RE.match(line):
+            inside = line.startswith('rule-providers:')
+            continue
+        if not inside:
+            continue
+        match = re.match(r'^  ([^\s#][^:]*):\s*$', line)
+        if match:
+            name = match.group(1).strip('\'"')
+            continue
+        match = re.match(r'^\s+behavior:\s*(\S+)', line)
+        if match and name:
+            behaviors[name] = match.group(1).strip('\'"')
+    return behaviors
+
+
+def overlap(a, b, fake_ip):
+    """Can one connection match both rules?"""
+    if a.type == 'MATCH' or b.type == 'MATCH' or 'other' in (a.kind, b.kind):
+        return True
+    if a.kind != b.kind:
+        ip_rule = a if a.kind == 'ip' else b
+        return not (fake_ip and ip_rule.no_resolve)
+    if not (a.complete and b.complete):
+        return True
+    if a.kind == 'ip':
+        return any(x.version == y.version and x.overlaps(y) for x in a.networks for y in b.networks)
+    if a.keywords and (b.suffixes or b.keywords) or b.keywords and (a.suffixes or a.keywords):
+        return True
+    for x, y in ((a, b), (b, a)):
+        if any(keyword in name for keyword in x.keywords for name in y.domains):
+            return True
+        for name in y.suffixes | y.domains:
+            labels = name.split('.')
+            if name in x.domains or any('.'.join(labels[i:]) in x.suffixes for i in range(len(labels))):
+                return True
+    return False
+
+
+def merge(rules, fake_ip, min_merge):
+    """Fold DOMAIN / DOMAIN-SUFFIX rules into per-target groups where precedence allows"""
+    merged = []
+    groups = {}
+    for rule in rules:
+        group = groups.get(rule.target) if rule.type in ('DOMAIN', 'DOMAIN-SUFFIX') else None
+        if group is not None:
+            position = merged.index(group)
+            if all(other.target == rule.target or not overlap(other, rule, fake_ip)
+                   for other in merged[position + 1:]):
+                group.members.append(rule)
+                group.suffixes |= rule.suffixes
+                group.domains |= rule.domains
+                continue
+        if rule.type in ('DOMAIN', 'DOMAIN-SUFFIX'):
+            group = Rule(rule.text, rule.type, rule.payload, rule.target, [])
+            group.members = [rule]
+            groups[rule.target] = group
+            rule = group
+        merged.append(rule)
+
+    result = []
+    for rule in merged:
+        if len(rule.members) > 1 and len(rule.members) >= min_merge:
+            rule.type = 'RULE-SET'
+            result.append(rule)
+        else:
+            result.extend(rule.members)
+    return result
+
+
+def reorder(rules, hits, fake_ip):
+    """Greedy topological order: most hits first, among rules whose predecessors are placed"""
+    before = [{i for i in range(j) if rules[i].target != rules[j].target and overlap(rules[i], rules[j], fake_ip)}
+              for j in range(len(rules))]
+    # MATCH stays last: a same-target rule moved below it would just be dead
+    for j, rule in enumerate(rules):
+        if rule.type == 'MATCH':
+            before[j] = set(range(j))
+    placed, order = set(), []
+    while len(order) < len(rules):
+        ready = [j for j in range(len(rules)) if j not in placed and before[j] <= placed]
+        best = max(ready, key=lambda j: (hits[j], -j))
+        placed.add(best)
+        order.append(best)
+    return [rules[j] for j in order]
+
+
+def iter_sample(paths):
+    """(host, ip) connections from log / plain host files, with counts"""
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', errors='replace') as f:
+            for line in f:
+                count = 1
+                for pattern in SAMPLE_PATTERNS:
+                    match = pattern.search(line)
+                    if match:
+                        name = match.group(1)
+                        break
+                else:
+                    match = PLAIN_SAMPLE_RE.match(line)
+                    if not match:
+                        continue
+                    count, name = int(match.group(1) or 1), match.group(2)
+                name = name.strip('[]').rstrip('.').lower()
+                try:
+                    yield (None, ipaddress.ip_address(name)), count
+                except ValueError:
+                    yield (name, None), count
+
+
+def first_match(rules, host, ip):
+    for position, rule in enumerate(rules, 1):
+        if rule.matches(host, ip):
+            return position
+    return len(rules)
+
+
+def estimate(rules, sample, original):
+    """Average rules evaluated per connection; (value, first-match counts per rule)"""
+    hits = [0] * len(rules)
+    if sample:
+        total = 0
+        for (host, ip), count in sample.items():
+            position = first_match(rules, host, ip)
+            if rules[position - 1].matches(host, ip):
+                hits[position - 1] += count
+            total += position * count
+        return total / sum(sample.values()), hits
+    # No sample: each original rule is the first match of an equal share
+    position = {id(member): i for i, rule in enumerate(rules) for member in rule.members}
+    for rule in original:
+        hits[position[id(rule)]] += 1
+    return sum((position[id(rule)] + 1) for rule in original) / len(original), hits
+
+
+def provider_name(target, taken):
+    base = re.sub(r'[^a-z0-9]+', '-', target.lower()).strip('-') + '-domains'
+    name, n = base, 2
+    while name in taken:
+        name, n = f'{base}-{n}', n + 1
+    taken.add(name)
+    return name
+
+
+def render(lines, start, end, rules, taken):
+    """Config text with the rules block replaced and inline providers added"""
+    providers = []
+    rule_lines = ['# Optimized by scripts/optimize_rules.py\n']
+    for rule in rules:
+        if rule.type == 'RULE-SET' and len(rule.members) > 1:
+            name = provider_name(rule.target, taken)
+            providers.append(f'  {name}:\n    type: inline\n    behavior: domain\n    payload:\n')
+            providers.extend(f"      - '{'+.' if member.type == 'DOMAIN-SUFFIX' else ''}{member.payload}'\n"
+                             for member in rule.members)
+            rule_lines.append(f'- RULE-SET,{name},{rule.target}\n')
+        else:
+            rule_lines.append(f'- {rule.text}\n')
+    out = lines[:start] + rule_lines + ['\n'] + lines[end:]
+    if providers:
+        index = next((i for i, line in enumerate(out) if line.startswith('rule-providers:')), None)
+        if index is None:
+            index = start - 1
+            providers.insert(0, 'rule-providers:\n')
+            providers.append('\n')
+        else:
+            index += 1
+        out[index:index] = providers
+    return ''.join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge and reorder Clash config rules')
+    parser.add_argument('config', help='Clash / Mihomo config (YAML)')
+    parser.add_argument('--sample', action='append', help='Traffic sample: dnsmasq / mihomo log or host list (.gz ok)')
+    parser.add_argument('--data-dir', help='domain-list-community/data, to see inside GEOSITE rules')
+    parser.add_argument('--min-merge', type=int, default=2,
+                        help='Smallest DOMAIN/DOMAIN-SUFFIX group turned into a rule-provider (default: 2)')
+    parser.add_argument('--no-reorder', action='store_true', help='Only merge, keep rule order')
+    parser.add_argument('--output', help='Write optimized config here (default: print rules only)')
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        lines = f.readlines()
+    start, end = find_rules(lines)
+    text = ''.join(lines)
+    fake_ip = re.search(r'^\s*enhanced-mode:\s*fake-ip\b', text, re.M) is not None
+    behaviors = provider_behaviors(lines)
+
+    original = []
+    for line in lines[start:end]:
+        match = re.match(r'^\s*-\s*(\S.*?)\s*$', line)
+        if match:
+            original.append(parse_rule(match.group(1).strip('\'"')))
+    for rule in original:
+        if rule.type == 'RULE-SET':
+            behavior = behaviors.get(rule.payload)
+            rule.kind = {'domain': 'domain', 'ipcidr': 'ip'}.get(behavior, 'other')
+        elif rule.type == 'GEOSITE' and args.data_dir:
+            if category_path(args.data_dir, rule.payload):
+                rule.load_geosite(args.data_dir)
+            else:
+                print(f'  WARNING: {rule.payload} not in --data-dir, treated as unknown', file=sys.stderr)
+    dead = next((i + 1 for i, rule in enumerate(original) if rule.type == 'MATCH'), len(original))
+    for rule in original[dead:]:
+        print(f'  WARNING: unreachable after MATCH, dropped: {rule.text}', file=sys.stderr)
+    original = original[:dead]
+
+    sample = Counter()
+    for connection, count in iter_sample(args.sample or ()):
+        sample[connection] += count
+
+    before, _ = estimate(original, sample, original)
+    rules = merge(original, fake_ip, args.min_merge)
+    _, hits = estimate(rules, sample, original)
+    if not args.no_reorder:
+        rules = reorder(rules, hits, fake_ip)
+    after, hits = estimate(rules, sample, original)
+
+    merged = sum(len(rule.members) for rule in rules if len(rule.members) > 1)
+    print(f'Rules: {len(original)} -> {len(rules)} '
+          f'({merged} DOMAIN/DOMAIN-SUFFIX rules merged into rule-providers)')
+    basis = f'sample of {sum(sample.values())} connections' if sample else 'no sample, equal share per rule'
+    print(f'Estimated rules evaluated per connection: {before:.2f} -> {after:.2f} ({basis})')
+    print(f'DNS mode: {"fake-ip" if fake_ip else "redir-host / unknown"}\n')
+    for rule, count in zip(rules, hits):
+        label = (f'RULE-SET,<{len(rule.members)} domain rules>,{rule.target}'
+                 if len(rule.members) > 1 else rule.text)
+        print(f'  {count:>8}  {label}')
+
+    first_domain = next((i for i, rule in enumerate(rules) if rule.kind == 'domain'), len(rules))
+    resolving = [rule.text for rule in rules[:first_domain] if rule.kind == 'ip' and not rule.no_resolve]
+    if resolving:
+        print('\nIP rules without no-resolve above all domain rules (a DNS lookup per connection, '
+              'and they pin the domain rules below them):')
+        for text in resolving:
+            print(f'  {text}')
+
+    if args.output:
+        taken = set(behaviors)
+        with open(args.output, 'w') as f:
+            f.write(render(lines, start, end, rules, taken))
+        print(f'\nWritten {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
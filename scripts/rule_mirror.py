@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+LAN mirror for geosite.dat / geosite-*.srs (and other rule-set) release assets.
+
+Keeps a local copy of the `latest` release (driven by its manifest.txt, see
+build_manifest.py) and serves it over HTTP, so a fleet of routers behind one
+uplink hits the LAN instead of GitHub on every update_interval.
+
+Serving:
+  - ETag (sha256) + If-None-Match -> 304, Last-Modified
+  - single Range (bytes=a-b, a-, -n) -> 206 / 416
+  - precompressed variants: .zst (if the optional `zstandard` from requirements.txt
+    is installed) and .gz, picked by Accept-Encoding; built once per sync, never
+    per request
+  - body sent with socket.sendfile() (zero-copy os.sendfile on Linux)
+
+Sync: downloads only assets whose sha256 changed, verifies size and sha256
+against the manifest and stages them (with their variants) under temporary
+names; the files and the served index are then swapped together, manifest.txt
+last. A request opens its file first and checks the inode against the index,
+so headers and body always describe the same file.
+
+Usage:
+    python3 rule_mirror.py --dir /srv/geosite --port 8099 \
+        --upstream https://github.com/susaninz/openwrtrouter/releases/download/latest \
+        --interval 3600
+    # serve a local build, no sync: rule-sets are in build/srs, geosite.dat and
+    # manifest.txt one level up; copy them in to get the flat release layout
+    cp build/geosite.dat build/manifest.txt build/srs/
+    python3 rule_mirror.py --dir build/srs --port 8099
+
+Routers: set MIRROR_URL="http://<host>:8099" in router/download_geosite.sh;
+sing-box rule_set url: http://<host>:8099/geosite-youtube.srs
+"""
+
+import argparse
+import email.utils
+import gzip
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+import urllib.request
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from build_manifest import parse_manifest, sha256_file  # noqa: E402
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ASSET_RE = re.compile(r'^(geosite\.dat|geo(?:site|ip)-[A-Za-z0-9_.!-]+\.(?:srs|list|yaml|conf|txt)|manifest\.txt|'
+                      r'[A-Za-z0-9_.!-]+\.from-[0-9a-f]{12}\.delta)$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CONTENT_TYPES = {'.txt': 'text/plain; charset=utf-8'}
+MIN_COMPRESS_SIZE = 1024
+
+
+class Entry:
+    """One servable file: identity path plus precompressed variants"""
+
+    def __init__(self, path):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.inode = stat.st_ino
+        self.mtime = stat.st_mtime
+        self.sha256 = sha256_file(path)
+        self.etag = f'"{self.sha256[:32]}"'
+        self.last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+        # encoding -> (path, size, inode), only kept if it actually saves bytes
+        self.variants = {}
+        for encoding, suffix in (('zstd', '.zst'), ('gzip', '.gz')):
+            variant = path + suffix
+            if os.path.exists(variant):
+                variant_stat = os.stat(variant)
+                if variant_stat.st_mtime >= stat.st_mtime:
+                    self.variants[encoding] = (variant, variant_stat.st_size, variant_stat.st_ino)
+
+
+def precompress(path):
+    """Write .gz (and .zst) next to `path` unless it's tiny or doesn't shrink"""
+    size = os.path.getsize(path)
+    for suffix in ('.gz', '.zst'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    if size < MIN_COMPRESS_SIZE:
+        return
+    with open(path, 'rb') as f:
+        data = f.read()
+    outputs = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if zstandard is not None:
+        outputs['.zst'] = zstandard.ZstdCompressor(level=19).compress(data)
+    for suffix, compressed in outputs.items():
+        if len(compressed) < size * 0.95:
+            _write_atomic(path + suffix, compressed)
+
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class Mirror:
+    """Directory index (name -> Entry), rebuilt after each sync"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def rescan(self):
+        entries = {}
+        for name in os.listdir(self.directory):
+            if ASSET_RE.match(name):
+                entries[name] = Entry(os.path.join(self.directory, name))
+        with self._lock:
+            self._entries = entries
+        return entries
+
+    def get(self, name):
+        with self._lock:
+            return self._entries.get(name)
+
+    def sync(self, upstream, key=None, timeout=60):
+        """Fetch upstream manifest and changed assets; True if anything changed
+
+        Everything is downloaded and verified into `<name>.new` (+ .gz / .zst)
+        first; only then are files and index swapped, under the index lock.
+        """
+        upstream = upstream.rstrip('/')
+        with urllib.request.urlopen(f'{upstream}/manifest.txt', timeout=timeout) as response:
+            manifest_text = response.read().decode()
+        manifest = parse_manifest(manifest_text, key)
+
+        current = self.get('manifest.txt')
+        if current is not None:
+            with open(current.path) as f:
+                if f.read() == manifest_text:
+                    return False
+
+        wanted = {name: (size, sha256) for name, (size, sha256, _url) in manifest['assets'].items()}
+        for _name, _source, size, sha256, url in manifest['deltas']:
+            wanted[url.rsplit('/', 1)[-1]] = (size, sha256)
+
+        staged = []
+        try:
+            for name, (size, sha256) in wanted.items():
+                if not ASSET_RE.match(name):
+                    raise ValueError(f'unexpected asset name in manifest: {name}')
+                entry = self.get(name)
+                if entry is not None and entry.sha256 == sha256:
+                    continue
+                with urllib.request.urlopen(f'{upstream}/{name}', timeout=timeout) as response:
+                    data = response.read()
+                if len(data) != size or hashlib.sha256(data).hexdigest() != sha256:
+                    raise ValueError(f'{name}: size/sha256 does not match manifest')
+                stage_path = os.path.join(self.directory, name + '.new')
+                _write_atomic(stage_path, data)
+                precompress(stage_path)
+                staged.append(name)
+                print(f'  updated {name} ({size} bytes)')
+            # Manifest last: routers never see a version whose files aren't here yet
+            _write_atomic(os.path.join(self.directory, 'manifest.txt.new'), manifest_text.encode())
+            staged.append('manifest.txt')
+            self._swap(staged, wanted)
+        finally:
+            for name in staged:
+                for suffix in ('', '.gz', '.zst'):
+                    stage_path = os.path.join(self.directory, name + '.new' + suffix)
+                    if os.path.exists(stage_path):
+                        os.remove(stage_path)
+        print(f'Synced {manifest["version"]}')
+        return True
+
+    def _swap(self, staged, wanted):
+        """Move staged files into place, drop unlisted assets and update the index at once"""
+        with self._lock:
+            entries = dict(self._entries)
+            for name in staged:
+                path = os.path.join(self.directory, name)
+                # Variants first: they must not be older than the identity file
+                for suffix in ('.gz', '.zst'):
+                    if os.path.exists(path + '.new' + suffix):
+                        os.replace(path + '.new' + suffix, path + suffix)
+                    elif os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+                os.replace(path + '.new', path)
+                entries[name] = Entry(path)
+            for name in os.listdir(self.directory):
+                if ASSET_RE.match(name) and name != 'manifest.txt' and name not in wanted:
+                    for suffix in ('', '.gz', '.zst'):
+                        if os.path.exists(os.path.join(self.directory, name + suffix)):
+                            os.remove(os.path.join(self.directory, name + suffix))
+                    entries.pop(name, None)
+            self._entries = entries
+
+    def open(self, name, encoding=None):
+        """(entry, open file, size, encoding) of the current version of an asset, or None.
+
+        The file is opened before anything is sent and must be the inode the
+        index describes: a swap in between is detected and the lookup repeated.
+        The encoding falls back to identity if the new version has no such variant.
+        """
+        for _ in range(3):
+            entry = self.get(name)
+            if entry is None:
+                return None
+            if encoding not in entry.variants:
+                encoding = None
+            if encoding:
+                path, _size, inode = entry.variants[encoding]
+            else:
+                path, inode = entry.path, entry.inode
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            stat = os.fstat(f.fileno())
+            if stat.st_ino == inode:
+                return entry, f, stat.st_size, encoding
+            f.close()
+        return None
+
+
+def parse_range(header, size):
+    """'bytes=a-b' -> (start, end) inclusive; None if absent/unsupported, False if unsatisfiable"""
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def pick_encoding(accept_encoding, entry):
+    accepted = {item.split(';')[0].strip().lower() for item in (accept_encoding or '').split(',')}
+    for encoding in ('zstd', 'gzip'):
+        if encoding in accepted and encoding in entry.variants:
+            return encoding
+    return None
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'geosite-mirror/1'
+    mirror = None
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def serve(self, send_body):
+        name = self.path.split('?', 1)[0].lstrip('/')
+        entry = self.mirror.get(name) if ASSET_RE.match(name) else None
+        if entry is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        # Byte ranges refer to the identity body, so a Range request is never encoded
+        range_header = self.headers.get('Range')
+        encoding = None if range_header else pick_encoding(self.headers.get('Accept-Encoding'), entry)
+        opened = self.mirror.open(name, encoding)
+        if opened is None:
+            self.send_error(HTTPStatus.SERVICE_UNAVAILABLE if self.mirror.get(name) else HTTPStatus.NOT_FOUND)
+            return
+        # Headers come from the entry matching the open file, even if a sync swapped it meanwhile
+        entry, f, size, encoding = opened
+        with f:
+            self._send(entry, f, size, encoding, range_header, send_body)
+
+    def _send(self, entry, f, size, encoding, range_header, send_body):
+        etag = entry.etag[:-1] + f'-{encoding}"' if encoding else entry.etag
+
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in
+                              [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._common_headers(etag, entry)
+            self.end_headers()
+            return
+
+        start, end = 0, size - 1
+        status = HTTPStatus.OK
+        if range_header and self.headers.get('If-Range', entry.etag) == entry.etag:
+            byte_range = parse_range(range_header, size)
+            if byte_range is False:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                status = HTTPStatus.PARTIAL_CONTENT
+
+        self.send_response(status)
+        self._common_headers(etag, entry)
+        self.send_header('Content-Type', entry.content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+
+        if send_body and end >= start:
+            self.connection.sendfile(f, offset=start, count=end - start + 1)
+
+    def _common_headers(self, etag, entry):
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', entry.last_modified)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'no-cache')
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def sync_loop(mirror, upstream, key, interval):
+    while True:
+        try:
+            mirror.sync(upstream, key)
+        except Exception as e:
+            print(f'Sync failed: {e}', file=sys.stderr)
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LAN mirror for geosite release assets')
+    parser.add_argument('--dir', required=True, help='Directory with (or for) mirrored assets')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--upstream', help='Release download URL to sync from (default: serve --dir as is)')
+    parser.add_argument('--interval', type=int, default=3600, help='Sync interval, seconds (default: 3600)')
+    parser.add_argument('--key-env', default='MANIFEST_KEY',
+                        help='Environment variable with manifest HMAC key (default: MANIFEST_KEY)')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    mirror = Mirror(args.dir)
+    if args.upstream is None:
+        for name in os.listdir(args.dir):
+            if ASSET_RE.match(name) and name != 'manifest.txt':
+                precompress(os.path.join(args.dir, name))
+    mirror.rescan()
+
+    if args.upstream:
+        threading.Thread(target=sync_loop, daemon=True,
+                         args=(mirror, args.upstream, os.environ.get(args.key_env) or None,
+                               args.interval)).start()
+
+    MirrorHandler.mirror = mirror
+    server = ThreadingHTTPServer((args.host, args.port), MirrorHandler)
+    server.daemon_threads = True
+    server.verbose = args.verbose
+    print(f'Serving {args.dir} on http://{args.host}:{server.server_port} '
+          f'(zstd: {"yes" if zstandard else "no"})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Scripts are run as files from scripts/ and import each other flat
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
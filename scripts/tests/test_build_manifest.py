@@ -0,0 +1,42 @@
+import pytest
+
+from build_manifest import MANIFEST_HEADER, parse_manifest, sign
+
+KEY = 'router-shared-key'
+BODY = (f'{MANIFEST_HEADER}\n'
+        'version v1.0.5-commit-abc123\n'
+        f'asset geosite.dat 91234 {"a" * 64} https://example.invalid/geosite.dat\n'
+        f'delta geosite.dat {"b" * 64} 248 {"c" * 64} https://example.invalid/geosite.dat.from-bbb.delta\n')
+
+
+def signed(body=BODY, key=KEY):
+    return body + f'sig {sign(body, key)}\n'
+
+
+def test_signed_manifest_parses():
+    manifest = parse_manifest(signed(), KEY)
+    assert manifest['version'] == 'v1.0.5-commit-abc123'
+    assert manifest['assets'] == {'geosite.dat': (91234, 'a' * 64, 'https://example.invalid/geosite.dat')}
+    assert manifest['deltas'][0][:3] == ('geosite.dat', 'b' * 64, 248)
+
+
+def test_wrong_key_is_rejected():
+    with pytest.raises(ValueError, match='signature mismatch'):
+        parse_manifest(signed(), 'other-key')
+
+
+def test_tampered_body_is_rejected():
+    text = signed().replace('91234', '91235')
+    with pytest.raises(ValueError, match='signature mismatch'):
+        parse_manifest(text, KEY)
+
+
+def test_unsigned_manifest_needs_no_key():
+    with pytest.raises(ValueError, match='not signed'):
+        parse_manifest(BODY, KEY)
+    assert parse_manifest(BODY)['version'] == 'v1.0.5-commit-abc123'
+
+
+def test_not_a_manifest():
+    with pytest.raises(ValueError, match='not a geosite manifest'):
+        parse_manifest('<html>rate limited</html>\n')
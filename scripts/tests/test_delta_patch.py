@@ -0,0 +1,68 @@
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from delta_patch import DeltaError, apply_delta, make_delta
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'delta_patch.py')
+
+
+def release_pair():
+    rng = random.Random(7)
+    old = bytes(rng.getrandbits(8) for _ in range(20000))
+    # Edited, moved and inserted ranges, like two nightly geosite.dat builds
+    new = old[:5000] + b'inserted domain list' + old[5000:12000] + old[15000:] + old[:300]
+    return old, new
+
+
+def run(*args):
+    return subprocess.run([sys.executable, SCRIPT, *args], capture_output=True, text=True).returncode
+
+
+def test_round_trip():
+    old, new = release_pair()
+    delta = make_delta(old, new)
+    assert len(delta) < len(new) // 4
+    assert apply_delta(old, delta) == new
+
+
+def test_round_trip_from_empty_source():
+    assert apply_delta(b'', make_delta(b'', b'fresh file')) == b'fresh file'
+
+
+def test_wrong_source_is_refused():
+    old, new = release_pair()
+    with pytest.raises(DeltaError) as error:
+        apply_delta(old[:-1] + b'x', make_delta(old, new))
+    assert error.value.exit_code == 2
+
+
+def test_result_hash_mismatch():
+    old, new = release_pair()
+    delta = bytearray(make_delta(old, new))
+    delta[40] ^= 1  # target sha256 in the header
+    with pytest.raises(DeltaError, match='checksum mismatch') as error:
+        apply_delta(old, bytes(delta))
+    assert error.value.exit_code == 3
+
+
+def test_cli_exit_codes(tmp_path):
+    old, new = release_pair()
+    paths = {name: tmp_path / name for name in ('old', 'new', 'delta', 'out', 'other', 'bad')}
+    paths['old'].write_bytes(old)
+    paths['new'].write_bytes(new)
+    assert run('make', str(paths['old']), str(paths['new']), str(paths['delta'])) == 0
+    assert run('apply', str(paths['old']), str(paths['delta']), str(paths['out'])) == 0
+    assert paths['out'].read_bytes() == new
+
+    paths['other'].write_bytes(old[::-1])
+    assert run('apply', str(paths['other']), str(paths['delta']), str(paths['out'])) == 2
+    delta = paths['delta'].read_bytes()
+    paths['bad'].write_bytes(delta[:-8])  # truncated xz stream
+    assert run('apply', str(paths['old']), str(paths['bad']), str(paths['out'])) == 3
+    # Unrelated files: the delta is no smaller than the target, nothing is written
+    assert run('make', str(paths['other']), str(paths['new']), str(tmp_path / 'skip'), '--max-ratio', '0.1') == 4
+    assert not (tmp_path / 'skip').exists()
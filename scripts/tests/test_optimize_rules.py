@@ -0,0 +1,63 @@
+import ipaddress
+
+import pytest
+
+from optimize_rules import merge, parse_rule, reorder
+
+RULES = [
+    'DOMAIN,ads.example.com,REJECT',
+    'DOMAIN-SUFFIX,example.com,PROXY',
+    'DOMAIN-SUFFIX,youtube.com,PROXY',
+    'DOMAIN-KEYWORD,tube,DIRECT',
+    'DOMAIN-SUFFIX,googlevideo.com,PROXY',
+    'DOMAIN,cdn.example.com,DIRECT',
+    'DOMAIN-SUFFIX,openai.com,PROXY',
+    'IP-CIDR,10.0.0.0/8,DIRECT,no-resolve',
+    'IP-CIDR,1.1.1.1/32,PROXY',
+    'MATCH,DIRECT',
+]
+PROBES = [
+    ('ads.example.com', None), ('example.com', None), ('cdn.example.com', None), ('www.youtube.com', None),
+    ('mytube.net', None), ('r1.googlevideo.com', None), ('chat.openai.com', None), ('other.org', None),
+    (None, ipaddress.ip_address('10.1.2.3')), (None, ipaddress.ip_address('1.1.1.1')),
+    (None, ipaddress.ip_address('8.8.8.8')),
+]
+
+
+def first_target(rules, host, ip):
+    return next(rule.target for rule in rules if rule.matches(host, ip))
+
+
+def optimize(fake_ip, hits, min_merge=2):
+    rules = merge([parse_rule(text) for text in RULES], fake_ip, min_merge)
+    return rules, reorder(rules, [hits(rule) for rule in rules], fake_ip)
+
+
+@pytest.mark.parametrize('fake_ip', [False, True])
+def test_every_connection_keeps_its_policy(fake_ip):
+    original = [parse_rule(text) for text in RULES]
+    # Hot rules are the ones furthest down: the greedy order wants to lift them
+    merged, ordered = optimize(fake_ip, lambda rule: RULES.index(rule.members[-1].text))
+    for host, ip in PROBES:
+        expected = first_target(original, host, ip)
+        assert first_target(merged, host, ip) == expected, (host, ip)
+        assert first_target(ordered, host, ip) == expected, (host, ip)
+
+
+def test_merge_stops_at_conflicting_rule():
+    merged, _ = optimize(False, lambda rule: 0)
+    groups = [[member.text for member in rule.members] for rule in merged]
+    # googlevideo.com can't join the PROXY group above the DIRECT keyword "tube";
+    # openai.com can pass cdn.example.com (no host matches both) and joins it
+    assert groups[1] == ['DOMAIN-SUFFIX,example.com,PROXY', 'DOMAIN-SUFFIX,youtube.com,PROXY']
+    assert groups[3] == ['DOMAIN-SUFFIX,googlevideo.com,PROXY', 'DOMAIN-SUFFIX,openai.com,PROXY']
+    assert merged[1].type == merged[3].type == 'RULE-SET'
+
+
+def test_hot_rule_moves_up_only_past_unrelated_rules():
+    hot = 'DOMAIN-SUFFIX,openai.com,PROXY'
+    _, ordered = optimize(True, lambda rule: 100 if rule.text == hot else 0, min_merge=len(RULES))
+    texts = [rule.text for rule in ordered]
+    # Lifted past cdn.example.com and googlevideo.com, but not past the keyword rule
+    assert texts.index(hot) == texts.index('DOMAIN-KEYWORD,tube,DIRECT') + 1 < RULES.index(hot)
+    assert texts[-1] == 'MATCH,DIRECT'
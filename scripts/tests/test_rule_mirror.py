@@ -0,0 +1,32 @@
+import pytest
+
+from rule_mirror import parse_range
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=10-', (10, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=990-5000', (990, 999)),   # end past the file is clamped
+    ('bytes=-5000', (0, 999)),        # suffix longer than the file is the whole file
+    ('bytes=999-999', (999, 999)),
+    (' bytes=5-6 ', (5, 6)),
+])
+def test_satisfiable(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=1000-1001', 'bytes=50-10', 'bytes=-0'])
+def test_unsatisfiable(header):
+    assert parse_range(header, 1000) is False
+
+
+@pytest.mark.parametrize('header', [None, '', 'bytes=-', 'bytes=0-1,5-6', 'items=0-1', 'bytes=a-b'])
+def test_ignored(header):
+    # Absent, multi-range or malformed: serve the whole file
+    assert parse_range(header, 1000) is None
+
+
+def test_empty_file():
+    assert parse_range('bytes=0-', 0) is False
+    assert parse_range('bytes=-10', 0) is False